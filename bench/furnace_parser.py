@@ -0,0 +1,90 @@
+"""Micro-benchmark for furnace_level_from_text.
+
+Compares the single-pass parser in main.py with the previous three-regex
+version over a corpus shaped like the furnace-upgrades channel, and checks
+that both return the same level for every message.
+
+Usage: python bench/furnace_parser.py [iterations]
+"""
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import furnace_level_from_text  # noqa: E402
+
+
+def legacy_furnace_level_from_text(text):
+    text = text.upper()
+    m = re.search(r"\bF(\d{1,2})\b", text)
+    if m:
+        n = int(m.group(1))
+        if 1 <= n <= 30:
+            return f"F{n}"
+    m = re.search(r"\bFC(\d{1,2})\b", text)
+    if m:
+        n = int(m.group(1))
+        if 1 <= n <= 10:
+            return f"FC{n}"
+    m = re.search(r"FURNACE\s*(\d{1,2})", text)
+    if m:
+        n = int(m.group(1))
+        if 1 <= n <= 30:
+            return f"F{n}"
+    return None
+
+
+TEMPLATES = [
+    "F{n} finally!!",
+    "just hit f{n} 🔥",
+    "FC{fc} done, next is FC{fc2}",
+    "furnace {n} unlocked",
+    "Furnace{n} today, F{big} next month maybe",
+    "upgraded to fc{fc} after 3 days of construction speedups",
+    "who else is close to F30?",
+    "thanks for the help with the refinement",
+    "gg everyone, rally at 20:00",
+    "F{big} would be nice lol",
+    "my furnace is at level {n} and my alliance is BTK",
+    "<@123456789012345678> congrats on FC{fc}!",
+]
+
+
+def build_corpus(size, seed=1):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        template = rng.choice(TEMPLATES)
+        corpus.append(template.format(
+            n=rng.randint(1, 30),
+            fc=rng.randint(1, 10),
+            fc2=rng.randint(1, 10),
+            big=rng.randint(31, 99),
+        ))
+    return corpus
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    corpus = build_corpus(5000)
+
+    mismatches = [t for t in corpus if furnace_level_from_text(t) != legacy_furnace_level_from_text(t)]
+    if mismatches:
+        print(f"MISMATCH on {len(mismatches)} messages, e.g. {mismatches[0]!r}")
+        sys.exit(1)
+
+    def run(fn):
+        for text in corpus:
+            fn(text)
+
+    for name, fn in (("legacy (3 regexes)", legacy_furnace_level_from_text),
+                     ("single pass", furnace_level_from_text)):
+        best = min(timeit.repeat(lambda: run(fn), number=1, repeat=iterations))
+        print(f"{name:20s} {best / len(corpus) * 1e6:6.2f} µs/message ({len(corpus)} messages, best of {iterations})")
+
+
+if __name__ == "__main__":
+    main()
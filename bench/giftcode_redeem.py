@@ -0,0 +1,84 @@
+"""Throughput benchmark for the gift-code redemption engine.
+
+Starts a local stand-in for the redemption API, registers fake player IDs
+and redeems a code for all of them through GiftCodeRedeemer. The stand-in
+answers with a mix of results, occasional 429s and slow responses. Running
+the same code twice shows the journal skipping finished IDs.
+
+Usage: python bench/giftcode_redeem.py [player_count] [concurrency]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web  # noqa: E402
+
+import main  # noqa: E402
+
+PORT = 8766
+
+
+def make_app(latency: float, error_rate: float):
+    app = web.Application()
+    claimed = set()
+
+    async def gift_code(request):
+        form = await request.post()
+        fid = form["fid"]
+        await asyncio.sleep(random.uniform(latency / 2, latency * 1.5))
+        if random.random() < error_rate:
+            return web.json_response({"code": 1, "msg": "Too many requests"}, status=429, headers={"Retry-After": "0.2"})
+        if fid.endswith("13"):
+            return web.json_response({"code": 1, "msg": "role not exist.", "err_code": 40004})
+        if fid in claimed or fid.endswith("7"):
+            return web.json_response({"code": 1, "msg": "RECEIVED.", "err_code": 40008})
+        claimed.add(fid)
+        return web.json_response({"code": 0, "msg": "SUCCESS", "err_code": 20000})
+
+    app.router.add_post("/api/gift_code", gift_code)
+    return app
+
+
+async def run(player_count: int, concurrency: int):
+    runner = web.AppRunner(make_app(latency=0.05, error_rate=0.02))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", PORT).start()
+
+    main.ensure_data_files()
+    await main.state.open()
+    main.player_ids.clear()
+    main.player_ids.update({str(1000 + i): str(40000000 + i) for i in range(player_count)})
+
+    posted = []
+
+    async def fake_log_to(channel_id, message):
+        posted.append(message)
+
+    main.log_to = fake_log_to
+    settings = dict(main.CONFIG["giftcodes"], concurrency=concurrency, rate_per_second=1000, burst=concurrency)
+    redeemer = main.GiftCodeRedeemer(
+        main.state.store, main.HttpGiftCodeEndpoint(f"http://127.0.0.1:{PORT}/api/gift_code"), settings
+    )
+
+    code = f"BENCH{int(time.time())}"
+    first = await redeemer.run(code, 0)
+    print(f"first run:  {first['processed']} IDs in {first['seconds']}s ({first['per_second']}/s) {first['counts']}")
+    second = await redeemer.run(code, 0)
+    print(f"second run: {second['processed']} IDs processed, {second['previously_done']} skipped via journal")
+    print(f"progress posts: {len(posted)}")
+
+    await redeemer.close()
+    await main.state.close()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    players = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    os.chdir(tempfile.mkdtemp(prefix="giftcode-bench-"))
+    asyncio.run(run(players, workers))
@@ -0,0 +1,507 @@
+"""Offline load replay for the event handlers.
+
+Builds a fake guild (roles, channels, members) from CONFIG and replays
+synthetic workloads through the real handlers in main.py, with no Discord
+connection. Every REST call (send, add_roles, edit, kick, member fetches)
+sleeps for a simulated latency and is counted per route. Auto-translation
+goes to a local stand-in for the LibreTranslate API.
+
+Scenarios:
+  messages  N messages/sec for D seconds across the alliance, server and
+            furnace channels, dispatched as concurrent tasks like the gateway
+            does (--rate 0 awaits them back to back for peak throughput)
+  joins     a burst of on_member_join events, then one verification form
+            submit per joined member
+  sweep     inactivity_check over a guild of --sweep-members members, about
+            10% of them past the inactivity threshold (dry run unless --kick)
+
+For each scenario it prints throughput, p50/p99/max handler latency, and
+memory. Use --save to write the results as JSON and --baseline to compare
+against an earlier run.
+
+Usage: python bench/load_replay.py [--rate 200] [--duration 10] [--joins 500]
+           [--sweep-members 50000] [--sweeps 3] [--save out.json] [--baseline old.json]
+"""
+import argparse
+import asyncio
+import collections
+import datetime
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discord  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+import main  # noqa: E402
+
+PORT = 8767
+rest_calls = collections.Counter()
+rest_latency = 0.02
+
+
+async def rest(route: str):
+    rest_calls[route] += 1
+    await asyncio.sleep(random.uniform(rest_latency / 2, rest_latency * 1.5))
+
+
+# ---- fake discord objects ----
+
+class FakeRole:
+    def __init__(self, role_id: int, name: str):
+        self.id = role_id
+        self.name = name
+        self.mention = f"<@&{role_id}>"
+
+    def is_default(self) -> bool:
+        return False
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int, name: str):
+        self.id = channel_id
+        self.name = name
+        self.sent = 0
+
+    async def send(self, content=None, **kwargs):
+        await rest("POST /channels/{channel_id}/messages")
+        self.sent += 1
+
+
+class FakeMember:
+    def __init__(self, member_id: int, guild: "FakeGuild", roles: list, bot: bool = False):
+        self.id = member_id
+        self.guild = guild
+        self.roles = roles
+        self.bot = bot
+        self.name = f"member{member_id}"
+        self.mention = f"<@{member_id}>"
+
+    def __str__(self):
+        return self.name
+
+    async def add_roles(self, *roles, reason=None):
+        await rest("PUT /guilds/{guild_id}/members/{user_id}/roles/{role_id}")
+        self.roles = self.roles + [r for r in roles if r not in self.roles]
+
+    async def remove_roles(self, *roles, reason=None):
+        await rest("DELETE /guilds/{guild_id}/members/{user_id}/roles/{role_id}")
+        self.roles = [r for r in self.roles if r not in roles]
+
+    async def edit(self, *, roles=None, reason=None):
+        await rest("PATCH /guilds/{guild_id}/members/{user_id}")
+        if roles is not None:
+            self.roles = list(roles)
+
+    async def kick(self, reason=None):
+        await rest("DELETE /guilds/{guild_id}/members/{user_id}")
+        self.guild.remove(self.id)
+
+
+class FakeGuild:
+    """Member lookups follow the gateway mode: lean mode starts with an empty
+    member cache and has to fetch over REST, full mode has everyone cached."""
+
+    PAGE_SIZE = 1000
+
+    def __init__(self, guild_id: int, roles: dict, channels: dict):
+        self.id = guild_id
+        self.name = "Bench Guild"
+        self.roles = roles
+        self.channels = channels
+        self.all_members = {}
+        self.cached = {}
+
+    @property
+    def member_count(self) -> int:
+        return len(self.all_members)
+
+    @property
+    def members(self):
+        return list(self.cached.values())
+
+    @property
+    def text_channels(self):
+        # History backfill is not replayed: no channel has readable history.
+        return []
+
+    def add(self, member: FakeMember, cache: bool):
+        self.all_members[member.id] = member
+        if cache:
+            self.cached[member.id] = member
+
+    def remove(self, member_id: int):
+        self.all_members.pop(member_id, None)
+        self.cached.pop(member_id, None)
+
+    def get_role(self, role_id):
+        return self.roles.get(role_id)
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def get_member(self, member_id):
+        return self.cached.get(member_id)
+
+    async def fetch_member(self, member_id):
+        await rest("GET /guilds/{guild_id}/members/{user_id}")
+        member = self.all_members.get(member_id)
+        if member is None:
+            raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown Member")
+        return member
+
+    async def fetch_members(self, limit=None):
+        members = list(self.all_members.values())
+        for start in range(0, len(members), self.PAGE_SIZE):
+            await rest("GET /guilds/{guild_id}/members")
+            for member in members[start:start + self.PAGE_SIZE]:
+                yield member
+
+
+class FakeMessage:
+    def __init__(self, message_id: int, author: FakeMember, channel: FakeChannel, content: str):
+        self.id = message_id
+        self.author = author
+        self.channel = channel
+        self.guild = author.guild
+        self.content = content
+        self._state = main.bot._connection  # read by bot.process_commands
+
+
+class FakeResponse:
+    async def defer(self, **kwargs):
+        await rest("POST /interactions/{interaction_id}/{interaction_token}/callback")
+
+
+class FakeFollowup:
+    async def send(self, content=None, **kwargs):
+        await rest("POST /webhooks/{application_id}/{interaction_token}")
+
+
+class FakeInteraction:
+    def __init__(self, member: FakeMember):
+        self.user = member
+        self.guild = member.guild
+        self.response = FakeResponse()
+        self.followup = FakeFollowup()
+        self.extras = {}
+
+
+def build_guild() -> FakeGuild:
+    config = main.CONFIG
+    roles = {rid: FakeRole(rid, key) for key, rid in config["roles"].items() if rid}
+    for rid, code in config["language_roles"].items():
+        roles[int(rid)] = FakeRole(int(rid), f"lang-{code}")
+    channels = {cid: FakeChannel(cid, key) for key, cid in config["channels"].items() if cid}
+    for alliance, data in config["alliance_channels"].items():
+        for key, cid in data.items():
+            channels[cid] = FakeChannel(cid, f"{alliance}-{key}")
+    return FakeGuild(config.get("guild_id") or 1, roles, channels)
+
+
+def random_member_roles(guild: FakeGuild) -> list:
+    roles = main.CONFIG["roles"]
+    alliance_keys = sorted(set(main.CONFIG["alliance_name_to_role_key"].values()))
+    language_ids = [int(rid) for rid in main.CONFIG["language_roles"]]
+    picked = [guild.get_role(roles[random.choice(alliance_keys)]), guild.get_role(random.choice(language_ids))]
+    return [r for r in picked if r is not None]
+
+
+# ---- translation backend stand-in ----
+
+def make_translate_app(latency: float):
+    app = web.Application()
+
+    async def translate(request):
+        payload = await request.json()
+        await asyncio.sleep(random.uniform(latency / 2, latency * 1.5))
+        q = payload["q"]
+        target = payload["target"]
+        if isinstance(q, list):
+            return web.json_response({"translatedText": [f"[{target}] {text}" for text in q]})
+        return web.json_response({"translatedText": f"[{target}] {q}"})
+
+    app.router.add_post("/translate", translate)
+    return app
+
+
+CHAT_LINES = [
+    "rally on the bear trap in 5 minutes",
+    "who is online for the fortress fight?",
+    "Bonjour tout le monde, on attaque à quelle heure ?",
+    "Wer kann mir bei der Forschung helfen?",
+    "Всем привет, когда следующий ралли?",
+    "大家好，今天的活动几点开始？",
+    "Alguém tem speedups sobrando?",
+    "gg everyone 👍",
+    "ok",
+    "Just hit F25 after two weeks of saving!",
+    "finally FC3 🔥",
+]
+
+
+# ---- measurement ----
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def summarize(name: str, latencies: list, wall: float) -> dict:
+    latencies.sort()
+    current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+    rss = main.current_rss_bytes() or 0
+    return {
+        "scenario": name,
+        "events": len(latencies),
+        "seconds": round(wall, 3),
+        "per_second": round(len(latencies) / wall, 1) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        "rss_mib": round(rss / (1024 * 1024), 1),
+        "traced_peak_mib": round(peak / (1024 * 1024), 1),
+    }
+
+
+async def timed(handler, *args, latencies: list):
+    started = time.perf_counter()
+    try:
+        await handler(*args)
+    except Exception as e:
+        print(f"{handler.__name__} raised {type(e).__name__}: {e}")
+    latencies.append(time.perf_counter() - started)
+
+
+def reset_traced_peak():
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+
+
+# ---- scenarios ----
+
+async def replay_messages(guild: FakeGuild, rate: float, duration: float, authors: int) -> dict:
+    channels = [guild.get_channel(c) for c in main.cfg.translated_channels] + [guild.get_channel(main.cfg.furnace_channel)]
+    channels = [c for c in channels if c is not None]
+    members = []
+    for i in range(authors):
+        member = FakeMember(200_000_000 + i, guild, random_member_roles(guild))
+        guild.add(member, cache=True)  # authors of gateway messages are cached
+        members.append(member)
+
+    latencies = []
+    reset_traced_peak()
+    started = time.perf_counter()
+    if rate <= 0:
+        total = int(duration * 1000)
+        for i in range(total):
+            message = FakeMessage(i, random.choice(members), random.choice(channels), random.choice(CHAT_LINES))
+            await timed(main.on_message, message, latencies=latencies)
+    else:
+        tasks = []
+        total = int(rate * duration)
+        for i in range(total):
+            # dispatch on schedule even if handlers fall behind, like the gateway
+            delay = started + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            message = FakeMessage(i, random.choice(members), random.choice(channels), random.choice(CHAT_LINES))
+            tasks.append(asyncio.create_task(timed(main.on_message, message, latencies=latencies)))
+        await asyncio.gather(*tasks)
+    return summarize("messages", latencies, time.perf_counter() - started)
+
+
+async def replay_joins(guild: FakeGuild, count: int) -> list:
+    members = [FakeMember(300_000_000 + i, guild, []) for i in range(count)]
+    for member in members:
+        guild.add(member, cache=True)
+
+    latencies = []
+    reset_traced_peak()
+    started = time.perf_counter()
+    await asyncio.gather(*(timed(main.on_member_join, m, latencies=latencies) for m in members))
+    joins = summarize("joins", latencies, time.perf_counter() - started)
+
+    alliances = list(main.CONFIG["alliance_channels"])
+    languages = list(main.CONFIG["language_names"])
+    latencies = []
+    reset_traced_peak()
+    started = time.perf_counter()
+
+    async def submit(member: FakeMember):
+        # The modal class itself is not instantiated; only its field values are read.
+        form = SimpleNamespace(
+            server_number=SimpleNamespace(value="123"),
+            player_id=SimpleNamespace(value=str(40_000_000 + member.id % 1_000_000)),
+            alliance=SimpleNamespace(value=random.choice(alliances)),
+            rank=SimpleNamespace(value=random.choice(["R1", "R2", "R3", "R4"])),
+            main_language=SimpleNamespace(value=random.choice(languages).title()),
+            age_group=SimpleNamespace(value=random.choice(["19+", "under 19"])),
+        )
+        await main.VerificationModal.on_submit(form, FakeInteraction(member))
+
+    await asyncio.gather(*(timed(submit, m, latencies=latencies) for m in members))
+    return [joins, summarize("verification", latencies, time.perf_counter() - started)]
+
+
+async def replay_sweeps(guild: FakeGuild, member_count: int, sweeps: int) -> dict:
+    now = time.time()
+    exempt = guild.get_role(main.CONFIG["roles"]["moderator"])
+    for i in range(member_count):
+        uid = 400_000_000 + i
+        roles = random_member_roles(guild)
+        if exempt is not None and random.random() < 0.01:
+            roles.append(exempt)
+        guild.add(FakeMember(uid, guild, roles), cache=not main.LEAN_GATEWAY)
+        if random.random() < 0.9:
+            age_days = random.uniform(0, 29) if random.random() < 0.9 else random.uniform(31, 120)
+            seen = datetime.datetime.utcfromtimestamp(now - age_days * 86400)
+            main.last_seen[str(uid)] = seen.isoformat()
+    # the rest have never been seen and get seeded on the first sweep
+    main.inactivity_index.load(main.last_seen, now)
+
+    latencies = []
+    reset_traced_peak()
+    started = time.perf_counter()
+    for _ in range(sweeps):
+        await timed(main.inactivity_check, latencies=latencies)
+    return summarize("sweep", latencies, time.perf_counter() - started)
+
+
+async def drain(limit: float) -> float:
+    # Background work (translation batches, log queue) is not handler latency;
+    # give it a bounded chance to finish so its counters are meaningful.
+    started = time.perf_counter()
+    for channel_id in list(main.translation_batcher.pending):
+        main.translation_batcher._fire(channel_id)
+    queue = main.translation_queue
+    while time.perf_counter() - started < limit:
+        busy = queue.submitted - queue.processed - queue.dropped
+        if not busy and not main.outbound_log.stats()["channels"]:
+            break
+        await asyncio.sleep(0.1)
+    return time.perf_counter() - started
+
+
+# ---- reporting ----
+
+def print_results(results: list, baseline: dict):
+    header = f"{'scenario':<13}{'events':>8}{'secs':>9}{'per sec':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'rss MiB':>9}"
+    print(header)
+    for r in results:
+        print(f"{r['scenario']:<13}{r['events']:>8}{r['seconds']:>9}{r['per_second']:>10}"
+              f"{r['p50_ms']:>10}{r['p99_ms']:>10}{r['max_ms']:>10}{r['rss_mib']:>9}")
+        old = baseline.get(r["scenario"])
+        if old:
+            deltas = []
+            for key in ("per_second", "p50_ms", "p99_ms", "rss_mib"):
+                if old[key]:
+                    deltas.append(f"{key} {(r[key] - old[key]) / old[key]:+.1%}")
+            print(f"{'':<13}vs baseline: " + ", ".join(deltas))
+
+
+async def run(args):
+    global rest_latency
+    rest_latency = args.rest_latency
+    random.seed(args.seed)
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    runner = web.AppRunner(make_translate_app(args.translate_latency))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", PORT).start()
+
+    # What setup_hook does, minus the gateway and the command sync.
+    main.ensure_data_files()
+    await main.state.open()
+    main.player_ids = main.state.tables["player_ids"]
+    main.last_seen = main.state.tables["last_seen"]
+    main.participation = main.state.tables["participation"]
+    main.activity_stats.attach(main.state.tables["activity"])
+    main.translator.backends = main.BackendChain(dict(main.CONFIG["translation"], backends=[{
+        "name": "stand-in",
+        "type": "libretranslate",
+        "url": f"http://127.0.0.1:{PORT}/translate",
+    }]))
+    await main.translator.start()
+    main.translation_queue.start()
+    main.CONFIG["inactivity"]["dry_run"] = not args.kick
+
+    guild = build_guild()
+    main.bot._connection._guilds[guild.id] = guild
+    main.bot._connection.user = SimpleNamespace(id=1, name="PapaMike", bot=True)
+    main.bot.get_channel = guild.get_channel
+
+    async def ready():
+        return None
+
+    main.bot.wait_until_ready = ready
+
+    results = []
+    if args.duration > 0:
+        results.append(await replay_messages(guild, args.rate, args.duration, args.authors))
+    if args.joins > 0:
+        results += await replay_joins(guild, args.joins)
+    if args.sweep_members > 0 and args.sweeps > 0:
+        results.append(await replay_sweeps(guild, args.sweep_members, args.sweeps))
+
+    # Background work (log queue, translation batches) is not handler latency;
+    # give it a bounded chance to finish so its counters are meaningful.
+    drain_seconds = await drain(args.drain)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = {r["scenario"]: r for r in json.load(f)["results"]}
+    print(f"gateway mode: {'lean' if main.LEAN_GATEWAY else 'full'}, simulated REST latency {rest_latency * 1000:.0f} ms")
+    print_results(results, baseline)
+    print(f"background drain: {drain_seconds:.1f}s (limit {args.drain}s), log queue {main.outbound_log.stats()}")
+    print(f"translator: {main.translator.stats()}")
+    print(f"pipeline: {[(s['stage'], s['calls'], s['avg_us']) for s in main.message_pipeline.stats()]}")
+    print("REST calls: " + ", ".join(f"{route} {n}" for route, n in rest_calls.most_common()))
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results, "rest_calls": dict(rest_calls)}, f, indent=2)
+        print(f"saved results to {args.save}")
+
+    await main.translation_queue.stop()
+    await main.translator.close()
+    await main.state.close()
+    await runner.cleanup()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay synthetic load through the bot's event handlers.")
+    parser.add_argument("--rate", type=float, default=200, help="messages per second (0 = back to back)")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of message traffic (0 to skip)")
+    parser.add_argument("--authors", type=int, default=2000, help="distinct message authors")
+    parser.add_argument("--joins", type=int, default=500, help="members in the join burst (0 to skip)")
+    parser.add_argument("--sweep-members", type=int, default=50000, help="guild size for the sweep (0 to skip)")
+    parser.add_argument("--sweeps", type=int, default=3, help="inactivity sweeps to run")
+    parser.add_argument("--kick", action="store_true", help="really kick during sweeps instead of a dry run")
+    parser.add_argument("--rest-latency", type=float, default=0.02, help="simulated Discord REST latency (s)")
+    parser.add_argument("--translate-latency", type=float, default=0.05, help="stand-in translation latency (s)")
+    parser.add_argument("--drain", type=float, default=10, help="max seconds to wait for background work")
+    parser.add_argument("--tracemalloc", action="store_true", help="also report traced peak memory (slower)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON from an earlier --save to compare against")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    cli_args = parse_args()
+    for path in ("save", "baseline"):
+        if getattr(cli_args, path):
+            setattr(cli_args, path, os.path.abspath(getattr(cli_args, path)))
+    os.chdir(tempfile.mkdtemp(prefix="load-replay-"))
+    asyncio.run(run(cli_args))
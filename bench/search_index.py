@@ -0,0 +1,76 @@
+"""Query-latency benchmark for the /search message index.
+
+Fills the index with synthetic chat (a Zipf-like vocabulary over a few
+channels and a few thousand authors, half of it with English
+translations) and times AND, phrase, channel-filtered and author-filtered
+queries. Prints build time, index size and per-query p50/p99/max.
+
+Usage: python bench/search_index.py [messages] [queries-per-kind]
+"""
+import itertools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+WORDS = [f"w{i}" for i in range(20000)]
+CUM_WEIGHTS = list(itertools.accumulate(1 / (i + 1) for i in range(len(WORDS))))
+CHANNELS = [1000 + i for i in range(12)]
+AUTHORS = [10**17 + i for i in range(3000)]
+
+
+def build(count: int) -> main.MessageSearchIndex:
+    rng = random.Random(3)
+    index = main.MessageSearchIndex(dict(main.CONFIG["search"], max_messages=count))
+    now_ms = (int(time.time() * 1000) - 1420070400000) - count * 100
+    for n in range(count):
+        message_id = (now_ms + n * 100) << 22 | (n & 0xFFF)
+        words = rng.choices(WORDS, cum_weights=CUM_WEIGHTS, k=rng.randint(3, 18))
+        index.add(message_id, rng.choice(CHANNELS), rng.choice(AUTHORS), " ".join(words))
+        if n % 2:
+            index.add_translation(message_id, " ".join(rng.choices(WORDS, cum_weights=CUM_WEIGHTS, k=len(words))))
+    return index
+
+
+def time_queries(label: str, index: main.MessageSearchIndex, queries: list):
+    samples = []
+    hits = 0
+    for query, channels, author in queries:
+        started = time.perf_counter()
+        hits += len(index.search(query, channels, author, limit=10))
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    n = len(samples)
+    print(f"{label:<16} p50 {samples[n // 2] * 1e6:8.1f} us   p99 {samples[min(n - 1, int(n * 0.99))] * 1e6:8.1f} us   "
+          f"max {samples[-1] * 1e6:8.1f} us   avg hits {hits / n:.1f}")
+
+
+def main_(count: int, per_kind: int):
+    started = time.perf_counter()
+    index = build(count)
+    stats = index.stats()
+    print(f"indexed {count} messages in {time.perf_counter() - started:.1f}s: {stats['terms']} terms, "
+          f"{stats['postings']} postings, ~{stats['approx_bytes'] / 2**20:.1f} MiB")
+
+    rng = random.Random(5)
+
+    def words(k):
+        return " ".join(rng.choices(WORDS[:2000], cum_weights=CUM_WEIGHTS[:2000], k=k))
+
+    time_queries("one word", index, [(words(1), None, None) for _ in range(per_kind)])
+    time_queries("two words AND", index, [(words(2), None, None) for _ in range(per_kind)])
+    time_queries("three words AND", index, [(words(3), None, None) for _ in range(per_kind)])
+    time_queries("phrase", index, [(f'"{words(2)}"', None, None) for _ in range(per_kind)])
+    time_queries("channel filter", index,
+                 [(words(1), frozenset(rng.sample(CHANNELS, 2)), None) for _ in range(per_kind)])
+    time_queries("author filter", index, [(words(1), None, rng.choice(AUTHORS)) for _ in range(per_kind)])
+
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 300000
+    per_kind = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    main_(total, per_kind)
@@ -0,0 +1,166 @@
+"""Hit-rate benchmark for the segment-level translation cache.
+
+Replays a chat log through the translator twice against a local
+LibreTranslate stand-in, once caching whole messages and once with
+``segment_cache`` enabled, and prints the cache hit ratio, upstream
+requests and the texts/characters actually sent upstream for each run.
+
+The default log is synthetic: a share of recurring requests built from
+templates with varying slot values, the rest free text that mostly never
+repeats, mixed with mentions, custom emoji, links and whitespace and case
+variations. The gain depends almost entirely on how often sentences
+repeat, so the synthetic log is replayed at several recurring shares;
+pass a file with one message per line to replay a real export instead.
+
+Usage: python bench/segment_cache.py [messages] [log-file]
+"""
+import asyncio
+import itertools
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web  # noqa: E402
+
+import main  # noqa: E402
+
+PORT = 8773
+LANGUAGES = ["fr", "de", "es"]
+
+# Recurring chat: templates with slot fillers, so the same request comes
+# in many concrete forms ("rally at the bear trap in 5 minutes" vs "in 7").
+TEMPLATES = [
+    "Rally at the {place} in {n} minutes.",
+    "Please join the {event} rally!",
+    "Shields up before the {event}.",
+    "Thanks for the help {who}!",
+    "Who is online for {event}?",
+    "Send troops to the {place}.",
+    "Good {time} {who}.",
+    "Gift code is live, redeem it now!",
+    "We need more {troop} in the {place}.",
+    "{event} starts in {n} hours.",
+    "Can someone help me with {building}?",
+    "My {building} is level {n} now.",
+]
+FILLERS = {
+    "place": ["bear trap", "north turret", "sunfire castle", "fortress", "garrison", "south turret", "hive"],
+    "event": ["bear hunt", "foundry", "canyon clash", "crazy joe", "reset", "svs", "castle battle"],
+    "who": ["everyone", "guys", "all", "team", "leaders"],
+    "time": ["morning", "night", "evening"],
+    "troop": ["marksmen", "infantry", "lancers"],
+    "building": ["furnace", "embassy", "barracks", "research", "infirmary"],
+    "n": [str(i) for i in range(1, 31)],
+}
+# Everything else people say: free text over a Zipf-weighted vocabulary, so
+# most of it never repeats.
+VOCABULARY = [f"word{i}" for i in range(5000)]
+CUM_WEIGHTS = list(itertools.accumulate(1 / (i + 1) for i in range(len(VOCABULARY))))
+TOKENS = ["<@123456789012345678>", "<:fire:987654321098765432>", "<#112233445566778899>",
+          "https://example.com/event", "<@&556677889900112233>"]
+
+
+def sentence(rng: random.Random, recurring_share: float) -> str:
+    if rng.random() < recurring_share:
+        template = rng.choice(TEMPLATES)
+        text = template.format(**{k: rng.choice(v) for k, v in FILLERS.items()})
+    else:
+        words = rng.choices(VOCABULARY, cum_weights=CUM_WEIGHTS, k=rng.randint(2, 14))
+        text = " ".join(words).capitalize() + rng.choice([".", "!", "?", ""])
+    roll = rng.random()
+    if roll < 0.1:
+        return text.upper()
+    if roll < 0.25:
+        return text[0].lower() + text[1:]
+    if roll < 0.35:
+        return text.replace(" ", "  ", 1)
+    return text
+
+
+def synthetic_log(count: int, recurring_share: float) -> list:
+    rng = random.Random(7)
+    log = []
+    for _ in range(count):
+        parts = []
+        if rng.random() < 0.3:
+            parts.append(rng.choice(TOKENS))
+        parts += [sentence(rng, recurring_share) for _ in range(rng.choices([1, 2, 3], [6, 3, 1])[0])]
+        if rng.random() < 0.2:
+            parts.append(rng.choice(TOKENS))
+        log.append(rng.choice([" ", " ", "\n"]).join(parts))
+    return log
+
+
+def make_app(counters: dict):
+    app = web.Application()
+
+    async def translate(request):
+        payload = await request.json()
+        q = payload["q"]
+        texts = q if isinstance(q, list) else [q]
+        counters["requests"] += 1
+        counters["texts"] += len(texts)
+        counters["chars"] += sum(len(t) for t in texts)
+        out = [f"[{payload['target']}] {t}" for t in texts]
+        return web.json_response({"translatedText": out if isinstance(q, list) else out[0]})
+
+    app.router.add_post("/translate", translate)
+    return app
+
+
+async def replay(label: str, log: list, segment_cache: bool, counters: dict, db: str):
+    counters.update(requests=0, texts=0, chars=0)
+    settings = dict(
+        main.CONFIG["translation"],
+        segment_cache=segment_cache,
+        backends=[{
+            "name": "local",
+            "type": "libretranslate",
+            "url": f"http://127.0.0.1:{PORT}/translate",
+            "rate_per_second": 1000,
+            "burst": 1000,
+            "max_concurrency": 16,
+            "timeout_seconds": 10.0,
+        }],
+    )
+    store = main.SqliteStore(db)
+    translator = main.Translator(main.TranslationCache(store, 8 << 20, None, 1000, 0), settings)
+    await translator.start()
+    for message in log:
+        await translator.translate(message, LANGUAGES[len(message) % len(LANGUAGES)])
+    cache = translator.cache.stats()
+    print(f"{label:<9} hit ratio {cache['hit_ratio']:6.1%}   upstream requests {counters['requests']:5}   "
+          f"texts {counters['texts']:5}   chars {counters['chars']:7}")
+    await translator.close()
+    await store.run(store.close)
+    return dict(counters, hit_ratio=cache["hit_ratio"])
+
+
+async def run(logs: list):
+    counters: dict = {}
+    runner = web.AppRunner(make_app(counters))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", PORT).start()
+
+    for n, (name, log) in enumerate(logs):
+        print(f"{name}: replaying {len(log)} messages")
+        whole = await replay("message", log, False, counters, f"message-{n}.db")
+        segmented = await replay("segment", log, True, counters, f"segment-{n}.db")
+        print(f"hit ratio gain {(segmented['hit_ratio'] - whole['hit_ratio']) * 100:+.1f} points · "
+              f"upstream chars saved {1 - segmented['chars'] / max(1, whole['chars']):.1%}\n")
+
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], encoding="utf-8") as f:
+            logs = [(sys.argv[2], [line.rstrip("\n") for line in f if line.strip()][:total])]
+    else:
+        logs = [(f"synthetic, {share:.0%} recurring", synthetic_log(total, share)) for share in (0.1, 0.3, 0.5)]
+    os.chdir(tempfile.mkdtemp(prefix="segment-cache-bench-"))
+    asyncio.run(run(logs))
@@ -0,0 +1,149 @@
+"""Tail-latency benchmark for the translation backend chain.
+
+Starts two local LibreTranslate stand-ins: a "public" one that degrades
+during the run (healthy, then slow responses, then HTTP 500s) and a
+healthy "mirror". The same workload is sent twice:
+
+  single  the public stand-in alone, no hedging and no circuit breaker
+          (the old hard-wired behaviour)
+  chain   public -> mirror -> offline phrasebook, with circuit breakers
+          and hedged requests
+
+Prints overall p50/p99/max latency and failures for each run, plus the
+per-backend stats of the chain run.
+
+Usage: python bench/translation_backends.py [requests] [concurrency]
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web  # noqa: E402
+
+import main  # noqa: E402
+
+PUBLIC_PORT = 8771
+MIRROR_PORT = 8772
+LANGUAGES = ["fr", "de", "es", "pl", "ru", "tr"]
+
+
+def make_app(state: dict, name: str):
+    app = web.Application()
+
+    async def translate(request):
+        payload = await request.json()
+        mode = state["mode"]
+        if mode == "slow" and random.random() < 0.4:
+            await asyncio.sleep(random.uniform(3, 8))
+        elif mode == "error" and random.random() < 0.7:
+            await asyncio.sleep(0.05)
+            return web.json_response({"error": "upstream failure"}, status=500)
+        else:
+            await asyncio.sleep(random.uniform(0.05, 0.25))
+        q = payload["q"]
+        out = [f"[{name}:{payload['target']}] {t}" for t in q] if isinstance(q, list) else f"[{name}:{payload['target']}] {q}"
+        return web.json_response({"translatedText": out})
+
+    app.router.add_post("/translate", translate)
+    return app
+
+
+def settings_for(backends: list, chain: bool) -> dict:
+    settings = dict(main.CONFIG["translation"], backends=backends, max_retries=1, backoff_base_seconds=0.1)
+    if not chain:
+        settings.update(hedge_after_seconds=3600, breaker_failures=10**9)
+    else:
+        settings.update(hedge_after_seconds=0.75, slow_seconds=2.0, breaker_failures=3, breaker_cooldown_seconds=5.0)
+    return settings
+
+
+def endpoint(name: str, port: int) -> dict:
+    return {
+        "name": name,
+        "type": "libretranslate",
+        "url": f"http://127.0.0.1:{port}/translate",
+        "rate_per_second": 200,
+        "burst": 50,
+        "max_concurrency": 16,
+        "timeout_seconds": 10.0,
+    }
+
+
+async def run_workload(label: str, settings: dict, public_state: dict, requests: int, concurrency: int):
+    store = main.SqliteStore(f"{label}.db")
+    translator = main.Translator(main.TranslationCache(store, 1 << 20, None, 1000, 0), settings)
+    await translator.start()
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def one(i: int):
+        nonlocal failures
+        text = f"Rally at the bear trap in {i} minutes please"
+        async with semaphore:
+            started = time.perf_counter()
+            translated = await translator.translate(text, random.choice(LANGUAGES))
+            latencies.append(time.perf_counter() - started)
+            if translated == text:
+                failures += 1
+
+    # healthy -> slow -> failing, a third of the run each
+    tasks = []
+    for i in range(requests):
+        public_state["mode"] = ("healthy", "slow", "error")[min(2, 3 * i // requests)]
+        tasks.append(asyncio.create_task(one(i)))
+        await asyncio.sleep(0.01)
+    await asyncio.gather(*tasks)
+
+    latencies.sort()
+    n = len(latencies)
+    print(f"{label:<7} p50 {latencies[n // 2] * 1000:8.1f} ms   p99 {latencies[min(n - 1, int(n * 0.99))] * 1000:8.1f} ms   "
+          f"max {latencies[-1] * 1000:8.1f} ms   failed {failures}/{n}")
+    backend_stats = translator.backends.stats()
+    await translator.close()
+    await store.run(store.close)
+    return backend_stats
+
+
+async def run(requests: int, concurrency: int):
+    public_state = {"mode": "healthy"}
+    runners = []
+    for port, state, name in ((PUBLIC_PORT, public_state, "public"), (MIRROR_PORT, {"mode": "healthy"}, "mirror")):
+        runner = web.AppRunner(make_app(state, name))
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        runners.append(runner)
+
+    with open("phrasebook.json", "w", encoding="utf-8") as f:
+        json.dump({lang: {"good morning": f"({lang}) good morning"} for lang in LANGUAGES}, f)
+
+    random.seed(1)
+    await run_workload("single", settings_for([endpoint("public", PUBLIC_PORT)], chain=False),
+                       public_state, requests, concurrency)
+    random.seed(1)
+    stats = await run_workload("chain", settings_for([
+        endpoint("public", PUBLIC_PORT),
+        endpoint("mirror", MIRROR_PORT),
+        {"name": "phrasebook", "type": "phrasebook", "path": "phrasebook.json"},
+    ], chain=True), public_state, requests, concurrency)
+    for s in stats:
+        print(f"  {s['name']:<11} {s['state']:<9} trips {s['trips']}  ok {s['successes']}/{s['requests']}  "
+              f"failed {s['failures']}  slow {s['slow']}  skipped {s['skipped']}  cancelled {s['cancelled']}  "
+              f"hedge wins {s['hedge_wins']}  p50 {s['p50_ms']} ms  p99 {s['p99_ms']} ms")
+
+    for runner in runners:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    os.chdir(tempfile.mkdtemp(prefix="translation-backends-bench-"))
+    asyncio.run(run(total, workers))
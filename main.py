@@ -1,11 +1,28 @@
 import os
 import json
 import asyncio
+import base64
+import bisect
 import datetime
+import email.utils
+import functools
 import re
-from typing import Optional, Dict, Any, List
+import socket
+import struct
+import heapq
+import hashlib
+import random
+import sys
+import time
+import sqlite3
+import concurrent.futures
+import contextlib
+from array import array
+from collections import OrderedDict, deque
+from typing import Optional, Dict, Any, List, Callable, Awaitable
 
 import aiohttp
+from aiohttp import web
 import discord
 from discord.ext import commands, tasks
 from discord import app_commands
@@ -126,6 +143,25 @@ CONFIG = {
         1439884540331167775: "es",  # Spanish
     },
 
+    # Answers accepted for "Main language" in the verification form -> language role
+    "language_names": {
+        "english": 1439732594693509131,
+        "polish": 1439733053550497915,
+        "french": 1439733487195394148,
+        "bosnian": 1439733731534311604,
+        "portuguese (brazil)": 1439734067955499160,
+        "portuguese (portugal)": 1439734590632759336,
+        "persian": 1439734720610177198,
+        "arabic": 1439735048554418227,
+        "german": 1439735171061645507,
+        "russian": 1439737062575181966,
+        "korean": 1439737330263916696,
+        "thai": 1439737843445530644,
+        "turkish": 1439737886348939294,
+        "chinese": 1439737951138353202,
+        "spanish": 1439884540331167775,
+    },
+
     "alliance_name_to_role_key": {
         "BTK": "btk",
         "SUN": "sun",
@@ -139,140 +175,3667 @@ CONFIG = {
 
     # Participation milestones (messages sent)
     "participation_milestones": [50, 200, 500],
+
+    # Write-behind persistence: state is kept in memory and changed rows are
+    # flushed to data/papamike.db every `flush_interval_seconds`, or sooner
+    # once `flush_dirty_threshold` entries have changed.
+    "persistence": {
+        "flush_interval_seconds": 10,
+        "flush_dirty_threshold": 500,
+    },
+
+    # Translation cache: an LRU in memory bounded by `cache_max_bytes`, backed
+    # by a table in data/papamike.db so restarts come up warm. Set
+    # `cache_ttl_seconds` to None to keep translations until evicted.
+    "translation": {
+        "cache_max_bytes": 8 * 1024 * 1024,
+        "cache_ttl_seconds": 7 * 24 * 3600,
+        "cache_disk_max_entries": 50000,
+        "cache_warm_entries": 2000,
+
+        # Translation backends, tried in order. "libretranslate" entries are
+        # LibreTranslate-compatible endpoints (self-hosted, mirrors, the
+        # public instance), each with its own limits: requests wait for a
+        # token (`rate_per_second`, bursts up to `burst`), at most
+        # `max_concurrency` are in flight, and a 429/503 pauses the endpoint
+        # for Retry-After. A "phrasebook" entry answers from a local JSON file
+        # ({"fr": {"good morning": "bonjour"}, ...}) and is only used once the
+        # endpoints before it have failed.
+        "backends": [
+            {
+                "name": "libretranslate.de",
+                "type": "libretranslate",
+                "url": "https://libretranslate.de/translate",
+                "api_key": "",
+                "rate_per_second": 1.0,
+                "burst": 5,
+                "max_concurrency": 2,
+                "timeout_seconds": 10.0,
+            },
+            {
+                "name": "phrasebook",
+                "type": "phrasebook",
+                "path": "data/phrasebook.json",
+            },
+        ],
+
+        # Each backend has a circuit breaker: after `breaker_failures`
+        # consecutive failures or responses slower than `slow_seconds` it is
+        # skipped for `breaker_cooldown_seconds`, then one probe request
+        # decides whether it comes back. A request still unanswered after
+        # `hedge_after_seconds` is also sent to the next backend, and the
+        # first answer wins.
+        "breaker_failures": 3,
+        "breaker_cooldown_seconds": 60.0,
+        "slow_seconds": 5.0,
+        "hedge_after_seconds": 1.5,
+
+        # When every backend is rate limiting, the request is retried after an
+        # exponential backoff. Total failures are reported to `bot_errors` at
+        # most every `failure_alert_seconds`.
+        "max_retries": 3,
+        "backoff_base_seconds": 1.0,
+        "backoff_max_seconds": 30.0,
+        "failure_alert_seconds": 300,
+
+        # Auto-translate micro-batching: messages from the same channel are
+        # collected for up to `batch_window_seconds` (or until `batch_max_items`
+        # / `batch_max_chars`) and translated with one upstream request.
+        "batch_window_seconds": 2.0,
+        "batch_max_items": 10,
+        "batch_max_chars": 4000,
+
+        # Background pool that runs the batches off the on_message path. When
+        # `queue_max_depth` batches are waiting, `queue_overflow` decides what
+        # happens: "drop_oldest" discards the oldest queued batch, "skip" drops
+        # the new one.
+        "queue_workers": 2,
+        "queue_max_depth": 200,
+        "queue_overflow": "drop_oldest",
+
+        # Local pre-filter that skips messages which cannot change when
+        # translated (emoji, mentions, links, "ok", text already in the target).
+        "prefilter_enabled": True,
+
+        # Cache and translate sentence by sentence instead of whole messages:
+        # mentions, links and custom emoji are cut out, whitespace and safe
+        # case differences are normalized, and only sentences missing from
+        # the cache go upstream.
+        "segment_cache": True,
+
+        # Split mode: with `worker_processes` > 0, translation (HTTP session,
+        # JSON parsing, cache) runs in that many child processes reached over
+        # Unix sockets, so translation bursts cannot starve the gateway
+        # heartbeat. Rate limits and cache size are shared out between them.
+        # Requests fall back to the bot process while a worker is down.
+        "worker_processes": 0,
+        "worker_request_timeout_seconds": 60.0,
+        "worker_restart_seconds": 5.0,
+    },
+
+    # Outbound queue behind log_to: lines for the same channel are merged into
+    # messages of up to 2000 characters and sent every `flush_interval_seconds`,
+    # paced per channel to stay inside Discord's per-route rate limit.
+    "log_queue": {
+        "flush_interval_seconds": 1.0,
+        "max_lines_per_channel": 500,
+        "rate_per_second": 1.0,
+        "burst": 5,
+        "max_retries": 3,
+    },
+
+    # Inactivity kicks. The sweep runs every `sweep_interval_minutes` and only
+    # looks at members whose last message is older than `threshold_days`, so
+    # the work is spread through the day. With `dry_run` on, candidates are
+    # reported to mod_log instead of being kicked.
+    "inactivity": {
+        "threshold_days": 30,
+        "sweep_interval_minutes": 60,
+        "max_kicks_per_sweep": 50,
+        "kick_concurrency": 2,
+        "kicks_per_second": 1.0,
+        "dry_run": False,
+    },
+
+    # Gateway footprint. In lean mode the bot asks Discord only for the events
+    # its handlers use, keeps no presence or message cache, does not chunk
+    # every guild at startup, and fetches members over REST when a sweep or
+    # lookup needs someone who is not cached. Set `lean` to False for the old
+    # Intents.all() behaviour.
+    # In lean mode, alliance membership for /leaderboard is read from one
+    # REST pass over the member list and reused for `alliance_cache_seconds`.
+    "gateway": {
+        "lean": True,
+        "alliance_cache_seconds": 600,
+    },
+
+    # History backfill. Activity is only tracked while the bot is online, so
+    # before the first inactivity sweep after a restart the bot reads every
+    # text channel's history since its checkpoint (the newest message already
+    # counted) and updates last_seen and participation from it. Channels are
+    # scanned `concurrency` at a time, history pages (100 messages each) are
+    # paced at `pages_per_second`, and checkpoints older than
+    # `max_lookback_days` are clipped.
+    "backfill": {
+        "enabled": True,
+        "concurrency": 6,
+        "pages_per_second": 10.0,
+        "max_lookback_days": 30,
+    },
+
+    # /search. Messages in the translated chat channels, with their English
+    # translations once the auto-translate batch has run, are kept in an
+    # in-memory index for `window_hours`, at most `max_messages` of them;
+    # older messages drop out.
+    "search": {
+        "enabled": True,
+        "window_hours": 7 * 24,
+        "max_messages": 300000,
+        "max_results": 10,
+    },
+
+    # Runtime instrumentation (latency histograms, event-loop lag, REST call
+    # counts) shown by /botstats. Set `prometheus_port` to also serve them in
+    # Prometheus text format at http://<prometheus_host>:<port>/metrics.
+    "metrics": {
+        "enabled": True,
+        "loop_lag_interval_seconds": 0.5,
+        "prometheus_host": "127.0.0.1",
+        "prometheus_port": None,
+    },
+
+    # Gift-code redemption. `endpoint_url` is the redemption API that takes a
+    # player ID and a code (POST form fields `fid`, `cdk`, `time`, plus `sign`
+    # when `sign_secret` is set). Leave it empty to only record codes.
+    "giftcodes": {
+        "endpoint_url": "",
+        "sign_secret": "",
+        "concurrency": 8,
+        "rate_per_second": 5.0,
+        "burst": 5,
+        "max_retries": 4,
+        "backoff_base_seconds": 0.5,
+        "progress_every": 50,
+    },
+
+    # Announcement broadcast (/broadcast): one text is translated into every
+    # language in `language_roles` (deduplicated), at most `concurrency` at
+    # a time, and posted as embeds. Messages in the channels listed under
+    # `auto_channels` (keys of "channels", e.g. "server_announcements") get
+    # their translations posted automatically, one at a time from their own
+    # queue (apart from auto-translate); past `queue_max_depth` waiting
+    # announcements, new ones are dropped and reported to `bot_errors`.
+    "broadcast": {
+        "concurrency": 8,
+        "auto_channels": [],
+        "queue_max_depth": 20,
+    },
+
+    # /guessnumber and /blackjack sessions. Untouched sessions expire after
+    # `session_ttl_seconds` (swept every `sweep_interval_seconds`); starting
+    # a game past `max_sessions_per_user` ends that user's oldest one, and
+    # past `max_sessions` the one closest to expiry is evicted.
+    "games": {
+        "session_ttl_seconds": 900,
+        "max_sessions_per_user": 3,
+        "max_sessions": 10000,
+        "sweep_interval_seconds": 60,
+    },
 }
 
+# Optional JSON file with overrides for CONFIG (same shape, any subset of keys).
+# It is merged over the defaults above at startup and re-read whenever it
+# changes, so channel/role IDs can be updated without a redeploy.
+CONFIG_FILE = os.getenv("PAPAMIKE_CONFIG", "config.json")
+
+# ------------- COMPILED CONFIG -------------
+
+def merge_config(base: Dict[str, Any], overrides: Dict[str, Any]) -> Dict[str, Any]:
+    merged = dict(base)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_config(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class CompiledConfig:
+    """Lookup tables derived from CONFIG once, instead of on every message.
+
+    Rebuilt as a whole on reload and swapped in with a single assignment, so
+    handlers never see a half-updated config. Only IDs and mappings reload
+    live; tuning sections (translation, log_queue, ...) apply on restart.
+    """
+
+    def __init__(self, raw: Dict[str, Any]):
+        self.raw = raw
+        channels = raw["channels"]
+        roles = raw["roles"]
+
+        self.language_by_role: Dict[int, str] = {int(rid): code for rid, code in raw["language_roles"].items()}
+        self.language_names: tuple = tuple((name, int(rid)) for name, rid in raw["language_names"].items())
+
+        # role id -> (priority, alliance name); the first name in CONFIG order wins
+        self.alliance_by_role: Dict[int, tuple] = {}
+        # upper-cased form answer -> alliance role id
+        self.alliance_role_by_name: Dict[str, int] = {}
+        for priority, (name, key) in enumerate(raw["alliance_name_to_role_key"].items()):
+            rid = roles.get(key)
+            if rid:
+                self.alliance_by_role.setdefault(rid, (priority, name))
+                self.alliance_role_by_name[name.upper()] = rid
+
+        self.exempt_roles = frozenset(r for r in (roles.get("admin"), roles.get("moderator")) if r)
+        self.milestones = frozenset(raw["participation_milestones"])
+
+        self.furnace_channel = channels["furnace_upgrades"]
+        chat_channels = {channels["server_chat"]}
+        for data in raw["alliance_channels"].values():
+            chat_channels.add(data["alliance_chat"])
+            chat_channels.add(data["leader_chat"])
+        self.translated_channels = frozenset(c for c in chat_channels if c)
+        self.broadcast_channels = frozenset(
+            channels[key] for key in raw["broadcast"]["auto_channels"] if channels.get(key)
+        )
+
+        # (language code, display name) for each distinct configured language
+        label_by_role = {int(rid): name for name, rid in raw["language_names"].items()}
+        broadcast_languages: Dict[str, str] = {}
+        for rid, code in raw["language_roles"].items():
+            name = label_by_role.get(int(rid), code)
+            broadcast_languages.setdefault(code, name.split(" (")[0].title())
+        self.broadcast_languages: tuple = tuple(broadcast_languages.items())
+
+
+def load_config_file(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+DEFAULT_CONFIG = CONFIG
+cfg = CompiledConfig(CONFIG)
+config_mtime: Optional[float] = None
+
+
+def reload_config() -> bool:
+    """Re-read CONFIG_FILE and swap in the new config. Returns True if it changed."""
+    global CONFIG, cfg, config_mtime
+    mtime = os.path.getmtime(CONFIG_FILE) if os.path.exists(CONFIG_FILE) else None
+    if mtime == config_mtime:
+        return False
+    merged = merge_config(DEFAULT_CONFIG, load_config_file(CONFIG_FILE))
+    compiled = CompiledConfig(merged)  # raises on a broken file; the old config stays active
+    CONFIG, cfg, config_mtime = merged, compiled, mtime
+    return True
+
+
+try:
+    reload_config()
+except Exception as e:
+    print(f"ERROR: could not load {CONFIG_FILE}, using built-in config: {e}")
+
+# ------------- INSTRUMENTATION -------------
+
+class Histogram:
+    """Fixed-bucket latency histogram (seconds), cheap enough for every event."""
+
+    __slots__ = ("counts", "total", "count", "max")
+
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile, capped at the observed max."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(self.BUCKETS[i], self.max) if i < len(self.BUCKETS) else self.max
+        return self.max
+
+
+class Metrics:
+    """Latency histograms and counters keyed by (metric, label)."""
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.started = time.monotonic()
+        self.histograms: Dict[tuple, Histogram] = {}
+        self.counters: Dict[tuple, int] = {}
+
+    def observe(self, metric: str, label: str, seconds: float):
+        if not self.enabled:
+            return
+        key = (metric, label)
+        hist = self.histograms.get(key)
+        if hist is None:
+            hist = self.histograms[key] = Histogram()
+        hist.observe(seconds)
+
+    def inc(self, metric: str, label: str = "", n: int = 1):
+        if self.enabled:
+            key = (metric, label)
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    @contextlib.contextmanager
+    def timer(self, metric: str, label: str = ""):
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(metric, label, time.perf_counter() - started)
+
+    def by_metric(self, metric: str) -> List[tuple]:
+        return sorted(
+            ((label, hist) for (m, label), hist in self.histograms.items() if m == metric),
+            key=lambda item: item[1].count,
+            reverse=True,
+        )
+
+    def prometheus(self, gauges: Dict[str, float]) -> str:
+        def labels(label: str, extra: str = "") -> str:
+            parts = [f'name="{label}"'] if label else []
+            if extra:
+                parts.append(extra)
+            return "{" + ",".join(parts) + "}" if parts else ""
+
+        out = []
+        for metric in sorted({m for m, _ in self.histograms}):
+            name = f"papamike_{metric}"
+            out.append(f"# TYPE {name} histogram")
+            for label, hist in self.by_metric(metric):
+                cumulative = 0
+                for bound, n in zip(Histogram.BUCKETS + (float("inf"),), hist.counts):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    bound_label = 'le="' + le + '"'
+                    out.append(f"{name}_bucket{labels(label, bound_label)} {cumulative}")
+                out.append(f"{name}_sum{labels(label)} {hist.total}")
+                out.append(f"{name}_count{labels(label)} {hist.count}")
+        for metric in sorted({m for m, _ in self.counters}):
+            name = f"papamike_{metric}_total"
+            out.append(f"# TYPE {name} counter")
+            for (m, label), n in sorted(self.counters.items()):
+                if m == metric:
+                    out.append(f"{name}{labels(label)} {n}")
+        for gauge, value in sorted(gauges.items()):
+            out.append(f"# TYPE papamike_{gauge} gauge")
+            out.append(f"papamike_{gauge} {value}")
+        return "\n".join(out) + "\n"
+
+
+metrics = Metrics(CONFIG["metrics"]["enabled"])
+
+
+def instrumented(metric: str, label: str):
+    """Record the latency of every call to an async handler."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return await fn(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                metrics.observe(metric, label, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+async def monitor_event_loop_lag(interval: float):
+    # How late a short sleep wakes up is how long something blocked the loop.
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        metrics.observe("event_loop_lag_seconds", "", max(0.0, loop.time() - started - interval))
+
+
+def instrument_http(client: discord.Client):
+    """Count and time every Discord REST call by route template."""
+    original = client.http.request
+
+    async def request(route, **kwargs):
+        with metrics.timer("rest_request_seconds", f"{route.method} {route.path}"):
+            return await original(route, **kwargs)
+
+    client.http.request = request
+
+
+metrics_runner: Optional[web.AppRunner] = None
+
+
+def metrics_gauges() -> Dict[str, float]:
+    cache = translator.cache.stats()
+    return {
+        "uptime_seconds": round(time.monotonic() - metrics.started, 1),
+        "rss_bytes": current_rss_bytes() or 0,
+        "translation_cache_hit_ratio": round(cache["hit_ratio"], 4),
+        "translation_cache_entries": cache["entries"],
+        "translation_queue_depth": translation_queue.stats()["depth"],
+        "log_queue_depth": outbound_log.stats()["depth"],
+        "game_sessions_active": len(games.sessions),
+    }
+
+
+async def start_metrics_server(host: str, port: int):
+    global metrics_runner
+
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=metrics.prometheus(metrics_gauges()), content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    metrics_runner = web.AppRunner(app, access_log=None)
+    await metrics_runner.setup()
+    await web.TCPSite(metrics_runner, host, port).start()
+    print(f"Serving Prometheus metrics on http://{host}:{port}/metrics")
+
+
+async def stop_metrics_server():
+    global metrics_runner
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+        metrics_runner = None
+
 DATA_DIR = "data"
+DB_FILE = os.path.join(DATA_DIR, "papamike.db")
+BACKUP_DIR = os.path.join(DATA_DIR, "backup")
+
+# Legacy whole-file JSON state, imported into the database once on first start.
 PLAYER_IDS_FILE = os.path.join(DATA_DIR, "player_ids.json")
 LAST_SEEN_FILE = os.path.join(DATA_DIR, "last_seen.json")
 PARTICIPATION_FILE = os.path.join(DATA_DIR, "participation.json")
+LEGACY_JSON_FILES = {
+    "player_ids": PLAYER_IDS_FILE,
+    "last_seen": LAST_SEEN_FILE,
+    "participation": PARTICIPATION_FILE,
+}
 
 
 def ensure_data_files():
     os.makedirs(DATA_DIR, exist_ok=True)
-    for path in (PLAYER_IDS_FILE, LAST_SEEN_FILE, PARTICIPATION_FILE):
-        if not os.path.exists(path):
-            with open(path, "w", encoding="utf-8") as f:
-                json.dump({}, f)
 
 
 def load_json(path: str) -> Dict[str, Any]:
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
+    # A missing file is an empty table; a corrupt one is an error. Returning {}
+    # for a half-written file would wipe everyone's last_seen.
+    if not os.path.exists(path):
         return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_json(path: str, data: Dict[str, Any]) -> int:
+    """Atomically replace `path` with `data` (temp file + rename). Returns bytes written."""
+    payload = json.dumps(data, indent=2).encode("utf-8")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(payload)
+
+
+# ------------- PERSISTENCE (SQLITE + WRITE-BEHIND) -------------
+
+class SqliteStore:
+    """SQLite (WAL mode) store for bot state, one indexed table per dict.
+
+    All calls go through a single worker thread so the event loop never blocks
+    on disk I/O and the connection is only ever used from one thread.
+    """
+
+    # table name -> value column
+    TABLES = {
+        "player_ids": "player_id",
+        "last_seen": "seen_at",
+        "participation": "messages",
+        "activity": "daily_counts",
+    }
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS player_ids (
+            user_id TEXT PRIMARY KEY,
+            player_id TEXT NOT NULL
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS last_seen (
+            user_id TEXT PRIMARY KEY,
+            seen_at TEXT NOT NULL
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS participation (
+            user_id TEXT PRIMARY KEY,
+            messages INTEGER NOT NULL
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS activity (
+            user_id TEXT PRIMARY KEY,
+            daily_counts BLOB NOT NULL
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS translation_cache (
+            source_text TEXT NOT NULL,
+            target_lang TEXT NOT NULL,
+            translated TEXT NOT NULL,
+            stored_at REAL NOT NULL,
+            PRIMARY KEY (source_text, target_lang)
+        );
+        CREATE INDEX IF NOT EXISTS idx_translation_cache_stored_at ON translation_cache (stored_at);
+        CREATE TABLE IF NOT EXISTS giftcode_runs (
+            code TEXT PRIMARY KEY,
+            started_at REAL NOT NULL,
+            finished_at REAL
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS giftcode_journal (
+            code TEXT NOT NULL,
+            player_id TEXT NOT NULL,
+            status TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (code, player_id)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn: Optional[sqlite3.Connection] = None
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    # --- everything below runs on the store thread ---
+
+    def open(self):
+        if self.conn is not None:
+            return
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def set_meta_many(self, items: Dict[str, str]):
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", list(items.items()))
+
+    def meta_with_prefix(self, prefix: str) -> Dict[str, str]:
+        rows = self.conn.execute("SELECT key, value FROM meta WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+        return dict(rows)
+
+    def load_table(self, name: str) -> Dict[str, Any]:
+        column = self.TABLES[name]
+        return dict(self.conn.execute(f"SELECT user_id, {column} FROM {name}"))
+
+    def write_changes(self, name: str, upserts: List[tuple], deletes: List[str]) -> int:
+        column = self.TABLES[name]
+        with self.conn:
+            if upserts:
+                self.conn.executemany(
+                    f"INSERT INTO {name} (user_id, {column}) VALUES (?, ?) "
+                    f"ON CONFLICT (user_id) DO UPDATE SET {column} = excluded.{column}",
+                    upserts,
+                )
+            if deletes:
+                self.conn.executemany(f"DELETE FROM {name} WHERE user_id = ?", [(k,) for k in deletes])
+        return len(upserts) + len(deletes)
+
+    def migrate_from_json(self, files: Dict[str, str]):
+        """One-time import of the legacy data/*.json files."""
+        for name, path in files.items():
+            flag = f"migrated:{name}"
+            if self.get_meta(flag) or not os.path.exists(path):
+                continue
+            try:
+                data = load_json(path)
+            except Exception as e:
+                # Leave the flag unset so the import is retried once the file is fixed.
+                print(f"ERROR: could not import {path}, leaving it untouched: {e}")
+                continue
+            with self.conn:
+                # OR IGNORE: rows already in the database are newer than the JSON file.
+                self.conn.executemany(
+                    f"INSERT OR IGNORE INTO {name} (user_id, {self.TABLES[name]}) VALUES (?, ?)",
+                    list(data.items()),
+                )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                    (flag, datetime.datetime.utcnow().isoformat()),
+                )
+            print(f"Imported {len(data)} rows from {path} into {name}.")
+
+    def export_json(self, directory: str) -> int:
+        os.makedirs(directory, exist_ok=True)
+        written = 0
+        for name in self.TABLES:
+            table = self.load_table(name)
+            # BLOB columns (activity records) are not JSON; keep them as base64.
+            data = {k: base64.b64encode(v).decode("ascii") if isinstance(v, bytes) else v for k, v in table.items()}
+            written += save_json(os.path.join(directory, f"{name}.json"), data)
+        return written
 
+    def cache_get(self, text: str, target_lang: str) -> Optional[tuple]:
+        return self.conn.execute(
+            "SELECT translated, stored_at FROM translation_cache WHERE source_text = ? AND target_lang = ?",
+            (text, target_lang),
+        ).fetchone()
 
-def save_json(path: str, data: Dict[str, Any]):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+    def cache_put_many(self, rows: List[tuple]):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO translation_cache (source_text, target_lang, translated, stored_at) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+    def cache_recent(self, limit: int) -> List[tuple]:
+        rows = self.conn.execute(
+            "SELECT source_text, target_lang, translated, stored_at FROM translation_cache "
+            "ORDER BY stored_at DESC LIMIT ?",
+            (limit,),
+        )
+        return rows.fetchall()
+
+    def giftcode_start(self, code: str):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO giftcode_runs (code, started_at) VALUES (?, ?) "
+                "ON CONFLICT (code) DO UPDATE SET finished_at = NULL",
+                (code, time.time()),
+            )
+
+    def giftcode_finish(self, code: str):
+        with self.conn:
+            self.conn.execute("UPDATE giftcode_runs SET finished_at = ? WHERE code = ?", (time.time(), code))
+
+    def giftcode_unfinished(self) -> List[str]:
+        return [r[0] for r in self.conn.execute("SELECT code FROM giftcode_runs WHERE finished_at IS NULL")]
+
+    def giftcode_done(self, code: str) -> Dict[str, str]:
+        # "error" rows are left out so those IDs are tried again on resume or re-run
+        rows = self.conn.execute(
+            "SELECT player_id, status FROM giftcode_journal WHERE code = ? AND status != 'error'", (code,)
+        )
+        return dict(rows)
+
+    def giftcode_record(self, rows: List[tuple]):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO giftcode_journal (code, player_id, status, updated_at) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+    def cache_prune(self, older_than: Optional[float], max_rows: int) -> int:
+        with self.conn:
+            removed = 0
+            if older_than is not None:
+                removed += self.conn.execute(
+                    "DELETE FROM translation_cache WHERE stored_at < ?", (older_than,)
+                ).rowcount
+            removed += self.conn.execute(
+                "DELETE FROM translation_cache WHERE rowid IN ("
+                "SELECT rowid FROM translation_cache ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                (max_rows,),
+            ).rowcount
+        return removed
+
+
+class WriteBehindState:
+    """Keeps bot state in memory and writes changed entries back in batches.
+
+    Handlers mutate the dicts directly and call `mark_dirty`; the changed rows
+    are upserted into SQLite in `flush`, off the event loop, either from the
+    periodic `state_flush_loop` task or as soon as the dirty threshold is reached.
+    """
+
+    # flushes slower than this are printed; the rest only show up in stats()
+    SLOW_FLUSH_MS = 1000.0
+
+    def __init__(self, store: SqliteStore, dirty_threshold: int):
+        self.store = store
+        self.dirty_threshold = dirty_threshold
+        self.tables: Dict[str, Dict[str, Any]] = {}
+        self.dirty: Dict[str, set] = {name: set() for name in SqliteStore.TABLES}
+        # table name -> (encode, decode) for tables whose values are not plain str/int
+        self.codecs: Dict[str, tuple] = {}
+        self.dirty_count = 0
+        self._lock = asyncio.Lock()
+        self._pending: Optional[asyncio.Task] = None
+
+        # flush stats
+        self.flushes = 0
+        self.flush_errors = 0
+        self.rows_written = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    async def open(self):
+        # Once loaded the in-memory copy is authoritative; reloading from disk
+        # would throw away updates that have not been flushed yet.
+        if self.tables:
+            return
+        ensure_data_files()
+        await self.store.run(self.store.open)
+        await self.store.run(self.store.migrate_from_json, LEGACY_JSON_FILES)
+        for name in SqliteStore.TABLES:
+            table = await self.store.run(self.store.load_table, name)
+            if name in self.codecs:
+                decode = self.codecs[name][1]
+                table = {k: decode(v) for k, v in table.items()}
+            self.tables[name] = table
+
+    def register_codec(self, name: str, encode: Callable[[Any], Any], decode: Callable[[Any], Any]):
+        self.codecs[name] = (encode, decode)
+
+    def mark_dirty(self, name: str, key: str):
+        self.dirty[name].add(key)
+        self.dirty_count += 1
+        if self.dirty_count >= self.dirty_threshold and (self._pending is None or self._pending.done()):
+            self._pending = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        if not self.tables:
+            return
+        async with self._lock:
+            names = [name for name, keys in self.dirty.items() if keys]
+            if not names:
+                return
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            written = 0
+            for name in names:
+                keys, self.dirty[name] = self.dirty[name], set()
+                table = self.tables[name]
+                encode = self.codecs[name][0] if name in self.codecs else None
+                upserts = [(k, encode(table[k]) if encode else table[k]) for k in keys if k in table]
+                deletes = [k for k in keys if k not in table]
+                try:
+                    written += await self.store.run(self.store.write_changes, name, upserts, deletes)
+                except Exception as e:
+                    self.flush_errors += 1
+                    self.dirty[name] |= keys
+                    print(f"Error flushing {name}: {e}")
+            self.dirty_count = sum(len(keys) for keys in self.dirty.values())
+
+            elapsed_ms = (loop.time() - started) * 1000
+            metrics.observe("flush_seconds", "state", elapsed_ms / 1000)
+            self.flushes += 1
+            self.rows_written += written
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            if elapsed_ms > self.SLOW_FLUSH_MS:
+                print(f"Slow flush of {', '.join(names)}: {written} rows in {elapsed_ms:.1f} ms.")
+
+    async def close(self):
+        await self.flush()
+        await self.store.run(self.store.close)
+
+    async def export_json(self, directory: str = BACKUP_DIR) -> int:
+        await self.flush()
+        return await self.store.run(self.store.export_json, directory)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+            "rows_written": self.rows_written,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+            "dirty_entries": self.dirty_count,
+        }
+
+
+state = WriteBehindState(SqliteStore(DB_FILE), CONFIG["persistence"]["flush_dirty_threshold"])
 
 
 # ------------- TRANSLATOR (FREE API USING LIBRETRANSLATE) -------------
 
-class Translator:
-    BASE_URL = "https://libretranslate.de/translate"  # public instance, free but rate-limited
+class TokenBucket:
+    """Async token bucket: `acquire` waits until a token is available."""
 
-    def __init__(self):
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.waits = 0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def pause(self, seconds: float):
+        """Stop handing out tokens for `seconds` (e.g. after a 429)."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                self.waits += 1
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            self.waits += 1
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class BackendError(Exception):
+    """A backend could not translate a request; counts against its breaker."""
+
+
+class BackendThrottled(BackendError):
+    """The backend answered 429/503: healthy, but asking us to slow down."""
+
+
+class BackendMiss(BackendError):
+    """The backend has no translation for the text (offline phrasebook)."""
+
+
+class AllBackendsFailed(Exception):
+    def __init__(self, message: str, throttled: bool):
+        super().__init__(message)
+        self.throttled = throttled
+
+
+class CircuitBreaker:
+    """Closed -> open after `threshold` consecutive failures; after `cooldown`
+    a single probe is let through (half-open) and decides which way it goes."""
+
+    __slots__ = ("threshold", "cooldown", "failures", "state", "opened_at", "probing", "trips")
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+        self.trips = 0
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self.probing:
+                return False
+            self.probing = True
+        return True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            if self.state != self.OPEN:
+                self.trips += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+    def release(self):
+        """The call ended without telling us anything (cancelled, throttled, miss)."""
+        self.probing = False
+
+
+class TranslationBackend:
+    """One source of translations. `translate` takes a text or a list of texts
+    and returns the same shape, or raises BackendError."""
+
+    # only tried after the backends before it failed, never as a hedge
+    fallback_only = False
+
+    def __init__(self, name: str, settings: Dict[str, Any]):
+        self.name = name
+        self.breaker = CircuitBreaker(settings["breaker_failures"], settings["breaker_cooldown_seconds"])
+        self.slow_seconds = settings["slow_seconds"]
+        self.latency = Histogram()
+
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.throttled = 0
+        self.misses = 0
+        self.slow = 0
+        self.skipped = 0
+        self.cancelled = 0
+        self.hedge_wins = 0
+
+    async def start(self, session: aiohttp.ClientSession):
+        pass
+
+    async def translate(self, q, target_lang: str, source_lang: str):
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "state": self.breaker.state,
+            "trips": self.breaker.trips,
+            "requests": self.requests,
+            "successes": self.successes,
+            "failures": self.failures,
+            "throttled": self.throttled,
+            "misses": self.misses,
+            "slow": self.slow,
+            "skipped": self.skipped,
+            "cancelled": self.cancelled,
+            "hedge_wins": self.hedge_wins,
+            "p50_ms": round(self.latency.quantile(0.5) * 1000, 1),
+            "p99_ms": round(self.latency.quantile(0.99) * 1000, 1),
+        }
+
+
+class LibreTranslateBackend(TranslationBackend):
+    def __init__(self, name: str, entry: Dict[str, Any], settings: Dict[str, Any]):
+        super().__init__(name, settings)
+        self.url = entry["url"]
+        self.api_key = entry.get("api_key") or ""
+        self.timeout = aiohttp.ClientTimeout(total=entry.get("timeout_seconds", 10.0))
+        self.bucket = TokenBucket(entry.get("rate_per_second", 1.0), entry.get("burst", 5))
+        self.semaphore = asyncio.Semaphore(entry.get("max_concurrency", 2))
         self.session: Optional[aiohttp.ClientSession] = None
-        self.cache: Dict[tuple, str] = {}
+        # flipped off if the endpoint does not accept an array `q`
+        self.supports_batch = True
 
-    async def start(self):
-        if self.session is None:
-            self.session = aiohttp.ClientSession()
+    async def start(self, session: aiohttp.ClientSession):
+        self.session = session
 
-    async def close(self):
-        if self.session:
-            await self.session.close()
-            self.session = None
+    async def translate(self, q, target_lang: str, source_lang: str):
+        if isinstance(q, list) and not self.supports_batch:
+            return list(await asyncio.gather(*(self._post(text, target_lang, source_lang) for text in q)))
+        translated = await self._post(q, target_lang, source_lang)
+        if isinstance(q, list) and not (isinstance(translated, list) and len(translated) == len(q)):
+            print(f"Translation backend {self.name} does not support batched requests; sending one request per text.")
+            self.supports_batch = False
+            return await self.translate(q, target_lang, source_lang)
+        return translated
 
-    async def translate(self, text: str, target_lang: str, source_lang: str = "auto") -> str:
-        key = (text, target_lang)
-        if key in self.cache:
-            return self.cache[key]
+    async def _post(self, q, target_lang: str, source_lang: str):
+        payload = {"q": q, "source": source_lang, "target": target_lang, "format": "text"}
+        if self.api_key:
+            payload["api_key"] = self.api_key
+        async with self.semaphore:
+            await self.bucket.acquire()
+            try:
+                async with self.session.post(self.url, json=payload, timeout=self.timeout) as resp:
+                    if resp.status in (429, 503):
+                        delay = parse_retry_after(resp.headers.get("Retry-After"))
+                        self.bucket.pause(min(delay if delay is not None else 1.0, 30.0))
+                        raise BackendThrottled(f"HTTP {resp.status}")
+                    if resp.status != 200:
+                        raise BackendError(f"HTTP {resp.status}")
+                    data = await resp.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                raise BackendError(f"{type(e).__name__}: {e}") from e
+        if not isinstance(data, dict) or "translatedText" not in data:
+            raise BackendError("response has no translatedText")
+        return data["translatedText"]
 
-        await self.start()
+
+class PhrasebookBackend(TranslationBackend):
+    """Offline last resort: exact phrase lookups from a JSON file."""
+
+    fallback_only = True
+    PUNCTUATION = " \t\n!?.,;:¡¿"
+
+    def __init__(self, name: str, entry: Dict[str, Any], settings: Dict[str, Any]):
+        super().__init__(name, settings)
+        self.path = entry["path"]
+        self.phrases: Dict[str, Dict[str, str]] = {}
+
+    def normalize(self, text: str) -> str:
+        return " ".join(text.strip(self.PUNCTUATION).lower().split())
+
+    async def start(self, session: aiohttp.ClientSession):
+        if not os.path.exists(self.path):
+            return
         try:
-            async with self.session.post(
-                self.BASE_URL,
-                data={
-                    "q": text,
-                    "source": source_lang,
-                    "target": target_lang,
-                    "format": "text",
-                },
-                timeout=10,
-            ) as resp:
-                if resp.status != 200:
-                    return text
-                data = await resp.json()
-                translated = data.get("translatedText", text)
-                self.cache[key] = translated
-                return translated
-        except Exception:
-            return text
+            raw = load_json(self.path)
+        except ValueError as e:
+            print(f"Could not load phrasebook {self.path}: {e}")
+            return
+        self.phrases = {
+            lang: {self.normalize(src): dst for src, dst in table.items()}
+            for lang, table in raw.items()
+        }
 
+    async def translate(self, q, target_lang: str, source_lang: str):
+        table = self.phrases.get(target_lang, {})
+        if isinstance(q, list):
+            found = [table.get(self.normalize(text)) for text in q]
+            if any(t is not None for t in found):
+                return found  # None marks the texts it does not know
+        else:
+            found = table.get(self.normalize(q))
+            if found is not None:
+                return found
+        raise BackendMiss("not in phrasebook")
 
-translator = Translator()
 
-# ------------- BOT SETUP -------------
+BACKEND_TYPES = {
+    "libretranslate": LibreTranslateBackend,
+    "phrasebook": PhrasebookBackend,
+}
 
-intents = discord.Intents.all()  # ✅ give us all events (members, presences, etc.)
-bot = commands.Bot(command_prefix="!", intents=intents)
 
-player_ids: Dict[str, str] = {}
-last_seen: Dict[str, str] = {}
-participation: Dict[str, int] = {}
+class BackendChain:
+    """Tries backends in order, skipping any whose breaker is open.
 
-guess_games: Dict[int, int] = {}
-blackjack_games: Dict[int, Dict[str, Any]] = {}
+    If the current attempt has not answered after `hedge_after` seconds the
+    next backend is started alongside it and whichever answers first wins;
+    a failure moves on to the next backend straight away.
+    """
 
+    def __init__(self, settings: Dict[str, Any]):
+        self.backends: List[TranslationBackend] = []
+        for entry in settings["backends"]:
+            kind = BACKEND_TYPES.get(entry["type"])
+            if kind is None:
+                raise ValueError(f"Unknown translation backend type {entry['type']!r}")
+            self.backends.append(kind(entry.get("name") or entry["type"], entry, settings))
+        self.hedge_after = settings["hedge_after_seconds"]
+        self.hedges = 0
 
-async def log_to(channel_id: int, message: str):
-    channel = bot.get_channel(channel_id)
-    if channel:
+    async def start(self, session: aiohttp.ClientSession):
+        for backend in self.backends:
+            await backend.start(session)
+
+    async def _attempt(self, backend: TranslationBackend, q, target_lang: str, source_lang: str):
+        backend.requests += 1
+        started = time.perf_counter()
         try:
-            await channel.send(message)
-        except Exception:
-            pass
+            result = await backend.translate(q, target_lang, source_lang)
+        except asyncio.CancelledError:
+            backend.cancelled += 1
+            backend.breaker.release()
+            raise
+        except BackendMiss:
+            backend.misses += 1
+            backend.breaker.release()
+            raise
+        except BackendThrottled:
+            backend.throttled += 1
+            backend.breaker.release()
+            raise
+        except Exception as e:
+            backend.failures += 1
+            backend.breaker.record_failure()
+            if isinstance(e, BackendError):
+                raise
+            raise BackendError(f"{type(e).__name__}: {e}") from e
+        elapsed = time.perf_counter() - started
+        backend.latency.observe(elapsed)
+        metrics.observe("translator_request_seconds", backend.name, elapsed)
+        backend.successes += 1
+        if elapsed > backend.slow_seconds:
+            # still use the answer, but a slow backend is a failing one
+            backend.slow += 1
+            backend.breaker.record_failure()
+        else:
+            backend.breaker.record_success()
+        return result
+
+    async def translate(self, q, target_lang: str, source_lang: str):
+        queue = list(self.backends)
+        running: Dict[asyncio.Task, TranslationBackend] = {}
+        hedged = set()
+        errors: List[str] = []
+        # Worth a retry if a backend said "slow down" and the rest only
+        # missed in a fallback phrasebook; an open breaker or a real failure
+        # will not change within the backoff.
+        throttled = False
+        retryable = True
+
+        def launch(hedge: bool) -> bool:
+            nonlocal retryable
+            while queue:
+                backend = queue[0]
+                if hedge and backend.fallback_only:
+                    return False
+                queue.pop(0)
+                if not backend.breaker.allow():
+                    backend.skipped += 1
+                    retryable = False
+                    continue
+                task = asyncio.create_task(self._attempt(backend, q, target_lang, source_lang))
+                running[task] = backend
+                if hedge:
+                    self.hedges += 1
+                    hedged.add(task)
+                return True
+            return False
+
+        launch(hedge=False)
+        try:
+            while running:
+                can_hedge = any(not b.fallback_only for b in queue)
+                done, _ = await asyncio.wait(
+                    running, timeout=self.hedge_after if can_hedge else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    launch(hedge=True)
+                    continue
+                for task in done:
+                    backend = running.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        if task in hedged:
+                            backend.hedge_wins += 1
+                        return task.result()
+                    errors.append(f"{backend.name}: {error}")
+                    if isinstance(error, BackendThrottled):
+                        throttled = True
+                    elif not (isinstance(error, BackendMiss) and backend.fallback_only):
+                        retryable = False
+                    launch(hedge=bool(running))
+            if not errors:
+                raise AllBackendsFailed("every backend is cooling down after failures", False)
+            raise AllBackendsFailed("; ".join(errors), throttled and retryable)
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [backend.stats() for backend in self.backends]
+
+
+class TranslationCache:
+    """Two-tier translation cache: byte-bounded LRU in memory, SQLite on disk."""
+
+    # rough per-entry bookkeeping cost (tuple, OrderedDict node) on top of the strings
+    ENTRY_OVERHEAD = 200
+
+    def __init__(self, store: SqliteStore, max_bytes: int, ttl_seconds: Optional[float],
+                 disk_max_entries: int, warm_entries: int):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self.disk_max_entries = disk_max_entries
+        self.warm_entries = warm_entries
+        # key -> (translated, stored_at, size)
+        self.entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self.bytes = 0
+        self._disk_pending: List[tuple] = []
+        self._disk_ready = False
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl is not None and time.time() - stored_at > self.ttl
+
+    def _insert(self, key: tuple, translated: str, stored_at: float):
+        old = self.entries.pop(key, None)
+        if old:
+            self.bytes -= old[2]
+        size = sys.getsizeof(key[0]) + sys.getsizeof(translated) + self.ENTRY_OVERHEAD
+        self.entries[key] = (translated, stored_at, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes and self.entries:
+            _, (_, _, evicted_size) = self.entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    async def open(self):
+        if self._disk_ready:
+            return
+        await self.store.run(self.store.open)
+        rows = await self.store.run(self.store.cache_recent, self.warm_entries)
+        # oldest first so the most recent end up at the MRU end
+        for text, target_lang, translated, stored_at in reversed(rows):
+            if not self._expired(stored_at):
+                self._insert((text, target_lang), translated, stored_at)
+        self._disk_ready = True
+
+    async def get(self, key: tuple) -> Optional[str]:
+        entry = self.entries.get(key)
+        if entry is not None:
+            if self._expired(entry[1]):
+                self.entries.pop(key)
+                self.bytes -= entry[2]
+                self.expirations += 1
+            else:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        if self._disk_ready:
+            try:
+                row = await self.store.run(self.store.cache_get, key[0], key[1])
+            except Exception as e:
+                print(f"Error reading translation cache: {e}")
+                row = None
+            if row and not self._expired(row[1]):
+                self._insert(key, row[0], row[1])
+                self.disk_hits += 1
+                return row[0]
+
+        self.misses += 1
+        return None
+
+    def put(self, key: tuple, translated: str):
+        now = time.time()
+        self._insert(key, translated, now)
+        self._disk_pending.append((key[0], key[1], translated, now))
+
+    async def flush(self):
+        if not self._disk_ready or not self._disk_pending:
+            return
+        rows, self._disk_pending = self._disk_pending, []
+        try:
+            with metrics.timer("flush_seconds", "translation_cache"):
+                await self.store.run(self.store.cache_put_many, rows)
+        except Exception as e:
+            print(f"Error writing translation cache: {e}")
+
+    async def prune_disk(self) -> int:
+        if not self._disk_ready:
+            return 0
+        older_than = time.time() - self.ttl if self.ttl is not None else None
+        return await self.store.run(self.store.cache_prune, older_than, self.disk_max_entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "memory_bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class TranslationPrefilter:
+    """Cheap local checks that decide whether a text is worth translating at all."""
+
+    NOISE_RE = re.compile(
+        r"<a?:\w+:\d+>"           # custom emoji
+        r"|<(?:@[!&]?|#)\d+>"      # user/role/channel mentions
+        r"|https?://\S+"
+        r"|:\w+:"                  # :shortcode: emoji
+    )
+    WORD_RE = re.compile(r"[^\W\d_]+")
+
+    # Messages made only of these words are the same in every language we log.
+    TRIVIAL_WORDS = frozenset(
+        "ok okay okk k kk lol lmao xd xdd gg wp ggwp ty thx tnx np hi hey yo hello bye "
+        "yes no ya yeah yep nope haha hahaha jaja kkk rsrs ah oh wow omg brb afk gn gm".split()
+    )
+
+    # A handful of very common function words per Latin-script language: enough
+    # to tell "already English" from "Polish" on chat-length text.
+    STOPWORDS = {
+        "en": frozenset(
+            "the a an and or but is are was were be been to of in on at for with it this that "
+            "you i we they he she my your our me us do does did not have has had will can "
+            "what when where who how all just so if get go going now here there".split()
+        ),
+        "fr": frozenset("le la les un une et ou est sont je tu il elle nous vous ils de du des en pour avec pas que qui ce dans sur".split()),
+        "de": frozenset("der die das und oder ist sind ich du er sie wir ihr nicht ein eine zu mit auf für den dem ja auch".split()),
+        "es": frozenset("el la los las un una y o es son yo tu él ella nosotros que de del en para con por no se lo".split()),
+        "pt": frozenset("o a os as um uma e ou é são eu tu ele ela nós que de do da em para com por não se você".split()),
+        "pl": frozenset("i w na z do nie się jest to że jak ale co tak po za od jestem mam".split()),
+        "tr": frozenset("ve bir bu da de için ile ne mi ben sen o biz siz değil var yok çok".split()),
+        "bs": frozenset("i u na je su da se ne za od sa ali šta kako ja ti mi vi".split()),
+    }
+
+    # Non-Latin target languages -> Unicode ranges of their script.
+    SCRIPTS = {
+        "ru": ((0x0400, 0x04FF),),
+        "ar": ((0x0600, 0x06FF), (0x0750, 0x077F), (0xFB50, 0xFDFF), (0xFE70, 0xFEFF)),
+        "fa": ((0x0600, 0x06FF), (0x0750, 0x077F), (0xFB50, 0xFDFF), (0xFE70, 0xFEFF)),
+        "ko": ((0xAC00, 0xD7AF), (0x1100, 0x11FF), (0x3130, 0x318F)),
+        "th": ((0x0E00, 0x0E7F),),
+        "zh": ((0x4E00, 0x9FFF), (0x3400, 0x4DBF)),
+    }
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.skipped: Dict[str, int] = {"no_text": 0, "trivial": 0, "already_target": 0}
+
+    def skip_reason(self, text: str, target_lang: str) -> Optional[str]:
+        """Return why `text` needs no translation into `target_lang`, or None to translate it."""
+        if not self.enabled:
+            return None
+        stripped = self.NOISE_RE.sub(" ", text)
+        words = [w.lower() for w in self.WORD_RE.findall(stripped)]
+        if sum(len(w) for w in words) < 2:
+            reason = "no_text"
+        elif all(w in self.TRIVIAL_WORDS for w in words):
+            reason = "trivial"
+        elif self._is_target_language(words, target_lang):
+            reason = "already_target"
+        else:
+            return None
+        self.skipped[reason] += 1
+        return reason
+
+    def _is_target_language(self, words: List[str], target_lang: str) -> bool:
+        letters = "".join(words)
+        non_latin = sum(1 for c in letters if ord(c) > 0x24F)
+
+        ranges = self.SCRIPTS.get(target_lang)
+        if ranges is not None:
+            in_script = sum(1 for c in letters if any(lo <= ord(c) <= hi for lo, hi in ranges))
+            return in_script / len(letters) >= 0.8
+
+        # Latin-script target: anything in another script needs translating.
+        if non_latin:
+            return False
+        stopwords = self.STOPWORDS.get(target_lang)
+        if not stopwords:
+            return False
+        hits = {lang: sum(1 for w in words if w in sw) for lang, sw in self.STOPWORDS.items()}
+        best = max(hits, key=hits.get)
+        if hits[target_lang] < hits[best]:
+            return False
+        # One-word messages are too ambiguous unless the word itself is a stopword.
+        return hits[target_lang] >= 2 or (len(words) <= 2 and hits[target_lang] == len(words))
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.skipped, "avoided": sum(self.skipped.values())}
+
+
+class TranslationSegmenter:
+    """Splits messages into sentence segments that cache well, and reassembles them.
+
+    Mentions, channel links, custom emoji and URLs are never sent upstream:
+    inside a segment they are masked as numbered placeholders (<0>, <1>, ...)
+    and put back verbatim after translation, so "Tell <@1> to rally" and
+    "Tell <@2> to rally" share one cache entry. Whitespace inside a segment
+    is collapsed, and case is folded only where it cannot change the meaning
+    (a sentence-initial capital, ALL CAPS), so "Rally now!", "rally  now!"
+    and "RALLY NOW!" share one cache entry too.
+    """
+
+    TOKEN_RE = re.compile(r"<a?:\w+:\d+>|<@[!&]?\d+>|<#\d+>|https?://\S+")
+    PLACEHOLDER_RE = re.compile(r"<(\d+)>")
+    SENTENCE_RE = re.compile(r"((?<=[.!?。！？])\s+|\n+)")
+    LETTER_RE = re.compile(r"[^\W\d_]")
+
+    def __init__(self):
+        self.texts = 0
+        self.segments = 0
+
+    def _segment(self, core: str) -> tuple:
+        """(cache key, case mode, original, masked tokens) for one stripped sentence."""
+        tokens: List[str] = []
+
+        def mask(m: "re.Match") -> str:
+            tokens.append(m.group())
+            return f"<{len(tokens) - 1}>"
+
+        collapsed = " ".join(self.TOKEN_RE.sub(mask, core).split())
+        tokens_t = tuple(tokens)
+        if len(collapsed) > 1 and collapsed.isupper():
+            return collapsed.lower(), "upper", core, tokens_t
+        if collapsed[0].isupper() and collapsed[1:] == collapsed[1:].lower():
+            return collapsed[0].lower() + collapsed[1:], "capital", core, tokens_t
+        return collapsed, None, core, tokens_t
+
+    def split(self, text: str) -> List[Any]:
+        """Plain strings are kept as is; tuples are segments to translate."""
+        parts: List[Any] = []
+        # Tokens never contain whitespace, so sentence breaks never cut one.
+        for i, chunk in enumerate(self.SENTENCE_RE.split(text)):
+            core = chunk.strip()
+            if i % 2 or not self.LETTER_RE.search(self.TOKEN_RE.sub("", core)):
+                parts.append(chunk)  # separator, blank, or nothing but tokens
+                continue
+            lead = chunk[: len(chunk) - len(chunk.lstrip())]
+            trail = chunk[len(chunk.rstrip()):]
+            parts.extend((lead, self._segment(core), trail))
+        self.texts += 1
+        self.segments += sum(1 for p in parts if isinstance(p, tuple))
+        return parts
+
+    @classmethod
+    def join(cls, parts: List[Any], translated: Dict[str, str]) -> str:
+        out = []
+        for part in parts:
+            if not isinstance(part, tuple):
+                out.append(part)
+                continue
+            key, mode, original, tokens = part
+            result = translated.get(key, key)
+            if result == key:
+                out.append(original)  # untranslated: keep the exact original text
+                continue
+            if mode == "upper":
+                result = result.upper()
+            elif mode == "capital":
+                result = result[:1].upper() + result[1:]
+            out.append(cls._unmask(result, tokens))
+        return "".join(out)
+
+    @classmethod
+    def _unmask(cls, result: str, tokens: tuple) -> str:
+        used = set()
+
+        def unmask(m: "re.Match") -> str:
+            index = int(m.group(1))
+            if index >= len(tokens):
+                return m.group()
+            used.add(index)
+            return tokens[index]
+
+        result = cls.PLACEHOLDER_RE.sub(unmask, result)
+        # a placeholder the backend dropped still must not lose its token
+        lost = [token for i, token in enumerate(tokens) if i not in used]
+        return " ".join([result] + lost) if lost else result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "texts": self.texts,
+            "segments": self.segments,
+            "segments_per_text": round(self.segments / self.texts, 2) if self.texts else 0.0,
+        }
+
+
+class Translator:
+    def __init__(self, cache: TranslationCache, settings: Dict[str, Any]):
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.cache = cache
+        self.prefilter = TranslationPrefilter(settings["prefilter_enabled"])
+        self.segmenter = TranslationSegmenter() if settings["segment_cache"] else None
+        self.backends = BackendChain(settings)
+        self.max_retries = settings["max_retries"]
+        self.backoff_base = settings["backoff_base_seconds"]
+        self.backoff_max = settings["backoff_max_seconds"]
+        self.alert_interval = settings["failure_alert_seconds"]
+        self.last_alert = 0.0
+        # posts failure reports somewhere people will see them; set by the bot
+        self.alert: Optional[Callable[[str], Awaitable[None]]] = None
+        # (text, target_lang) -> future shared by every caller waiting on that key
+        self.inflight: Dict[tuple, asyncio.Future] = {}
+        # set in split mode; see TranslationWorkerPool
+        self.workers: Optional["TranslationWorkerPool"] = None
+
+        self.requests = 0
+        self.batched_requests = 0
+        self.batched_texts = 0
+        self.coalesced = 0
+        self.throttled = 0
+        self.failures = 0
+        self.worker_fallbacks = 0
+
+    async def start(self):
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+            await self.backends.start(self.session)
+        await self.cache.open()
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+        await self.cache.flush()
+
+    async def translate(self, text: str, target_lang: str, source_lang: str = "auto") -> str:
+        return (await self.translate_many([text], target_lang, source_lang))[0]
+
+    async def translate_many(self, texts: List[str], target_lang: str, source_lang: str = "auto",
+                             prefiltered: bool = False) -> List[str]:
+        """Translate several texts, sending all cache misses in a single request.
+
+        Pass `prefiltered` when the caller already ran the prefilter on every
+        text, so each message is checked (and counted) exactly once.
+        """
+        results = list(texts)
+        if prefiltered:
+            send = list(range(len(texts)))
+        else:
+            send = [i for i, text in enumerate(texts) if not self.prefilter.skip_reason(text, target_lang)]
+        if not send:
+            return results
+
+        if self.workers is None or not self.workers.available():
+            local = await self._translate_local([texts[i] for i in send], target_lang, source_lang)
+            for i, translated in zip(send, local):
+                results[i] = translated
+            return results
+
+        # Split mode: the worker processes translate; anything a dead worker
+        # dropped is done locally.
+        remote = await self.workers.translate_many([texts[i] for i in send], target_lang, source_lang)
+        missing = [i for i, translated in zip(send, remote) if translated is None]
+        for i, translated in zip(send, remote):
+            if translated is not None:
+                results[i] = translated
+        if missing:
+            self.worker_fallbacks += len(missing)
+            local = await self._translate_local([texts[i] for i in missing], target_lang, source_lang)
+            for i, translated in zip(missing, local):
+                results[i] = translated
+        return results
+
+    async def _translate_local(self, texts: List[str], target_lang: str, source_lang: str) -> List[str]:
+        if self.segmenter is None:
+            return await self._translate_cached(texts, target_lang, source_lang)
+        # Cache and translate sentence segments; segments shared between
+        # messages (or repeated in one) are looked up and sent only once.
+        plans: List[List[Any]] = []
+        keys: Dict[str, None] = {}
+        for text in texts:
+            parts = self.segmenter.split(text)
+            plans.append(parts)
+            for part in parts:
+                if isinstance(part, tuple):
+                    keys[part[0]] = None
+        unique = list(keys)
+        translated = dict(zip(unique, await self._translate_cached(unique, target_lang, source_lang)))
+        return [self.segmenter.join(parts, translated) for parts in plans]
+
+    async def _translate_cached(self, texts: List[str], target_lang: str, source_lang: str) -> List[str]:
+        results: List[Optional[str]] = [None] * len(texts)
+        waiting: Dict[int, asyncio.Future] = {}
+        misses: Dict[str, List[int]] = {}
+        for i, text in enumerate(texts):
+            key = (text, target_lang)
+            cached = await self.cache.get(key)
+            if cached is not None:
+                results[i] = cached
+            elif text in misses:
+                misses[text].append(i)
+            elif key in self.inflight:
+                # Single-flight: identical concurrent requests share one upstream call.
+                self.coalesced += 1
+                waiting[i] = self.inflight[key]
+            else:
+                misses[text] = [i]
+
+        # The cache lookups above may have awaited the disk tier; a concurrent
+        # caller can have started fetching one of our misses in the meantime.
+        for text in [t for t in misses if (t, target_lang) in self.inflight]:
+            self.coalesced += 1
+            for i in misses.pop(text):
+                waiting[i] = self.inflight[(text, target_lang)]
+
+        if misses:
+            loop = asyncio.get_running_loop()
+            futures = {}
+            for text in misses:
+                futures[text] = self.inflight[(text, target_lang)] = loop.create_future()
+            fetched: Dict[str, Optional[str]] = {}
+            try:
+                fetched = await self._fetch_texts(list(misses), target_lang, source_lang)
+                for text, translated in fetched.items():
+                    if translated is not None:
+                        self.cache.put((text, target_lang), translated)
+            finally:
+                for text, future in futures.items():
+                    del self.inflight[(text, target_lang)]
+                    if not future.done():
+                        future.set_result(fetched.get(text))
+            for text, indexes in misses.items():
+                for i in indexes:
+                    results[i] = fetched.get(text)
+
+        for i, future in waiting.items():
+            results[i] = await asyncio.shield(future)
+
+        return [text if translated is None else translated for text, translated in zip(texts, results)]
+
+    async def _fetch_texts(self, texts: List[str], target_lang: str, source_lang: str) -> Dict[str, Optional[str]]:
+        if len(texts) == 1:
+            translated = await self._fetch(texts[0], target_lang, source_lang)
+            return {texts[0]: translated if isinstance(translated, str) else None}
+        translated = await self._fetch(texts, target_lang, source_lang)
+        if not isinstance(translated, list):
+            return {}
+        self.batched_requests += 1
+        self.batched_texts += len(texts)
+        return {text: (t if isinstance(t, str) else None) for text, t in zip(texts, translated)}
+
+    async def _fetch(self, q, target_lang: str, source_lang: str):
+        await self.start()
+        for attempt in range(self.max_retries + 1):
+            self.requests += 1
+            try:
+                return await self.backends.translate(q, target_lang, source_lang)
+            except AllBackendsFailed as e:
+                if e.throttled and attempt < self.max_retries:
+                    self.throttled += 1
+                    await asyncio.sleep(min(self.backoff_base * (2 ** attempt), self.backoff_max))
+                    continue
+                self.failures += 1
+                await self._report_failure(str(e))
+                return None
+        return None
+
+    async def _report_failure(self, reason: str):
+        now = time.monotonic()
+        if now - self.last_alert < self.alert_interval:
+            return
+        self.last_alert = now
+        print(f"Translation failed on every backend ({self.failures} failures so far): {reason}")
+        if self.alert is None:
+            return
+        try:
+            await self.alert(f"⚠ Translation failed on every backend ({self.failures} failures so far): {reason[:1500]}")
+        except Exception as e:
+            print(f"Could not report translation failure: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "throttled": self.throttled,
+            "failures": self.failures,
+            "rate_limit_waits": sum(
+                b.bucket.waits for b in self.backends.backends if isinstance(b, LibreTranslateBackend)
+            ),
+            "hedges": self.backends.hedges,
+            "inflight": len(self.inflight),
+            "batched_requests": self.batched_requests,
+            "requests_saved": self.batched_texts - self.batched_requests,
+            "worker_fallbacks": self.worker_fallbacks,
+        }
+
+
+translator = Translator(TranslationCache(
+    state.store,
+    max_bytes=CONFIG["translation"]["cache_max_bytes"],
+    ttl_seconds=CONFIG["translation"]["cache_ttl_seconds"],
+    disk_max_entries=CONFIG["translation"]["cache_disk_max_entries"],
+    warm_entries=CONFIG["translation"]["cache_warm_entries"],
+), CONFIG["translation"])
+
+# ------------- TRANSLATION WORKERS -------------
+
+class TranslationWorkerError(Exception):
+    pass
+
+
+def read_json_line(line: bytes) -> Dict[str, Any]:
+    return json.loads(line.decode("utf-8"))
+
+
+def json_line(payload: Dict[str, Any]) -> bytes:
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+class TranslationWorker:
+    """One translation child process and the bot's connection to it.
+
+    Requests are newline-delimited JSON tagged with an id, so many can be in
+    flight on the one connection. A supervisor task restarts the process
+    whenever it exits; until it is back, `available` is False.
+    """
+
+    STREAM_LIMIT = 16 * 1024 * 1024
+    CONNECT_TIMEOUT = 30.0
+
+    def __init__(self, index: int, count: int, timeout: float, restart_delay: float):
+        self.index = index
+        self.count = count
+        self.socket_path = os.path.join(DATA_DIR, f"translator-{index}.sock")
+        self.timeout = timeout
+        self.restart_delay = restart_delay
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.next_id = 0
+        self.closing = False
+        self._supervisor: Optional[asyncio.Task] = None
+
+        self.requests = 0
+        self.failures = 0
+        self.restarts = 0
+
+    @property
+    def available(self) -> bool:
+        return self.writer is not None
+
+    def start(self):
+        if self._supervisor is None:
+            self._supervisor = asyncio.create_task(self._supervise())
+
+    async def _supervise(self):
+        while not self.closing:
+            try:
+                await self._spawn()
+                await self._read_loop()
+            except Exception as e:
+                print(f"Translation worker {self.index} failed: {e}")
+            if self.closing:
+                return  # close() lets the process exit on its own
+            self._disconnect("worker connection lost")
+            if self.process is not None and self.process.returncode is None:
+                self.process.kill()
+                await self.process.wait()
+            self.restarts += 1
+            print(f"Translation worker {self.index} is down; translating in-process, restarting in {self.restart_delay:.0f}s.")
+            await asyncio.sleep(self.restart_delay)
+
+    async def _spawn(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        # The worker exits when its stdin closes, so it never outlives the bot.
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__),
+            "--translation-worker", self.socket_path, str(self.count),
+            stdin=asyncio.subprocess.PIPE,
+        )
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.CONNECT_TIMEOUT
+        while True:
+            if self.process.returncode is not None:
+                raise TranslationWorkerError(f"exited with status {self.process.returncode} during startup")
+            try:
+                self.reader, self.writer = await asyncio.open_unix_connection(
+                    self.socket_path, limit=self.STREAM_LIMIT
+                )
+                return
+            except (FileNotFoundError, ConnectionRefusedError):
+                if loop.time() > deadline:
+                    raise TranslationWorkerError("did not start listening in time")
+                await asyncio.sleep(0.1)
+
+    async def _read_loop(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                return
+            reply = read_json_line(line)
+            future = self.pending.pop(reply["id"], None)
+            if future is None or future.done():
+                continue
+            if "error" in reply:
+                future.set_exception(TranslationWorkerError(reply["error"]))
+            else:
+                future.set_result(reply["result"])
+
+    def _disconnect(self, reason: str):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        pending, self.pending = self.pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(TranslationWorkerError(reason))
+
+    async def call(self, op: str, timeout: Optional[float] = None, **payload) -> Any:
+        if self.writer is None:
+            raise TranslationWorkerError("worker is not running")
+        self.next_id += 1
+        request_id = self.next_id
+        future = self.pending[request_id] = asyncio.get_running_loop().create_future()
+        self.requests += 1
+        try:
+            self.writer.write(json_line({"id": request_id, "op": op, **payload}))
+            await self.writer.drain()
+            return await asyncio.wait_for(future, timeout or self.timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            self.failures += 1
+            raise TranslationWorkerError(f"{type(e).__name__}: {e}") from e
+        except TranslationWorkerError:
+            self.failures += 1
+            raise
+        finally:
+            self.pending.pop(request_id, None)
+
+    async def close(self):
+        self.closing = True
+        self._disconnect("shutting down")
+        if self.process is not None and self.process.returncode is None:
+            self.process.stdin.close()
+            try:
+                await asyncio.wait_for(self.process.wait(), 10)
+            except asyncio.TimeoutError:
+                self.process.kill()
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            await asyncio.gather(self._supervisor, return_exceptions=True)
+
+
+class TranslationWorkerPool:
+    """Routes translations to worker processes by text, so each worker's cache
+    holds its own share of the keys."""
+
+    def __init__(self, settings: Dict[str, Any]):
+        count = settings["worker_processes"]
+        if count and not hasattr(socket, "AF_UNIX"):
+            print("Translation workers need Unix sockets; translating in-process.")
+            count = 0
+        self.workers = [
+            TranslationWorker(i, count, settings["worker_request_timeout_seconds"], settings["worker_restart_seconds"])
+            for i in range(count)
+        ]
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.workers)
+
+    def available(self) -> bool:
+        return any(w.available for w in self.workers)
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    async def translate_many(self, texts: List[str], target_lang: str, source_lang: str) -> List[Optional[str]]:
+        """Translations in order, None where the owning worker failed."""
+        live = [w for w in self.workers if w.available]
+        if not live:
+            return [None] * len(texts)
+        groups: Dict[int, List[int]] = {}
+        for i, text in enumerate(texts):
+            groups.setdefault(hash(text) % len(live), []).append(i)
+        results: List[Optional[str]] = [None] * len(texts)
+
+        async def send(worker: TranslationWorker, indexes: List[int]):
+            try:
+                translated = await worker.call(
+                    "translate", texts=[texts[i] for i in indexes], target=target_lang, source=source_lang
+                )
+            except TranslationWorkerError as e:
+                print(f"Translation worker {worker.index} request failed: {e}")
+                return
+            for i, value in zip(indexes, translated):
+                results[i] = value
+
+        await asyncio.gather(*(send(live[n], indexes) for n, indexes in groups.items()))
+        return results
+
+    async def remote_stats(self) -> Dict[str, Any]:
+        """Translator and cache counters summed over the live workers."""
+        async def fetch(worker: TranslationWorker):
+            try:
+                return await worker.call("stats", timeout=2.0)
+            except TranslationWorkerError:
+                return None
+
+        replies = [r for r in await asyncio.gather(*(fetch(w) for w in self.workers if w.available)) if r]
+        totals: Dict[str, Any] = {}
+        for reply in replies:
+            for section in ("translator", "cache"):
+                for key, value in reply[section].items():
+                    if isinstance(value, (int, float)) and key != "hit_ratio":
+                        totals[key] = totals.get(key, 0) + value
+        lookups = totals.get("hits", 0) + totals.get("disk_hits", 0) + totals.get("misses", 0)
+        totals["hit_ratio"] = (totals.get("hits", 0) + totals.get("disk_hits", 0)) / lookups if lookups else 0.0
+        return totals
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self.workers),
+            "alive": sum(w.available for w in self.workers),
+            "requests": sum(w.requests for w in self.workers),
+            "failures": sum(w.failures for w in self.workers),
+            "restarts": sum(w.restarts for w in self.workers),
+        }
+
+    async def close(self):
+        await asyncio.gather(*(w.close() for w in self.workers))
+
+
+translation_workers = TranslationWorkerPool(CONFIG["translation"])
+translator.workers = translation_workers if translation_workers.enabled else None
+
+
+async def serve_translation_worker(socket_path: str, count: int):
+    """Entry point of a worker process: a Translator behind a Unix socket."""
+    # Each worker gets an equal share of the upstream limits and cache memory.
+    settings = dict(CONFIG["translation"])
+    settings["backends"] = [dict(entry) for entry in settings["backends"]]
+    for entry in settings["backends"]:
+        if "rate_per_second" in entry:
+            entry["rate_per_second"] = entry["rate_per_second"] / count
+        for key in ("burst", "max_concurrency"):
+            if key in entry:
+                entry[key] = max(1, entry[key] // count)
+    store = SqliteStore(DB_FILE)
+    worker_translator = Translator(TranslationCache(
+        store,
+        max_bytes=settings["cache_max_bytes"] // count,
+        ttl_seconds=settings["cache_ttl_seconds"],
+        disk_max_entries=settings["cache_disk_max_entries"],
+        warm_entries=settings["cache_warm_entries"] // count,
+    ), settings)
+    await worker_translator.start()
+
+    async def handle(request: Dict[str, Any]) -> Dict[str, Any]:
+        if request["op"] == "translate":
+            # the parent already ran the prefilter
+            return {"result": await worker_translator.translate_many(
+                request["texts"], request["target"], request["source"], prefiltered=True
+            )}
+        if request["op"] == "stats":
+            return {"result": {"translator": worker_translator.stats(), "cache": worker_translator.cache.stats()}}
+        return {"error": f"unknown op {request['op']!r}"}
+
+    async def client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        async def respond(request: Dict[str, Any]):
+            try:
+                reply = await handle(request)
+            except Exception as e:
+                reply = {"error": f"{type(e).__name__}: {e}"}
+            writer.write(json_line({"id": request["id"], **reply}))
+            await writer.drain()
+
+        tasks_in_flight = set()
+        while line := await reader.readline():
+            task = asyncio.create_task(respond(read_json_line(line)))
+            tasks_in_flight.add(task)
+            task.add_done_callback(tasks_in_flight.discard)
+        writer.close()
+
+    async def flush_cache():
+        while True:
+            await asyncio.sleep(CONFIG["persistence"]["flush_interval_seconds"])
+            await worker_translator.cache.flush()
+
+    server = await asyncio.start_unix_server(client, socket_path, limit=TranslationWorker.STREAM_LIMIT)
+    flusher = asyncio.create_task(flush_cache())
+    # Stop when the bot closes our stdin (or dies).
+    loop = asyncio.get_running_loop()
+    stdin = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(stdin), sys.stdin)
+    await stdin.read()
+
+    server.close()
+    flusher.cancel()
+    await worker_translator.close()
+    await store.run(store.close)
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+# ------------- OUTBOUND LOG QUEUE -------------
+
+class OutboundLog:
+    """Per-channel outbound queue that merges log lines into as few messages as possible."""
+
+    MAX_MESSAGE_CHARS = 2000
+
+    def __init__(self, client: discord.Client, settings: Dict[str, Any]):
+        self.client = client
+        self.flush_interval = settings["flush_interval_seconds"]
+        self.max_lines = settings["max_lines_per_channel"]
+        self.rate = settings["rate_per_second"]
+        self.burst = settings["burst"]
+        self.max_retries = settings["max_retries"]
+        self.lines: Dict[int, deque] = {}
+        self.buckets: Dict[int, TokenBucket] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+        self.posted_lines = 0
+        self.sent_messages = 0
+        self.sent_lines = 0
+        self.dropped = 0
+        self.send_errors = 0
+
+    def post(self, channel_id: int, message: str):
+        lines = self.lines.get(channel_id)
+        if lines is None:
+            lines = self.lines[channel_id] = deque()
+            self.buckets[channel_id] = TokenBucket(self.rate, self.burst)
+        if len(lines) >= self.max_lines:
+            lines.popleft()
+            self.dropped += 1
+            print(f"Log queue for channel {channel_id} is full; dropped the oldest line.")
+        lines.append(message)
+        self.posted_lines += 1
+        if channel_id not in self._tasks:
+            self._tasks[channel_id] = asyncio.create_task(self._drain(channel_id))
+
+    def _take(self, lines: deque) -> tuple:
+        """Build the next message from the front of `lines`. Returns (text, line_count)."""
+        text = ""
+        count = 0
+        for line in lines:
+            if len(line) > self.MAX_MESSAGE_CHARS:
+                line = line[: self.MAX_MESSAGE_CHARS - 1] + "…"
+            if count and len(text) + 1 + len(line) > self.MAX_MESSAGE_CHARS:
+                break
+            text = f"{text}\n{line}" if count else line
+            count += 1
+        return text, count
+
+    async def _drain(self, channel_id: int):
+        try:
+            await asyncio.sleep(self.flush_interval)
+            lines = self.lines[channel_id]
+            while lines:
+                text, count = self._take(lines)
+                # Off the queue before the send: post() drops from the front
+                # when full and must not drop lines already being sent.
+                for _ in range(count):
+                    lines.popleft()
+                await self.buckets[channel_id].acquire()
+                sent = await self._send(channel_id, text)
+                if sent:
+                    self.sent_messages += 1
+                    self.sent_lines += count
+                else:
+                    self.dropped += count
+        finally:
+            del self._tasks[channel_id]
+
+    async def _send(self, channel_id: int, text: str) -> bool:
+        channel = self.client.get_channel(channel_id)
+        if channel is None:
+            print(f"Log channel {channel_id} not found; dropping message.")
+            return False
+        for attempt in range(self.max_retries + 1):
+            try:
+                await channel.send(text)
+                return True
+            except (discord.Forbidden, discord.NotFound) as e:
+                self.send_errors += 1
+                print(f"Cannot post to log channel {channel_id}: {e}")
+                return False
+            except discord.HTTPException as e:
+                self.send_errors += 1
+                if e.status == 429:
+                    self.buckets[channel_id].pause(getattr(e, "retry_after", None) or 1.0)
+                elif e.status < 500:
+                    print(f"Error posting to log channel {channel_id}: {e}")
+                    return False
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.send_errors += 1
+                print(f"Network error posting to log channel {channel_id}: {e}")
+            await asyncio.sleep(min(2 ** attempt, 30))
+        print(f"Giving up on log message for channel {channel_id} after {self.max_retries + 1} attempts.")
+        return False
+
+    async def close(self):
+        # Give pending lines one last chance to go out before shutdown.
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": sum(len(lines) for lines in self.lines.values()),
+            "channels": len(self._tasks),
+            "posted_lines": self.posted_lines,
+            "sent_messages": self.sent_messages,
+            "sent_lines": self.sent_lines,
+            "dropped": self.dropped,
+            "send_errors": self.send_errors,
+        }
+
+# ------------- INACTIVITY INDEX -------------
+
+def parse_last_seen(value: str) -> Optional[float]:
+    """last_seen values are naive UTC ISO strings; return a POSIX timestamp."""
+    try:
+        return datetime.datetime.fromisoformat(value).replace(tzinfo=datetime.timezone.utc).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class InactivityIndex:
+    """Time-bucketed index over last-seen timestamps.
+
+    Members are grouped into hourly buckets by when they were last seen, so
+    finding everyone older than a cutoff only touches the expired buckets
+    instead of every member of every guild.
+    """
+
+    BUCKET_SECONDS = 3600
+
+    def __init__(self):
+        self.seen: Dict[int, float] = {}
+        self.bucket_of: Dict[int, int] = {}
+        self.buckets: Dict[int, set] = {}
+        self._bucket_heap: List[int] = []
+
+    def __len__(self):
+        return len(self.seen)
+
+    def touch(self, uid: int, ts: float):
+        self.seen[uid] = ts
+        bucket = int(ts // self.BUCKET_SECONDS)
+        old = self.bucket_of.get(uid)
+        if old == bucket:
+            return
+        if old is not None:
+            self.buckets[old].discard(uid)
+        self.bucket_of[uid] = bucket
+        members = self.buckets.get(bucket)
+        if members is None:
+            members = self.buckets[bucket] = set()
+            heapq.heappush(self._bucket_heap, bucket)
+        members.add(uid)
+
+    def discard(self, uid: int):
+        self.seen.pop(uid, None)
+        bucket = self.bucket_of.pop(uid, None)
+        if bucket is not None:
+            self.buckets[bucket].discard(uid)
+
+    def expired(self, cutoff: float) -> List[tuple]:
+        """(last_seen, uid) for everyone last seen before `cutoff`, oldest first."""
+        cutoff_bucket = int(cutoff // self.BUCKET_SECONDS)
+        # drop empty buckets from the front of the heap
+        while self._bucket_heap and not self.buckets[self._bucket_heap[0]]:
+            del self.buckets[heapq.heappop(self._bucket_heap)]
+        result = []
+        for bucket in sorted(b for b in self._bucket_heap if b <= cutoff_bucket):
+            for uid in self.buckets[bucket]:
+                ts = self.seen[uid]
+                if ts < cutoff:
+                    result.append((ts, uid))
+        result.sort()
+        return result
+
+    def load(self, last_seen_map: Dict[str, str], now: float):
+        for uid, value in last_seen_map.items():
+            ts = parse_last_seen(value)
+            self.touch(int(uid), ts if ts is not None else now)
+
+# ------------- ACTIVITY STATS -------------
+
+class ActivityRecord:
+    """Per-member ring buffer of daily message counts with running window sums."""
+
+    __slots__ = ("counts", "day", "week", "month")
+
+    RING_DAYS = 32  # covers the 30-day window with room to spare
+
+    def __init__(self, day: int, counts: Optional[array] = None):
+        self.counts = counts if counts is not None else array("H", bytes(2 * self.RING_DAYS))
+        self.day = day
+        self.week = sum(self.counts[(day - i) % self.RING_DAYS] for i in range(7))
+        self.month = sum(self.counts[(day - i) % self.RING_DAYS] for i in range(30))
+
+    @property
+    def today(self) -> int:
+        return self.counts[self.day % self.RING_DAYS]
+
+    def advance(self, day: int):
+        """Move the ring forward to `day`, dropping days that left the windows."""
+        gap = day - self.day
+        if gap <= 0:
+            return
+        ring = self.RING_DAYS
+        if gap >= ring:
+            for i in range(ring):
+                self.counts[i] = 0
+            self.week = self.month = 0
+        else:
+            counts = self.counts
+            for d in range(self.day + 1, day + 1):
+                self.week -= counts[(d - 7) % ring]
+                self.month -= counts[(d - 30) % ring]
+                counts[d % ring] = 0
+        self.day = day
+
+    def add(self, day: int, count: int = 1):
+        """Count messages on `day`; days already outside the 30-day window are ignored."""
+        self.advance(day)
+        age = self.day - day
+        if age >= 30:
+            return
+        slot = day % self.RING_DAYS
+        count = min(count, 0xFFFF - self.counts[slot])
+        if count <= 0:
+            return
+        self.counts[slot] += count
+        if age < 7:
+            self.week += count
+        self.month += count
+
+    def to_bytes(self) -> bytes:
+        return struct.pack("<i", self.day) + self.counts.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ActivityRecord":
+        counts = array("H")
+        counts.frombytes(data[4:])
+        return cls(struct.unpack("<i", data[:4])[0], counts)
+
+
+class ActivityStats:
+    """Daily/weekly/monthly message counts with heap-based top-k queries.
+
+    Each window keeps a max-heap of (-count, uid) entries. A message pushes
+    the member's new counts; entries that no longer match a member's
+    current count are stale and skipped lazily. Counts only drop when the
+    day changes, so the heaps are rebuilt once per day. A top-k query then
+    pops roughly k entries: O(k log n) instead of sorting every member.
+    """
+
+    WINDOWS = ("day", "week", "month")
+
+    def __init__(self):
+        self.records: Dict[str, ActivityRecord] = {}
+        self.heaps: Dict[str, List[tuple]] = {w: [] for w in self.WINDOWS}
+        self.current_day: Optional[int] = None
+
+    @staticmethod
+    def today() -> int:
+        return int(time.time() // 86400)
+
+    @staticmethod
+    def value(record: ActivityRecord, window: str) -> int:
+        if window == "day":
+            return record.today
+        return record.week if window == "week" else record.month
+
+    def attach(self, records: Dict[str, ActivityRecord]):
+        self.records = records
+        self.current_day = None
+
+    def _rollover(self, day: int):
+        if day == self.current_day:
+            return
+        for record in self.records.values():
+            record.advance(day)
+        self._rebuild()
+        self.current_day = day
+
+    def _rebuild(self):
+        for window in self.WINDOWS:
+            heap = [(-self.value(r, window), uid) for uid, r in self.records.items() if self.value(r, window)]
+            heapq.heapify(heap)
+            self.heaps[window] = heap
+
+    def record(self, uid: str, day: Optional[int] = None, count: int = 1):
+        today = self.today()
+        self._rollover(today)
+        record = self.records.get(uid)
+        if record is None:
+            record = self.records[uid] = ActivityRecord(today)
+        record.add(today if day is None else day, count)
+        for window in self.WINDOWS:
+            heapq.heappush(self.heaps[window], (-self.value(record, window), uid))
+        # stale entries pile up between rebuilds; keep the heaps bounded
+        if len(self.heaps["day"]) > 4 * len(self.records) + 1024:
+            self._rebuild()
+
+    def top(self, window: str, k: int, allowed: Optional[set] = None) -> List[tuple]:
+        """[(uid, count)] for the k most active members in `window`, optionally among `allowed`."""
+        self._rollover(self.today())
+        if allowed is not None:
+            candidates = ((uid, self.value(self.records[uid], window)) for uid in allowed if uid in self.records)
+            return [(uid, n) for uid, n in heapq.nlargest(k, candidates, key=lambda x: x[1]) if n]
+
+        heap = self.heaps[window]
+        result: List[tuple] = []
+        seen = set()
+        popped = []
+        while heap and len(result) < k:
+            entry = heapq.heappop(heap)
+            neg, uid = entry
+            record = self.records.get(uid)
+            if record is None or uid in seen or self.value(record, window) != -neg:
+                continue  # stale
+            popped.append(entry)
+            seen.add(uid)
+            result.append((uid, -neg))
+        for entry in popped:
+            heapq.heappush(heap, entry)
+        return result
+
+    def summary(self, uid: str) -> Dict[str, int]:
+        self._rollover(self.today())
+        record = self.records.get(uid)
+        if record is None:
+            return {w: 0 for w in self.WINDOWS}
+        return {w: self.value(record, w) for w in self.WINDOWS}
+
+    def rank(self, uid: str, window: str) -> Optional[int]:
+        mine = self.summary(uid)[window]
+        if not mine:
+            return None
+        return 1 + sum(1 for r in self.records.values() if self.value(r, window) > mine)
+
+
+state.register_codec("activity", ActivityRecord.to_bytes, ActivityRecord.from_bytes)
+activity_stats = ActivityStats()
+
+# ------------- HISTORY BACKFILL -------------
+
+class HistoryBackfill:
+    """Catches activity tracking up on messages sent while the bot was offline.
+
+    Every channel has a checkpoint: the newest message ID already counted,
+    live or by a backfill, kept in the meta table. On startup each text
+    channel's history is read from its checkpoint up to the moment the
+    gateway became ready (anything later arrives live), a few channels at a
+    time, with history pages paced by a token bucket. Authors' last-seen
+    times and message counts are applied one page at a time and the
+    checkpoint advances with each page, so a backfill cut short by a restart
+    resumes where it stopped instead of counting messages twice.
+    """
+
+    META_PREFIX = "backfill:"
+    ONLINE_KEY = "backfill_online_until"
+    PAGE_SIZE = 100  # messages per history request
+
+    def __init__(self, store: SqliteStore, settings: Dict[str, Any]):
+        self.store = store
+        self.settings = settings
+        self.bucket = TokenBucket(settings["pages_per_second"], settings["concurrency"])
+        self.checkpoints: Dict[int, int] = {}
+        self.saved: Dict[int, int] = {}
+        self.live: Dict[int, int] = {}
+        self.done: set = set()
+        self.failed: set = set()  # scans that stopped early; their gap is retried next start
+        self.finished = False
+        # Newest snowflake the bot was online for; the start for channels
+        # that have no checkpoint of their own yet (new or unreadable before).
+        self.online_until: Optional[int] = None
+        self.channels = 0
+        self.pages = 0
+        self.messages = 0
+        self.skipped = 0
+        self.errors = 0
+        self.seconds = 0.0
+
+    async def load(self):
+        rows = await self.store.run(self.store.meta_with_prefix, self.META_PREFIX)
+        self.saved = {int(key[len(self.META_PREFIX):]): int(value) for key, value in rows.items()}
+        self.checkpoints = dict(self.saved)
+        online_until = await self.store.run(self.store.get_meta, self.ONLINE_KEY)
+        self.online_until = int(online_until) if online_until else None
+
+    def note_live(self, channel_id: int, message_id: int):
+        if message_id > self.live.get(channel_id, 0):
+            self.live[channel_id] = message_id
+
+    def checkpoint(self, channel_id: int) -> Optional[int]:
+        checkpoint = self.checkpoints.get(channel_id)
+        # Live messages only count once the history before them is backfilled.
+        if channel_id in self.done or (self.finished and channel_id not in self.failed):
+            live = self.live.get(channel_id)
+            if live is not None and (checkpoint is None or live > checkpoint):
+                return live
+        return checkpoint
+
+    async def flush(self):
+        changed = {}
+        for channel_id in self.checkpoints.keys() | self.live.keys():
+            checkpoint = self.checkpoint(channel_id)
+            if checkpoint is not None and checkpoint != self.saved.get(channel_id):
+                changed[channel_id] = checkpoint
+        items = {f"{self.META_PREFIX}{cid}": str(cp) for cid, cp in changed.items()}
+        if self.finished:
+            items[self.ONLINE_KEY] = str(discord.utils.time_snowflake(discord.utils.utcnow()))
+        if items:
+            await self.store.run(self.store.set_meta_many, items)
+            self.saved.update(changed)
+
+    async def run(self, guilds, until: datetime.datetime, apply: Callable[[Dict[str, float], Dict[str, Dict[int, int]]], None]):
+        """Backfill every readable text channel up to `until`, then let checkpoints follow live traffic."""
+        if not self.settings["enabled"]:
+            self.finished = True
+            return
+        started = time.perf_counter()
+        before = discord.utils.time_snowflake(until)
+        floor = discord.utils.time_snowflake(until - datetime.timedelta(days=self.settings["max_lookback_days"]))
+        semaphore = asyncio.Semaphore(self.settings["concurrency"])
+
+        async def scan(channel: discord.TextChannel):
+            async with semaphore:
+                try:
+                    await self._scan(channel, before, floor, apply)
+                except Exception as e:
+                    # One broken channel must not stop the rest (or the sweep waiting on us).
+                    self.errors += 1
+                    self.failed.add(channel.id)
+                    print(f"Error backfilling #{channel.name}: {type(e).__name__}: {e}")
+
+        await asyncio.gather(*(scan(channel) for guild in guilds for channel in guild.text_channels))
+        self.finished = True
+        self.seconds = time.perf_counter() - started
+        await self.flush()
+        print(f"History backfill: {self.messages} messages from {self.channels} channels "
+              f"({self.pages} pages, {self.skipped} unreadable, {self.errors} errors) in {self.seconds:.1f}s.")
+
+    async def _scan(self, channel: discord.TextChannel, before: int, floor: int, apply):
+        perms = channel.permissions_for(channel.guild.me)
+        if not (perms.read_messages and perms.read_message_history):
+            self.skipped += 1
+            return
+        after = self.checkpoints.get(channel.id, self.online_until)
+        if after is None:
+            # First run with backfill: everything so far was counted live.
+            self.checkpoints[channel.id] = before
+            self.done.add(channel.id)
+            return
+        after = max(after, floor)
+        self.channels += 1
+        seen: Dict[str, float] = {}
+        counts: Dict[str, Dict[int, int]] = {}
+        newest = after
+        in_page = 0
+        try:
+            await self.bucket.acquire()
+            async for message in channel.history(
+                limit=None, after=discord.Object(id=after), before=discord.Object(id=before), oldest_first=True
+            ):
+                newest = message.id
+                in_page += 1
+                if not message.author.bot:
+                    uid = str(message.author.id)
+                    ts = message.created_at.timestamp()
+                    if ts > seen.get(uid, 0.0):
+                        seen[uid] = ts
+                    days = counts.setdefault(uid, {})
+                    day = int(ts // 86400)
+                    days[day] = days.get(day, 0) + 1
+                if in_page == self.PAGE_SIZE:
+                    self._commit(channel.id, newest, in_page, seen, counts, apply)
+                    seen, counts, in_page = {}, {}, 0
+                    await self.bucket.acquire()
+        except discord.HTTPException as e:
+            self.errors += 1
+            self.failed.add(channel.id)
+            print(f"Error backfilling #{channel.name}, resuming from the last page next time: {e}")
+            self._commit(channel.id, newest, in_page, seen, counts, apply)
+            return
+        self._commit(channel.id, max(newest, before), in_page, seen, counts, apply)
+        self.done.add(channel.id)
+
+    def _commit(self, channel_id: int, newest: int, messages: int, seen, counts, apply):
+        if seen:
+            apply(seen, counts)
+        self.pages += 1
+        self.messages += messages
+        if newest > self.checkpoints.get(channel_id, 0):
+            self.checkpoints[channel_id] = newest
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "finished": self.finished,
+            "channels": self.channels,
+            "pages": self.pages,
+            "messages": self.messages,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "seconds": round(self.seconds, 1),
+        }
+
+
+history_backfill = HistoryBackfill(state.store, CONFIG["backfill"])
+
+# ------------- GATEWAY STATS -------------
+
+def current_rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        # peak, not current, but better than nothing off Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        return None
+
+
+class GatewayStats:
+    """Counts gateway events by type so lean and full modes can be compared."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.events: Dict[str, int] = {}
+
+    def record(self, event_type: str):
+        self.events[event_type] = self.events.get(event_type, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        total = sum(self.events.values())
+        top = sorted(self.events.items(), key=lambda kv: kv[1], reverse=True)[:8]
+        return {
+            "uptime_seconds": round(elapsed),
+            "events": total,
+            "events_per_minute": round(total / elapsed * 60, 1),
+            "top": [(name, n, round(n / elapsed * 60, 1)) for name, n in top],
+            "rss_bytes": current_rss_bytes(),
+        }
+
+
+gateway_stats = GatewayStats()
+
+# ------------- GAME SESSIONS -------------
+
+class GameSession:
+    """Base for per-user game state; subclasses add their own slots."""
+
+    __slots__ = ("session_id", "user_id", "expires_at")
+
+    def __init__(self, user_id: int):
+        self.session_id = 0
+        self.user_id = user_id
+        self.expires_at = 0.0
+
+
+class GuessSession(GameSession):
+    __slots__ = ("secret", "guesses")
+
+    def __init__(self, user_id: int, secret: int):
+        super().__init__(user_id)
+        self.secret = secret
+        self.guesses = 0
+
+
+class BlackjackSession(GameSession):
+    # cards are ranks 1-13 (ace..king); small ints are shared objects
+    __slots__ = ("player", "dealer")
+
+    def __init__(self, user_id: int, player: List[int], dealer: List[int]):
+        super().__init__(user_id)
+        self.player = player
+        self.dealer = dealer
+
+
+class GameSessionStore:
+    """In-memory game sessions with a TTL, a per-user cap and a global cap.
+
+    Every touch pushes (expires_at, session_id) onto a heap; entries whose
+    session is gone or was touched again are skipped when popped, and the
+    heap is rebuilt once stale entries outnumber live ones.
+    """
+
+    def __init__(self, settings: Dict[str, Any]):
+        self.ttl = settings["session_ttl_seconds"]
+        self.max_per_user = settings["max_sessions_per_user"]
+        self.max_sessions = settings["max_sessions"]
+        self.sessions: Dict[int, GameSession] = {}
+        self.by_user: Dict[int, List[int]] = {}  # user id -> session ids, oldest first
+        self._expiry: List[tuple] = []
+        self.next_id = 0
+
+        self.created = 0
+        self.completed = 0
+        self.abandoned = 0
+        self.expired = 0
+        self.evicted_user_cap = 0
+        self.evicted_capacity = 0
+
+    def add(self, session: GameSession) -> GameSession:
+        ids = self.by_user.setdefault(session.user_id, [])
+        while len(ids) >= self.max_per_user:
+            self._remove(ids[0])
+            self.evicted_user_cap += 1
+        while len(self.sessions) >= self.max_sessions:
+            self._evict_soonest()
+        self.next_id += 1
+        session.session_id = self.next_id
+        self.sessions[session.session_id] = session
+        self.by_user.setdefault(session.user_id, []).append(session.session_id)
+        self.created += 1
+        self.touch(session)
+        return session
+
+    def touch(self, session: GameSession):
+        session.expires_at = time.monotonic() + self.ttl
+        heapq.heappush(self._expiry, (session.expires_at, session.session_id))
+        if len(self._expiry) > 2 * len(self.sessions) + 64:
+            self._expiry = [(s.expires_at, sid) for sid, s in self.sessions.items()]
+            heapq.heapify(self._expiry)
+
+    def _live(self, session: Optional[GameSession]) -> bool:
+        if session is None:
+            return False
+        if session.expires_at <= time.monotonic():
+            self._remove(session.session_id)
+            self.expired += 1
+            return False
+        return True
+
+    def get(self, session_id: int, user_id: int) -> Optional[GameSession]:
+        session = self.sessions.get(session_id)
+        if session is None or session.user_id != user_id or not self._live(session):
+            return None
+        return session
+
+    def find(self, user_id: int, kind: type) -> Optional[GameSession]:
+        """The user's newest live session of `kind`."""
+        for session_id in reversed(self.by_user.get(user_id, ())):
+            session = self.sessions[session_id]
+            if isinstance(session, kind):
+                return session if self._live(session) else None
+        return None
+
+    def end(self, session: GameSession, finished: bool = True):
+        if self._remove(session.session_id):
+            if finished:
+                self.completed += 1
+            else:
+                self.abandoned += 1
+
+    def _remove(self, session_id: int) -> bool:
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            return False
+        ids = self.by_user[session.user_id]
+        ids.remove(session_id)
+        if not ids:
+            del self.by_user[session.user_id]
+        return True
+
+    def _evict_soonest(self):
+        while self._expiry:
+            expires_at, session_id = heapq.heappop(self._expiry)
+            session = self.sessions.get(session_id)
+            if session is not None and session.expires_at == expires_at:
+                self._remove(session_id)
+                self.evicted_capacity += 1
+                return
+
+    def sweep(self) -> int:
+        """Drop every expired session. Returns how many were dropped."""
+        now = time.monotonic()
+        dropped = 0
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, session_id = heapq.heappop(self._expiry)
+            session = self.sessions.get(session_id)
+            if session is not None and session.expires_at == expires_at:
+                self._remove(session_id)
+                dropped += 1
+        self.expired += dropped
+        return dropped
+
+    def stats(self) -> Dict[str, Any]:
+        active: Dict[str, int] = {}
+        for session in self.sessions.values():
+            name = type(session).__name__
+            active[name] = active.get(name, 0) + 1
+        return {
+            "active": len(self.sessions),
+            "active_by_kind": active,
+            "users": len(self.by_user),
+            "created": self.created,
+            "completed": self.completed,
+            "abandoned": self.abandoned,
+            "expired": self.expired,
+            "evicted_user_cap": self.evicted_user_cap,
+            "evicted_capacity": self.evicted_capacity,
+        }
+
+
+games = GameSessionStore(CONFIG["games"])
+
+# ------------- MESSAGE SEARCH INDEX -------------
+
+class MessageSearchIndex:
+    """Inverted index over recent chat messages and their English translations.
+
+    Messages get consecutive document numbers. Each term maps to an
+    ``array("I")`` of the documents containing it, so postings are sorted by
+    construction and cost four bytes per entry; message, channel and author
+    IDs sit in parallel ``array("Q")`` columns. Adjacent word pairs are
+    posted too, hashed into a fixed number of buckets, so a phrase query only
+    verifies messages that contain all of its pairs. Documents leave the
+    rolling window (`window_hours`, at most `max_messages`) by moving `base`
+    forward, and the dead prefix of the columns and postings is cut off in
+    bulk once it outweighs the live part. Queries intersect postings in
+    windows, newest first, and stop as soon as they have enough results.
+    """
+
+    TOKEN_RE = re.compile(r"\w+")
+    PHRASE_RE = re.compile(r'"([^"]+)"')
+    MAX_TERM_LENGTH = 40
+    PAIR_BUCKETS = 1 << 16
+    SEARCH_CHUNK = 256
+    # translations arrive within seconds; look this many documents back for the message
+    TRANSLATION_LOOKBACK = 10000
+
+    def __init__(self, settings: Dict[str, Any]):
+        self.enabled = settings["enabled"]
+        self.window_ms = int(settings["window_hours"] * 3600 * 1000)
+        self.max_messages = settings["max_messages"]
+        self.postings: Dict[str, array] = {}
+        self.pair_postings: Dict[int, array] = {}
+        self.message_ids = array("Q")
+        self.channel_ids = array("Q")
+        self.author_ids = array("Q")
+        self.texts: List[str] = []
+        self.translations: List[Optional[str]] = []
+        self.offset = 0  # document number of column index 0
+        self.base = 0  # oldest live document
+
+        self.indexed = 0
+        self.evicted = 0
+        self.compactions = 0
+        self.queries = 0
+        self.query_ns = 0
+        self.max_query_ns = 0
+
+    def __len__(self):
+        return self.offset + len(self.message_ids) - self.base
+
+    @classmethod
+    def terms(cls, text: str) -> List[str]:
+        return [t for t in cls.TOKEN_RE.findall(text.casefold()) if len(t) <= cls.MAX_TERM_LENGTH]
+
+    @staticmethod
+    def author_term(author_id: int) -> str:
+        # "@" never comes out of the tokenizer, so this cannot collide with a word
+        return f"@{author_id}"
+
+    @classmethod
+    def pairs(cls, words: List[str]) -> set:
+        return {hash(pair) % cls.PAIR_BUCKETS for pair in zip(words, words[1:])}
+
+    @staticmethod
+    def _post(index: Dict[Any, array], doc: int, keys):
+        for key in keys:
+            postings = index.get(key)
+            if postings is None:
+                postings = index[key] = array("I")
+            if postings and postings[-1] > doc:
+                bisect.insort(postings, doc)  # a late translation of an older message
+            else:
+                postings.append(doc)
+
+    def add(self, message_id: int, channel_id: int, author_id: int, text: str):
+        doc = self.offset + len(self.message_ids)
+        self.message_ids.append(message_id)
+        self.channel_ids.append(channel_id)
+        self.author_ids.append(author_id)
+        self.texts.append(text)
+        self.translations.append(None)
+        words = self.terms(text)
+        self._post(self.postings, doc, set(words) | {self.author_term(author_id)})
+        self._post(self.pair_postings, doc, self.pairs(words))
+        self.indexed += 1
+        self._evict(message_id)
+
+    def add_translation(self, message_id: int, translation: str) -> bool:
+        end = self.offset + len(self.message_ids)
+        for doc in range(end - 1, max(self.base, end - self.TRANSLATION_LOOKBACK) - 1, -1):
+            i = doc - self.offset
+            if self.message_ids[i] == message_id:
+                self.translations[i] = translation
+                original, words = self.terms(self.texts[i]), self.terms(translation)
+                self._post(self.postings, doc, set(words) - set(original))
+                self._post(self.pair_postings, doc, self.pairs(words) - self.pairs(original))
+                return True
+        return False
+
+    def _evict(self, newest_id: int):
+        # snowflakes carry their creation time in ms above bit 22
+        cutoff = ((newest_id >> 22) - self.window_ms) << 22
+        end = self.offset + len(self.message_ids)
+        while self.base < end and (
+            end - self.base > self.max_messages or self.message_ids[self.base - self.offset] < cutoff
+        ):
+            self.base += 1
+            self.evicted += 1
+        dead = self.base - self.offset
+        if dead > 1024 and dead >= end - self.base:
+            self._compact()
+
+    def _compact(self):
+        dead = self.base - self.offset
+        for column in (self.message_ids, self.channel_ids, self.author_ids, self.texts, self.translations):
+            del column[:dead]
+        self.offset = self.base
+        for index in (self.postings, self.pair_postings):
+            for key, postings in list(index.items()):
+                cut = bisect.bisect_left(postings, self.base)
+                if cut == len(postings):
+                    del index[key]
+                elif cut:
+                    del postings[:cut]
+        self.compactions += 1
+
+    def _has_phrases(self, i: int, phrases: List[str]) -> bool:
+        fields = [" " + " ".join(self.terms(f)) + " " for f in (self.texts[i], self.translations[i]) if f]
+        return all(any(phrase in field for field in fields) for phrase in phrases)
+
+    def search(self, query: str, channels: Optional[frozenset] = None, author_id: Optional[int] = None,
+               limit: int = 10) -> List[Dict[str, Any]]:
+        """Newest messages containing every word of `query`, with "quoted phrases" matched in order."""
+        started = time.perf_counter_ns()
+        try:
+            return self._search(query, channels, author_id, limit)
+        finally:
+            elapsed = time.perf_counter_ns() - started
+            self.queries += 1
+            self.query_ns += elapsed
+            self.max_query_ns = max(self.max_query_ns, elapsed)
+
+    def _search(self, query: str, channels: Optional[frozenset], author_id: Optional[int],
+                limit: int) -> List[Dict[str, Any]]:
+        phrase_words = [words for words in map(self.terms, self.PHRASE_RE.findall(query)) if len(words) > 1]
+        keys = [(self.postings, term) for term in set(self.terms(query))]
+        if author_id is not None:
+            keys.append((self.postings, self.author_term(author_id)))
+        for words in phrase_words:
+            keys += [(self.pair_postings, bucket) for bucket in self.pairs(words)]
+        if not keys:
+            return []
+        # [postings, lo, hi]: the live part of each list still ahead of the walk
+        lists = []
+        for index, key in keys:
+            postings = index.get(key)
+            lo = bisect.bisect_left(postings, self.base) if postings is not None else 0
+            if postings is None or lo == len(postings):
+                return []
+            lists.append([postings, lo, len(postings)])
+        lists.sort(key=lambda entry: entry[2] - entry[1])
+        phrases = [" " + " ".join(words) + " " for words in phrase_words]
+
+        results: List[Dict[str, Any]] = []
+        rarest, start, hi = lists.pop(0)
+        chunk = self.SEARCH_CHUNK
+        while hi > start and len(results) < limit:
+            # Intersect a window of the rarest list with the matching ranges
+            # of the others (set operations run in C), newest window first;
+            # windows double so a query with few matches stays linear.
+            lo = max(start, hi - chunk)
+            floor, ceiling = rarest[lo], rarest[hi - 1]
+            window = rarest[lo:hi]
+            docs = set(window) if lists else None
+            for entry in lists:
+                postings = entry[0]
+                first = bisect.bisect_left(postings, floor, entry[1], entry[2])
+                last = bisect.bisect_right(postings, ceiling, first, entry[2])
+                entry[2] = first  # later windows are all older than `floor`
+                if last - first > 8 * len(docs):
+                    # few candidates against a long list: binary-search each one
+                    kept = set()
+                    for doc in docs:
+                        j = bisect.bisect_left(postings, doc, first, last)
+                        if j < last and postings[j] == doc:
+                            kept.add(doc)
+                    docs = kept
+                else:
+                    docs.intersection_update(postings[first:last])
+                if not docs:
+                    break
+            if docs is not None:
+                window = sorted(docs)
+            for doc in reversed(window):
+                d = doc - self.offset
+                if channels is not None and self.channel_ids[d] not in channels:
+                    continue
+                if phrases and not self._has_phrases(d, phrases):
+                    continue
+                results.append({
+                    "message_id": self.message_ids[d],
+                    "channel_id": self.channel_ids[d],
+                    "author_id": self.author_ids[d],
+                    "text": self.texts[d],
+                    "translation": self.translations[d],
+                })
+                if len(results) >= limit:
+                    break
+            hi = lo
+            chunk *= 2
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        postings = sum(len(p) for p in self.postings.values())
+        pair_postings = sum(len(p) for p in self.pair_postings.values())
+        text_bytes = sum(len(t) for t in self.texts) + sum(len(t) for t in self.translations if t)
+        return {
+            "messages": len(self),
+            "terms": len(self.postings),
+            "postings": postings + pair_postings,
+            "approx_bytes": (postings + pair_postings) * 4 + len(self.message_ids) * 24 + text_bytes,
+            "indexed": self.indexed,
+            "evicted": self.evicted,
+            "compactions": self.compactions,
+            "queries": self.queries,
+            "avg_query_us": round(self.query_ns / self.queries / 1000, 1) if self.queries else 0.0,
+            "max_query_us": round(self.max_query_ns / 1000, 1),
+        }
+
+
+search_index = MessageSearchIndex(CONFIG["search"])
+
+# ------------- BOT SETUP -------------
+
+LEAN_GATEWAY = CONFIG["gateway"]["lean"]
+
+
+class InstrumentedCommandTree(app_commands.CommandTree):
+    # Stamp every interaction so on_app_command_completion can time the command.
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        interaction.extras["started"] = time.perf_counter()
+        return True
+
+    async def on_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        command = interaction.command.qualified_name if interaction.command else "unknown"
+        metrics.inc("command_errors", command)
+        await super().on_error(interaction, error)
+
+
+if LEAN_GATEWAY:
+    intents = discord.Intents.none()
+    intents.guilds = True           # channels, roles
+    intents.members = True          # join/leave events and role updates
+    intents.guild_messages = True   # on_message
+    intents.message_content = True  # furnace parsing, translation
+    bot = commands.Bot(
+        command_prefix="!",
+        intents=intents,
+        member_cache_flags=discord.MemberCacheFlags.from_intents(intents),
+        chunk_guilds_at_startup=False,
+        max_messages=None,
+        tree_cls=InstrumentedCommandTree,
+    )
+else:
+    intents = discord.Intents.all()  # ✅ give us all events (members, presences, etc.)
+    bot = commands.Bot(command_prefix="!", intents=intents, tree_cls=InstrumentedCommandTree)
+
+player_ids: Dict[str, str] = {}
+last_seen: Dict[str, str] = {}
+participation: Dict[str, int] = {}
+
+
+outbound_log = OutboundLog(bot, CONFIG["log_queue"])
+inactivity_index = InactivityIndex()
+# user id -> last-seen timestamp already reported by a dry-run sweep
+inactivity_reported: Dict[int, float] = {}
+
+
+async def log_to(channel_id: int, message: str):
+    # Queued and merged with other lines for the same channel; see OutboundLog.
+    outbound_log.post(channel_id, message)
+
+
+async def report_translation_failure(text: str):
+    await log_to(CONFIG["channels"]["bot_errors"], text)
+
+
+translator.alert = report_translation_failure
+
+
+def get_user_language_code(member: discord.Member) -> str:
+    language_by_role = cfg.language_by_role
+    for role in member.roles:
+        code = language_by_role.get(role.id)
+        if code:
+            return code
+    return "en"
+
+
+def get_alliance_name_from_roles(member: discord.Member) -> Optional[str]:
+    alliance_by_role = cfg.alliance_by_role
+    matches = [alliance_by_role[r.id] for r in member.roles if r.id in alliance_by_role]
+    return min(matches)[1] if matches else None
+
+
+# One pass over the text instead of three re.search calls over an upper-cased copy.
+FURNACE_RE = re.compile(r"\bF(C?)(\d{1,2})\b|FURNACE\s*(\d{1,2})", re.IGNORECASE)
+
+
+def furnace_level_from_text(text: str) -> Optional[str]:
+    # Same precedence as before: the first "F<n>" decides if it is in range,
+    # then the first "FC<n>", then the first "FURNACE <n>".
+    if "f" not in text and "F" not in text:
+        return None
+    fc = furnace = None
+    seen_f = False
+    for m in FURNACE_RE.finditer(text):
+        if m.group(3) is not None:
+            if furnace is None:
+                furnace = int(m.group(3))
+        elif m.group(1):
+            if fc is None:
+                fc = int(m.group(2))
+        elif not seen_f:
+            seen_f = True
+            n = int(m.group(2))
+            if 1 <= n <= 30:
+                return f"F{n}"
+    if fc is not None and 1 <= fc <= 10:
+        return f"FC{fc}"
+    if furnace is not None and 1 <= furnace <= 30:
+        return f"F{furnace}"
+    return None
+
+
+def chunk_lines(lines: List[str], limit: int = 2000) -> List[str]:
+    """Join lines into as few messages as possible, each at most `limit` characters."""
+    chunks: List[str] = []
+    current = ""
+    for line in lines:
+        if len(line) > limit:
+            line = line[: limit - 1] + "…"
+        if current and len(current) + 1 + len(line) > limit:
+            chunks.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+    if current:
+        chunks.append(current)
+    return chunks
+
+# ------------- AUTO-TRANSLATE QUEUE + BATCHING -------------
+
+class WorkQueue:
+    """Bounded background work queue served by a fixed pool of worker tasks."""
+
+    OVERFLOW_POLICIES = ("drop_oldest", "skip")
+
+    def __init__(self, name: str, workers: int, maxsize: int, overflow: str = "drop_oldest"):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow!r} for {name} queue")
+        self.name = name
+        self.worker_count = workers
+        self.overflow = overflow
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self._workers: List[asyncio.Task] = []
+
+        self.submitted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, job: Callable[[], Awaitable[Any]]) -> bool:
+        """Queue `job` without waiting. Returns False if it was dropped."""
+        self.start()
+        self.submitted += 1
+        if self.queue.full():
+            self.dropped += 1
+            if self.overflow == "skip":
+                return False
+            self.queue.get_nowait()
+            self.queue.task_done()
+        self.queue.put_nowait((time.monotonic(), job))
+        return True
+
+    async def _worker(self):
+        while True:
+            enqueued_at, job = await self.queue.get()
+            wait = time.monotonic() - enqueued_at
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            try:
+                await job()
+            except Exception as e:
+                self.errors += 1
+                print(f"Error in {self.name} queue job: {e}")
+            finally:
+                self.processed += 1
+                self.queue.task_done()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": self.queue.qsize(),
+            "max_depth": self.queue.maxsize,
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "avg_wait_ms": round(self.total_wait / self.processed * 1000, 1) if self.processed else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+        }
+
+
+translation_queue = WorkQueue(
+    "translation",
+    workers=CONFIG["translation"]["queue_workers"],
+    maxsize=CONFIG["translation"]["queue_max_depth"],
+    overflow=CONFIG["translation"]["queue_overflow"],
+)
+
+
+class TranslationBatcher:
+    """Collects auto-translate messages per channel and translates them together.
+
+    Each channel's batch is handed to the work queue when its window expires or
+    it reaches the item/char limit, so a message waits at most `window` seconds
+    before it is queued. Each batch makes one upstream request; its log lines
+    are merged into as few messages as possible by the outbound log queue.
+    """
+
+    def __init__(self, translator: Translator, queue: WorkQueue, window: float, max_items: int, max_chars: int):
+        self.translator = translator
+        self.queue = queue
+        self.window = window
+        self.max_items = max_items
+        self.max_chars = max_chars
+        # channel_id -> [(author, lang, text, message_id)]
+        self.pending: Dict[int, List[tuple]] = {}
+        self.pending_chars: Dict[int, int] = {}
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+
+        self.batches = 0
+        self.items = 0
+        self.log_lines = 0
+
+    def add(self, channel_id: int, author: str, lang: str, text: str, message_id: int):
+        items = self.pending.setdefault(channel_id, [])
+        items.append((author, lang, text, message_id))
+        self.pending_chars[channel_id] = self.pending_chars.get(channel_id, 0) + len(text)
+        if len(items) >= self.max_items or self.pending_chars[channel_id] >= self.max_chars:
+            self._fire(channel_id)
+        elif channel_id not in self._timers:
+            self._timers[channel_id] = asyncio.get_running_loop().call_later(self.window, self._fire, channel_id)
+
+    def _fire(self, channel_id: int):
+        timer = self._timers.pop(channel_id, None)
+        if timer:
+            timer.cancel()
+        items = self.pending.pop(channel_id, None)
+        self.pending_chars.pop(channel_id, None)
+        if items:
+            self.queue.submit(functools.partial(self._flush, channel_id, items))
+
+    async def _flush(self, channel_id: int, items: List[tuple]):
+        try:
+            # queue_translation already ran the prefilter on every item
+            translated = await self.translator.translate_many(
+                [text for _, _, text, _ in items], target_lang="en", prefiltered=True
+            )
+            lines = []
+            for (author, lang, text, message_id), tr in zip(items, translated):
+                if tr != text:
+                    lines.append(f"🌐 {author} in <#{channel_id}> (lang {lang}) → EN: {tr}")
+                    search_index.add_translation(message_id, tr)
+            self.batches += 1
+            self.items += len(items)
+            for line in lines:
+                await log_to(CONFIG["channels"]["translation_log"], line)
+            self.log_lines += len(lines)
+        except Exception as e:
+            print(f"Error in auto-translate batch for channel {channel_id}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "pending": sum(len(items) for items in self.pending.values()),
+            "log_lines": self.log_lines,
+        }
+
+
+translation_batcher = TranslationBatcher(
+    translator,
+    translation_queue,
+    window=CONFIG["translation"]["batch_window_seconds"],
+    max_items=CONFIG["translation"]["batch_max_items"],
+    max_chars=CONFIG["translation"]["batch_max_chars"],
+)
+
+# ------------- ANNOUNCEMENT BROADCAST -------------
+
+class AnnouncementBroadcaster:
+    """Translates one text into every configured language at once and posts
+    the results as embeds, packed into as few messages as Discord allows."""
+
+    MAX_EMBEDS_PER_MESSAGE = 10
+    MAX_CHARS_PER_MESSAGE = 6000
+    MAX_DESCRIPTION = 4096
+
+    def __init__(self, translator: Translator, concurrency: int):
+        self.translator = translator
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+        self.broadcasts = 0
+        self.translations = 0
+        self.messages_sent = 0
+        self.total_seconds = 0.0
+
+    async def translate_all(self, text: str) -> List[tuple]:
+        """(label, translated) per target language, skipping ones that came back unchanged."""
+        async def one(code: str) -> str:
+            async with self.semaphore:
+                return await self.translator.translate(text, target_lang=code)
+
+        languages = cfg.broadcast_languages
+        results = await asyncio.gather(*(one(code) for code, _ in languages), return_exceptions=True)
+        translated = []
+        for (code, label), result in zip(languages, results):
+            if isinstance(result, Exception):
+                print(f"Broadcast translation into {code} failed: {result}")
+            elif result != text:
+                translated.append((label, result))
+        self.translations += len(languages)
+        return translated
+
+    def pack(self, items: List[tuple]) -> List[List[discord.Embed]]:
+        messages: List[List[discord.Embed]] = []
+        chars = 0
+        for label, translated in items:
+            if len(translated) > self.MAX_DESCRIPTION:
+                translated = translated[: self.MAX_DESCRIPTION - 1] + "…"
+            size = len(label) + len(translated)
+            if not messages or len(messages[-1]) >= self.MAX_EMBEDS_PER_MESSAGE or chars + size > self.MAX_CHARS_PER_MESSAGE:
+                messages.append([])
+                chars = 0
+            messages[-1].append(discord.Embed(title=label, description=translated, color=discord.Color.blurple()))
+            chars += size
+        return messages
+
+    async def broadcast(self, channel: discord.abc.Messageable, text: str, header: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        items = await self.translate_all(text)
+        packed = self.pack(items)
+        for i, embeds in enumerate(packed):
+            await channel.send(content=header if i == 0 else None, embeds=embeds)
+        elapsed = time.perf_counter() - started
+        self.broadcasts += 1
+        self.messages_sent += len(packed)
+        self.total_seconds += elapsed
+        return {"languages": len(items), "messages": len(packed), "seconds": round(elapsed, 2)}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "broadcasts": self.broadcasts,
+            "translations": self.translations,
+            "messages_sent": self.messages_sent,
+            "avg_seconds": round(self.total_seconds / self.broadcasts, 2) if self.broadcasts else 0.0,
+        }
+
+
+broadcaster = AnnouncementBroadcaster(translator, CONFIG["broadcast"]["concurrency"])
+# Separate from translation_queue so chat bursts and announcements never
+# evict each other, and a slow broadcast never holds an auto-translate worker.
+broadcast_queue = WorkQueue("broadcast", workers=1, maxsize=CONFIG["broadcast"]["queue_max_depth"], overflow="skip")
+
+# ------------- MESSAGE PIPELINE -------------
+
+class MessageStage:
+    __slots__ = ("name", "handler", "channels", "predicate", "calls", "errors", "total_ns", "max_ns")
+
+    def __init__(self, name: str, handler, channels, predicate):
+        self.name = name
+        self.handler = handler
+        self.channels = channels
+        self.predicate = predicate
+        self.calls = 0
+        self.errors = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+
+class MessagePipeline:
+    """Runs only the message stages that apply to a message's channel.
+
+    A stage registers with `channels`, a function of the compiled config that
+    returns the channel IDs it cares about, and/or a `predicate` on the
+    message. Stages without either run for every message. Routes are built
+    per channel once and rebuilt whenever the config is reloaded, so dispatch
+    is a single dict lookup.
+    """
+
+    def __init__(self):
+        self.stages: List[MessageStage] = []
+        self._routes: Dict[int, tuple] = {}
+        self._default_route: tuple = ()
+        self._routes_for: Optional[CompiledConfig] = None
+
+    def stage(self, name: str, channels: Optional[Callable[[CompiledConfig], Any]] = None,
+              predicate: Optional[Callable[[discord.Message], bool]] = None):
+        def decorator(handler):
+            self.stages.append(MessageStage(name, handler, channels, predicate))
+            self._routes_for = None
+            return handler
+        return decorator
+
+    def _build_routes(self):
+        routes: Dict[int, List[MessageStage]] = {}
+        default: List[MessageStage] = []
+        for stage in self.stages:
+            if stage.channels is None:
+                default.append(stage)
+                for route in routes.values():
+                    route.append(stage)
+                continue
+            for channel_id in stage.channels(cfg):
+                if channel_id:
+                    routes.setdefault(channel_id, list(default)).append(stage)
+        self._routes = {cid: tuple(route) for cid, route in routes.items()}
+        self._default_route = tuple(default)
+        self._routes_for = cfg
+
+    async def run(self, message: discord.Message):
+        if self._routes_for is not cfg:
+            self._build_routes()
+        for stage in self._routes.get(message.channel.id, self._default_route):
+            if stage.predicate is not None and not stage.predicate(message):
+                continue
+            started = time.perf_counter_ns()
+            try:
+                await stage.handler(message)
+            except Exception as e:
+                stage.errors += 1
+                print(f"Error in {stage.name} message stage: {e}")
+            elapsed = time.perf_counter_ns() - started
+            stage.calls += 1
+            stage.total_ns += elapsed
+            if elapsed > stage.max_ns:
+                stage.max_ns = elapsed
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "stage": stage.name,
+                "calls": stage.calls,
+                "errors": stage.errors,
+                "avg_us": round(stage.total_ns / stage.calls / 1000, 1) if stage.calls else 0.0,
+                "max_us": round(stage.max_ns / 1000, 1),
+            }
+            for stage in self.stages
+        ]
+
+
+message_pipeline = MessagePipeline()
+
+# ------------- GIFT CODE REDEMPTION -------------
+
+class TransientRedeemError(Exception):
+    """The endpoint asked us to retry later (rate limited, timeout, 5xx)."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class GiftCodeEndpoint:
+    """Redeems one code for one player ID. Subclass to talk to a different API."""
+
+    async def redeem(self, session: aiohttp.ClientSession, player_id: str, code: str) -> str:
+        raise NotImplementedError
+
+
+class HttpGiftCodeEndpoint(GiftCodeEndpoint):
+    """Form-encoded redemption API in the style of the Whiteout Survival gift-code site."""
+
+    # upper-cased substrings of the response `msg` -> result status
+    MESSAGES = (
+        ("SUCCESS", "redeemed"),
+        ("RECEIVED", "already_claimed"),
+        ("SAME TYPE EXCHANGE", "already_claimed"),
+        ("TIME ERROR", "expired"),
+        ("EXPIRED", "expired"),
+        ("USED", "expired"),
+        ("CDK NOT FOUND", "invalid_code"),
+        ("ROLE NOT EXIST", "invalid_id"),
+        ("NOT LOGIN", "invalid_id"),
+        ("TIMEOUT RETRY", "retry"),
+    )
+
+    def __init__(self, url: str, sign_secret: str = ""):
+        self.url = url
+        self.sign_secret = sign_secret
+
+    def _form(self, player_id: str, code: str) -> Dict[str, str]:
+        form = {"fid": player_id, "cdk": code, "time": str(int(time.time() * 1000))}
+        if self.sign_secret:
+            payload = "&".join(f"{k}={form[k]}" for k in sorted(form))
+            form["sign"] = hashlib.md5((payload + self.sign_secret).encode("utf-8")).hexdigest()
+        return form
+
+    async def redeem(self, session: aiohttp.ClientSession, player_id: str, code: str) -> str:
+        try:
+            async with session.post(self.url, data=self._form(player_id, code), timeout=15) as resp:
+                if resp.status == 429 or resp.status >= 500:
+                    raise TransientRedeemError(
+                        f"HTTP {resp.status}", parse_retry_after(resp.headers.get("Retry-After"))
+                    )
+                if resp.status >= 400:
+                    print(f"Gift code endpoint answered HTTP {resp.status} for {player_id}.")
+                    return "error"
+                data = await resp.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise TransientRedeemError(str(e) or type(e).__name__)
+        except ValueError as e:
+            print(f"Gift code endpoint sent a body that is not JSON for {player_id}: {e}")
+            return "error"
+        if not isinstance(data, dict):
+            print(f"Gift code endpoint sent unexpected JSON for {player_id}: {str(data)[:200]}")
+            return "error"
+        msg = str(data.get("msg", "")).upper()
+        for needle, status in self.MESSAGES:
+            if needle in msg:
+                if status == "retry":
+                    raise TransientRedeemError(msg)
+                return status
+        return "error"
+
+
+class GiftCodeRedeemer:
+    """Applies a gift code to every registered player ID.
+
+    Runs with bounded concurrency behind a token bucket, retries transient
+    failures with jittered backoff, and journals each result in SQLite so a
+    run interrupted by a restart resumes where it stopped.
+    """
+
+    FINAL_STATUSES = ("redeemed", "already_claimed", "invalid_id", "expired", "invalid_code", "error")
+    # statuses that mean the code itself is dead; no point trying other IDs
+    CODE_LEVEL_STATUSES = ("expired", "invalid_code")
+
+    def __init__(self, store: SqliteStore, endpoint: Optional[GiftCodeEndpoint], settings: Dict[str, Any]):
+        self.store = store
+        self.endpoint = endpoint
+        self.concurrency = settings["concurrency"]
+        self.bucket = TokenBucket(settings["rate_per_second"], settings["burst"])
+        self.max_retries = settings["max_retries"]
+        self.backoff_base = settings["backoff_base_seconds"]
+        self.progress_every = settings["progress_every"]
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.running: set = set()
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    async def _redeem_one(self, player_id: str, code: str) -> str:
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            try:
+                return await self.endpoint.redeem(self.session, player_id, code)
+            except TransientRedeemError as e:
+                if e.retry_after:
+                    self.bucket.pause(e.retry_after)
+                if attempt == self.max_retries:
+                    print(f"Giving up on gift code {code} for {player_id}: {e}")
+                    return "error"
+            except Exception as e:
+                # One bad response must not abort the run and strand the other workers.
+                print(f"Error redeeming gift code {code} for {player_id}: {e}")
+                return "error"
+            # full jitter so retries from all workers do not line up
+            await asyncio.sleep(random.uniform(0, self.backoff_base * (2 ** attempt)))
+        return "error"
+
+    async def run(self, code: str, log_channel_id: int) -> Optional[Dict[str, Any]]:
+        if code in self.running:
+            return None
+        self.running.add(code)
+        try:
+            return await self._run(code, log_channel_id)
+        finally:
+            self.running.discard(code)
+
+    async def _run(self, code: str, log_channel_id: int) -> Dict[str, Any]:
+        if self.session is None:
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.concurrency))
+
+        done = await self.store.run(self.store.giftcode_done, code)
+        todo = sorted({pid for pid in player_ids.values() if pid and pid not in done})
+        await self.store.run(self.store.giftcode_start, code)
+        if done:
+            await log_to(log_channel_id, f"🎁 Resuming gift code `{code}`: {len(done)} IDs already done, {len(todo)} to go.")
+
+        counts: Dict[str, int] = {status: 0 for status in self.FINAL_STATUSES}
+        journal: List[tuple] = []
+        queue: deque = deque(todo)
+        aborted: Optional[str] = None
+        started = time.monotonic()
+
+        async def flush_progress():
+            rows = journal[:]
+            journal.clear()
+            await self.store.run(self.store.giftcode_record, rows)
+            processed = sum(counts.values())
+            await log_to(
+                log_channel_id,
+                f"🎁 `{code}`: {processed}/{len(todo)} — "
+                + ", ".join(f"{status} {n}" for status, n in counts.items() if n)
+            )
+
+        async def worker():
+            nonlocal aborted
+            while queue and aborted is None:
+                player_id = queue.popleft()
+                status = await self._redeem_one(player_id, code)
+                counts[status] += 1
+                journal.append((code, player_id, status, time.time()))
+                if status in self.CODE_LEVEL_STATUSES:
+                    aborted = status
+                if len(journal) >= self.progress_every:
+                    await flush_progress()
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(todo)) or 1)))
+        if journal or not todo:
+            await flush_progress()
+        # An aborted run is finished too: the code is dead for everyone.
+        await self.store.run(self.store.giftcode_finish, code)
+
+        elapsed = time.monotonic() - started
+        processed = sum(counts.values())
+        return {
+            "code": code,
+            "processed": processed,
+            "previously_done": len(done),
+            "counts": counts,
+            "aborted": aborted,
+            "seconds": round(elapsed, 2),
+            "per_second": round(processed / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+
+giftcode_redeemer = GiftCodeRedeemer(
+    state.store,
+    HttpGiftCodeEndpoint(CONFIG["giftcodes"]["endpoint_url"], CONFIG["giftcodes"]["sign_secret"])
+    if CONFIG["giftcodes"]["endpoint_url"] else None,
+    CONFIG["giftcodes"],
+)
+
+# ------------- VERIFICATION UI (BUTTON + MODAL) -------------
 
+class StepStats:
+    """Per-step latency and failure counts for a multi-step flow."""
 
-def get_user_language_code(member: discord.Member) -> str:
-    for role in member.roles:
-        if role.id in CONFIG["language_roles"]:
-            return CONFIG["language_roles"][role.id]
-    return "en"
+    def __init__(self):
+        self.steps: Dict[str, List[float]] = {}  # name -> [count, failures, total_s, max_s]
 
+    async def timed(self, name: str, coro) -> Optional[BaseException]:
+        """Await `coro`, record how long it took, and return its exception (or None)."""
+        started = time.perf_counter()
+        error = None
+        try:
+            await coro
+        except Exception as e:
+            error = e
+        elapsed = time.perf_counter() - started
+        entry = self.steps.setdefault(name, [0, 0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += error is not None
+        entry[2] += elapsed
+        entry[3] = max(entry[3], elapsed)
+        return error
 
-def get_alliance_name_from_roles(member: discord.Member) -> Optional[str]:
-    role_map = CONFIG["alliance_name_to_role_key"]
-    for name, key in role_map.items():
-        role_id = CONFIG["roles"].get(key)
-        if role_id and any(r.id == role_id for r in member.roles):
-            return name
-    return None
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {
+                "count": count,
+                "failures": failures,
+                "avg_ms": round(total / count * 1000, 1) if count else 0.0,
+                "max_ms": round(peak * 1000, 1),
+            }
+            for name, (count, failures, total, peak) in self.steps.items()
+        }
 
 
-def furnace_level_from_text(text: str) -> Optional[str]:
-    text = text.upper()
-    m = re.search(r"\bF(\d{1,2})\b", text)
-    if m:
-        n = int(m.group(1))
-        if 1 <= n <= 30:
-            return f"F{n}"
-    m = re.search(r"\bFC(\d{1,2})\b", text)
-    if m:
-        n = int(m.group(1))
-        if 1 <= n <= 10:
-            return f"FC{n}"
-    m = re.search(r"FURNACE\s*(\d{1,2})", text)
-    if m:
-        n = int(m.group(1))
-        if 1 <= n <= 30:
-            return f"F{n}"
-    return None
+verification_stats = StepStats()
 
-# ------------- VERIFICATION UI (BUTTON + MODAL) -------------
 
 class VerificationModal(discord.ui.Modal, title="PapaMike Server Application"):
     server_number = discord.ui.TextInput(
@@ -312,48 +3875,35 @@ class VerificationModal(discord.ui.Modal, title="PapaMike Server Application"):
         max_length=10,
     )
 
+    @instrumented("handler_seconds", "verification_submit")
     async def on_submit(self, interaction: discord.Interaction):
         member = interaction.user
         guild = interaction.guild
 
+        # Acknowledge right away; everything below can take longer than
+        # Discord's 3-second interaction deadline during join waves.
+        defer_error = await verification_stats.timed("defer", interaction.response.defer(ephemeral=True, thinking=True))
+        if defer_error is not None:
+            print(f"Could not acknowledge verification from {member} ({member.id}): {defer_error}")
+
         # Save player ID
         pid = self.player_id.value.strip()
         player_ids[str(member.id)] = pid
-        save_json(PLAYER_IDS_FILE, player_ids)
+        state.mark_dirty("player_ids", str(member.id))
 
         # Alliance role
         alliance_input = self.alliance.value.strip().upper()
-        alliance_key = CONFIG["alliance_name_to_role_key"].get(alliance_input)
         alliance_role = None
-        if alliance_key:
-            rid = CONFIG["roles"].get(alliance_key)
-            if rid:
-                alliance_role = guild.get_role(rid)
+        rid = cfg.alliance_role_by_name.get(alliance_input)
+        if rid:
+            alliance_role = guild.get_role(rid)
 
         rank = self.rank.value.strip().upper()
 
         # Language role
         lang_input = self.main_language.value.strip().lower()
         target_role = None
-        language_name_to_id = {
-            "english": 1439732594693509131,
-            "polish": 1439733053550497915,
-            "french": 1439733487195394148,
-            "bosnian": 1439733731534311604,
-            "portuguese (brazil)": 1439734067955499160,
-            "portuguese (portugal)": 1439734590632759336,
-            "persian": 1439734720610177198,
-            "arabic": 1439735048554418227,
-            "german": 1439735171061645507,
-            "russian": 1439737062575181966,
-            "korean": 1439737330263916696,
-            "thai": 1439737843445530644,
-            "turkish": 1439737886348939294,
-            "chinese": 1439737951138353202,
-            "spanish": 1439884540331167775,
-        }
-
-        for name, rid in language_name_to_id.items():
+        for name, rid in cfg.language_names:
             if lang_input == name or lang_input.startswith(name.split()[0]):
                 target_role = guild.get_role(rid)
                 break
@@ -366,29 +3916,23 @@ class VerificationModal(discord.ui.Modal, title="PapaMike Server Application"):
             age_role_id = CONFIG["roles"]["age_19plus"]
         age_role = guild.get_role(age_role_id)
 
-        # Apply roles
-        to_add = []
-        if alliance_role:
-            to_add.append(alliance_role)
-        if target_role:
-            to_add.append(target_role)
-        if age_role:
-            to_add.append(age_role)
-
-        if to_add:
-            try:
-                await member.add_roles(*to_add, reason="Verified via application form")
-            except Exception as e:
-                print(f"Error adding roles during verification: {e}")
+        # Apply roles: one member edit instead of add_roles + remove_roles
+        to_add = [r for r in (alliance_role, target_role, age_role) if r and r not in member.roles]
+        pending_role = guild.get_role(CONFIG["roles"]["pending"])
+        remove_pending = pending_role is not None and pending_role in member.roles
 
-        # Remove Pending Verification
-        pending_role_id = CONFIG["roles"]["pending"]
-        pending_role = guild.get_role(pending_role_id)
-        if pending_role in member.roles:
+        async def apply_roles():
+            if not to_add and not remove_pending:
+                return
+            roles = [r for r in member.roles if not r.is_default() and r != pending_role] + to_add
             try:
-                await member.remove_roles(pending_role, reason="Verification complete")
-            except Exception as e:
-                print(f"Error removing pending role: {e}")
+                await member.edit(roles=roles, reason="Verified via application form")
+            except discord.HTTPException:
+                # e.g. a managed role in the list; fall back to targeted calls
+                if to_add:
+                    await member.add_roles(*to_add, reason="Verified via application form")
+                if remove_pending:
+                    await member.remove_roles(pending_role, reason="Verification complete")
 
         # Log application
         review_channel = guild.get_channel(CONFIG["channels"]["review_inbox"])
@@ -407,25 +3951,43 @@ class VerificationModal(discord.ui.Modal, title="PapaMike Server Application"):
         embed.add_field(name="Language", value=self.main_language.value, inline=True)
         embed.add_field(name="Age Group", value=self.age_group.value, inline=True)
 
+        steps = {"roles": apply_roles()}
         if review_channel:
-            await review_channel.send(embed=embed)
+            steps["review_inbox"] = review_channel.send(embed=embed)
         if app_log_channel:
-            await app_log_channel.send(embed=embed)
+            steps["application_log"] = app_log_channel.send(embed=embed)
 
         # Welcome message
         welcome_channel_id = CONFIG["channels"].get("welcome_channel") or 0
         if welcome_channel_id:
             wc = guild.get_channel(welcome_channel_id)
             if wc:
-                await wc.send(
+                steps["welcome"] = wc.send(
                     f"Welcome {member.mention}! ✅ Your application has been recorded.\n"
                     f"Alliance: **{self.alliance.value}**, Rank: **{rank}**, Server: **{self.server_number.value}**."
                 )
 
-        await interaction.response.send_message(
-            "Thank you! ✅ Your application has been submitted and your roles have been updated.",
-            ephemeral=True,
-        )
+        # The role edit and the three posts are independent; run them together.
+        results = await asyncio.gather(*(verification_stats.timed(name, coro) for name, coro in steps.items()))
+        errors = {name: err for name, err in zip(steps, results) if err is not None}
+
+        if errors:
+            details = "; ".join(f"{name}: {type(err).__name__}: {err}" for name, err in errors.items())
+            print(f"Verification for {member} ({member.id}) had failures: {details}")
+            await log_to(
+                CONFIG["channels"]["bot_errors"],
+                f"⚠ Verification for {member} ({member.id}) — failed steps: {details}"
+            )
+
+        if "roles" in errors:
+            text = (
+                "Thank you! ✅ Your application has been submitted, but your roles could not be updated. "
+                "An admin has been notified."
+            )
+        else:
+            text = "Thank you! ✅ Your application has been submitted and your roles have been updated."
+        if defer_error is None:
+            await interaction.followup.send(text, ephemeral=True)
 
 class VerifyView(discord.ui.View):
     """Persistent view with a button to start the verification modal."""
@@ -458,34 +4020,206 @@ class VerifyView(discord.ui.View):
                     ephemeral=True,
                 )
 
+# ------------- BLACKJACK UI -------------
+
+BLACKJACK_RANKS = ("A", "2", "3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K")
+BLACKJACK_HAND_RE = re.compile(r"Hand #(\d+)")
+
+
+def draw_card() -> int:
+    return random.randint(1, 13)
+
+
+def hand_value(cards: List[int]) -> int:
+    total = 0
+    aces = 0
+    for c in cards:
+        if c >= 10:
+            total += 10
+        elif c == 1:
+            total += 11
+            aces += 1
+        else:
+            total += c
+    while total > 21 and aces > 0:
+        total -= 10
+        aces -= 1
+    return total
+
+
+def format_hand(cards: List[int]) -> str:
+    return ", ".join(BLACKJACK_RANKS[c - 1] for c in cards)
+
+
+def finish_blackjack(session: BlackjackSession) -> str:
+    """Play out the dealer's hand and return the result line."""
+    p_val = hand_value(session.player)
+    if p_val > 21:
+        return "You busted. Dealer wins."
+    while hand_value(session.dealer) < 17:
+        session.dealer.append(draw_card())
+    d_val = hand_value(session.dealer)
+    if d_val > 21:
+        return "Dealer busted. You win! 🎉"
+    if p_val > d_val:
+        return "You win! 🎉"
+    if p_val < d_val:
+        return "Dealer wins."
+    return "It's a tie."
+
+
+def render_blackjack(session: BlackjackSession, result: Optional[str] = None) -> str:
+    # The hand number is how the persistent buttons find the session again.
+    lines = [
+        f"🃏 **Blackjack** · Hand #{session.session_id}",
+        f"Your hand: {format_hand(session.player)} (total {hand_value(session.player)})",
+    ]
+    if result is None:
+        lines.append(f"Dealer shows: {format_hand(session.dealer[:1])}, ?")
+        lines.append("Hit or stand?")
+    else:
+        lines.append(f"Dealer hand: {format_hand(session.dealer)} (total {hand_value(session.dealer)})")
+        lines.append(result)
+    return "\n".join(lines)
+
+
+class BlackjackView(discord.ui.View):
+    """Persistent Hit/Stand buttons shared by every blackjack hand."""
+    def __init__(self):
+        super().__init__(timeout=None)
+
+    async def _session(self, interaction: discord.Interaction) -> Optional[BlackjackSession]:
+        match = BLACKJACK_HAND_RE.search(interaction.message.content if interaction.message else "")
+        session = games.get(int(match.group(1)), interaction.user.id) if match else None
+        if not isinstance(session, BlackjackSession):
+            await interaction.response.edit_message(
+                content="⌛ This hand has expired. Start a new one with `/blackjack`.", view=None
+            )
+            return None
+        return session
+
+    async def _finish(self, interaction: discord.Interaction, session: BlackjackSession):
+        result = finish_blackjack(session)
+        games.end(session)
+        await interaction.response.edit_message(content=render_blackjack(session, result), view=None)
+
+    @discord.ui.button(label="Hit", style=discord.ButtonStyle.primary, custom_id="papamike:blackjack_hit")
+    async def hit(self, interaction: discord.Interaction, button: discord.ui.Button):
+        session = await self._session(interaction)
+        if session is None:
+            return
+        session.player.append(draw_card())
+        if hand_value(session.player) >= 21:
+            await self._finish(interaction, session)
+            return
+        games.touch(session)
+        await interaction.response.edit_message(content=render_blackjack(session), view=self)
+
+    @discord.ui.button(label="Stand", style=discord.ButtonStyle.secondary, custom_id="papamike:blackjack_stand")
+    async def stand(self, interaction: discord.Interaction, button: discord.ui.Button):
+        session = await self._session(interaction)
+        if session is None:
+            return
+        await self._finish(interaction, session)
+
 # ------------- EVENTS -------------
 
-@bot.event
-async def on_ready():
-    ensure_data_files()
-    global player_ids, last_seen, participation
-    player_ids = load_json(PLAYER_IDS_FILE)
-    last_seen = load_json(LAST_SEEN_FILE)
-    participation = load_json(PARTICIPATION_FILE)
+BOOT_STARTED = time.monotonic()
+ready_count = 0
+# long-running tasks started by setup_hook; the loop only keeps weak references
+background_tasks: List[asyncio.Task] = []
+first_ready_at: Optional[datetime.datetime] = None
 
-    # persistent view for verification button
-    bot.add_view(VerifyView())
+def command_tree_hash() -> str:
+    payload = [cmd.to_dict() for cmd in bot.tree.get_commands()]
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
 
+
+async def sync_commands_if_changed():
+    # Global sync is a rate-limited REST call; skip it when nothing changed.
+    digest = command_tree_hash()
+    if await state.store.run(state.store.get_meta, "command_tree_hash") == digest:
+        print("Application commands unchanged; skipping sync.")
+        return
     try:
         synced = await bot.tree.sync()
+        await state.store.run(state.store.set_meta, "command_tree_hash", digest)
         print(f"Synced {len(synced)} application commands.")
     except Exception as e:
         print(f"Error syncing commands: {e}")
 
-    if not utc_arena_reminder.is_running():
-        utc_arena_reminder.start()
-    if not inactivity_check.is_running():
-        inactivity_check.start()
 
-    print(f"Logged in as {bot.user} (ID: {bot.user.id})")
+async def resume_after_ready():
+    await bot.wait_until_ready()
+    # Pick up gift code runs a restart interrupted (journal skips finished IDs).
+    await resume_gift_code_runs()
+
+
+@bot.event
+async def setup_hook():
+    # Runs once per process, before the gateway connects. on_ready can fire
+    # again after every reconnect, so nothing in here belongs there.
+    global player_ids, last_seen, participation
+    await state.open()
+    player_ids = state.tables["player_ids"]
+    last_seen = state.tables["last_seen"]
+    participation = state.tables["participation"]
+    activity_stats.attach(state.tables["activity"])
+    inactivity_index.load(last_seen, time.time())
+    await history_backfill.load()
+
+    # persistent views: verification button, blackjack Hit/Stand
+    bot.add_view(VerifyView())
+    bot.add_view(BlackjackView())
+
+    await sync_commands_if_changed()
+
+    utc_arena_reminder.start()
+    inactivity_check.start()
+    state_flush_loop.start()
+    state_backup.start()
+    config_watcher.start()
+    game_session_sweeper.start()
+    background_tasks.append(asyncio.create_task(resume_after_ready()))
+
+    if metrics.enabled:
+        instrument_http(bot)
+        background_tasks.append(asyncio.create_task(
+            monitor_event_loop_lag(CONFIG["metrics"]["loop_lag_interval_seconds"])
+        ))
+        if CONFIG["metrics"]["prometheus_port"]:
+            await start_metrics_server(CONFIG["metrics"]["prometheus_host"], CONFIG["metrics"]["prometheus_port"])
+
+@bot.event
+async def on_ready():
+    global ready_count, first_ready_at
+    ready_count += 1
+    if ready_count == 1:
+        first_ready_at = discord.utils.utcnow()
+        print(f"Logged in as {bot.user} (ID: {bot.user.id}) — first ready after {time.monotonic() - BOOT_STARTED:.1f}s")
+    else:
+        print(f"Gateway ready again (reconnect #{ready_count - 1}).")
+
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    started = interaction.extras.get("started")
+    if started is not None:
+        metrics.observe("command_seconds", command.qualified_name, time.perf_counter() - started)
+
+@bot.event
+async def on_socket_event_type(event_type: str):
+    gateway_stats.record(event_type)
 
 @bot.event
+@instrumented("handler_seconds", "on_member_join")
 async def on_member_join(member: discord.Member):
+    # Start the inactivity clock
+    uid = str(member.id)
+    if not member.bot and uid not in last_seen:
+        last_seen[uid] = datetime.datetime.utcnow().isoformat()
+        state.mark_dirty("last_seen", uid)
+        inactivity_index.touch(member.id, time.time())
+
     # Assign Pending Verification
     pending_role_id = CONFIG["roles"]["pending"]
     pending_role = member.guild.get_role(pending_role_id)
@@ -517,11 +4251,12 @@ async def on_member_join(member: discord.Member):
                 print(f"Error sending verify message: {e}")
 
 @bot.event
+@instrumented("handler_seconds", "on_member_remove")
 async def on_member_remove(member: discord.Member):
     uid = str(member.id)
     if uid in player_ids:
         removed_id = player_ids.pop(uid)
-        save_json(PLAYER_IDS_FILE, player_ids)
+        state.mark_dirty("player_ids", uid)
         await log_to(
             CONFIG["channels"]["giftcode_log"],
             f"🗑 Removed player ID `{removed_id}` for {member} (left server)."
@@ -533,59 +4268,98 @@ async def on_member_remove(member: discord.Member):
     )
 
 @bot.event
+@instrumented("handler_seconds", "on_message")
 async def on_message(message: discord.Message):
     if message.author.bot or message.guild is None:
         return
 
+    await message_pipeline.run(message)
+    await bot.process_commands(message)
+
+
+@message_pipeline.stage("activity")
+async def track_activity(message: discord.Message):
     now_iso = datetime.datetime.utcnow().isoformat()
     uid = str(message.author.id)
     last_seen[uid] = now_iso
-    save_json(LAST_SEEN_FILE, last_seen)
+    state.mark_dirty("last_seen", uid)
+    inactivity_index.touch(message.author.id, time.time())
+    history_backfill.note_live(message.channel.id, message.id)
 
     # Participation tracking
     participation[uid] = participation.get(uid, 0) + 1
-    save_json(PARTICIPATION_FILE, participation)
+    state.mark_dirty("participation", uid)
+    activity_stats.record(uid)
+    state.mark_dirty("activity", uid)
 
     count = participation[uid]
-    if count in CONFIG["participation_milestones"]:
+    if count in cfg.milestones:
         await log_to(
             CONFIG["channels"]["milestone_feed"],
             f"🎉 {message.author.mention} reached **{count} messages** of participation!"
         )
 
-    # Furnace tracking
-    if message.channel.id == CONFIG["channels"]["furnace_upgrades"]:
-        lvl = furnace_level_from_text(message.content)
-        if lvl:
-            await log_to(
-                CONFIG["channels"]["furnace_upgrades"],
-                f"🔥 Congrats {message.author.mention} on reaching **{lvl}**!"
-            )
 
-    # Auto-translate logging
-    try:
-        important_channels = {CONFIG["channels"]["server_chat"]}
-        for data in CONFIG["alliance_channels"].values():
-            important_channels.add(data["alliance_chat"])
-            important_channels.add(data["leader_chat"])
-
-        if message.channel.id in important_channels:
-            lang = get_user_language_code(message.author)
-            if lang != "en":
-                translated = await translator.translate(message.content, target_lang="en")
-                if translated != message.content:
-                    await log_to(
-                        CONFIG["channels"]["translation_log"],
-                        f"🌐 {message.author} in <#{message.channel.id}> (lang {lang}) → EN: {translated}"
-                    )
-    except Exception as e:
-        print(f"Error in auto-translate section: {e}")
+def apply_backfilled_activity(seen: Dict[str, float], counts: Dict[str, Dict[int, int]]):
+    """Merge one page of backfilled history: newest message time and per-day counts by author."""
+    for uid, ts in seen.items():
+        current = parse_last_seen(last_seen.get(uid))
+        if current is None or ts > current:
+            last_seen[uid] = datetime.datetime.utcfromtimestamp(ts).isoformat()
+            state.mark_dirty("last_seen", uid)
+            inactivity_index.touch(int(uid), ts)
+    for uid, days in counts.items():
+        participation[uid] = participation.get(uid, 0) + sum(days.values())
+        state.mark_dirty("participation", uid)
+        for day, n in days.items():
+            activity_stats.record(uid, day, n)
+        state.mark_dirty("activity", uid)
 
-    await bot.process_commands(message)
+
+@message_pipeline.stage("furnace", channels=lambda c: [c.furnace_channel])
+async def track_furnace(message: discord.Message):
+    lvl = furnace_level_from_text(message.content)
+    if lvl:
+        await log_to(
+            cfg.furnace_channel,
+            f"🔥 Congrats {message.author.mention} on reaching **{lvl}**!"
+        )
+
+
+@message_pipeline.stage("search", channels=lambda c: c.translated_channels,
+                        predicate=lambda m: search_index.enabled and bool(m.content))
+async def index_for_search(message: discord.Message):
+    # Runs before the translate stage; the translation is added when its batch returns.
+    search_index.add(message.id, message.channel.id, message.author.id, message.content)
+
+
+@message_pipeline.stage("translate", channels=lambda c: c.translated_channels)
+async def queue_translation(message: discord.Message):
+    # Batched and queued; never waits on the translation backend
+    lang = get_user_language_code(message.author)
+    if lang != "en" and not translator.prefilter.skip_reason(message.content, "en"):
+        translation_batcher.add(message.channel.id, str(message.author), lang, message.content, message.id)
+
+
+@message_pipeline.stage("broadcast", channels=lambda c: c.broadcast_channels)
+async def queue_broadcast(message: discord.Message):
+    # Posted by the broadcast worker; the announcement itself is already up.
+    if not message.content:
+        return
+    queued = broadcast_queue.submit(functools.partial(
+        broadcaster.broadcast, message.channel, message.content, f"🌐 Translations of {message.jump_url}"
+    ))
+    if not queued:
+        print(f"Broadcast queue is full; dropped the translations of {message.jump_url}.")
+        await log_to(
+            CONFIG["channels"]["bot_errors"],
+            f"⚠ Broadcast queue is full; no translations will be posted for {message.jump_url}.",
+        )
 
 # ------------- TASKS -------------
 
 @tasks.loop(time=datetime.time(hour=23, minute=55, tzinfo=datetime.timezone.utc))
+@instrumented("task_seconds", "utc_arena_reminder")
 async def utc_arena_reminder():
     channel_id = CONFIG["channels"]["server_announcements"]
     channel = bot.get_channel(channel_id)
@@ -595,42 +4369,172 @@ async def utc_arena_reminder():
         except Exception:
             pass
 
-@tasks.loop(hours=24)
-async def inactivity_check():
-    await bot.wait_until_ready()
-    now = datetime.datetime.utcnow()
-    threshold = datetime.timedelta(days=30)
+def is_inactivity_exempt(member: discord.Member) -> bool:
+    if member.bot:
+        return True
+    exempt = cfg.exempt_roles
+    return any(r.id in exempt for r in member.roles)
 
-    for guild in bot.guilds:
+
+async def get_or_fetch_member(guild: discord.Guild, uid: int) -> Optional[discord.Member]:
+    member = guild.get_member(uid)
+    if member is not None or not LEAN_GATEWAY:
+        # with the full member cache a miss means they are not in the guild
+        return member
+    try:
+        return await guild.fetch_member(uid)
+    except discord.NotFound:
+        return None
+
+
+async def iter_guild_members(guild: discord.Guild):
+    if LEAN_GATEWAY:
+        # Stream pages over REST instead of holding the whole guild in the cache.
+        async for member in guild.fetch_members(limit=None):
+            yield member
+    else:
         for member in guild.members:
-            if member.bot:
-                continue
-            admin_role_id = CONFIG["roles"]["admin"]
-            mod_role_id = CONFIG["roles"]["moderator"]
-            if any(r.id in (admin_role_id, mod_role_id) for r in member.roles):
-                continue
+            yield member
+
 
+async def seed_unseen_members():
+    """Start the inactivity clock for members the bot has never seen talk."""
+    now = datetime.datetime.utcnow()
+    ts = now.replace(tzinfo=datetime.timezone.utc).timestamp()
+    for guild in bot.guilds:
+        async for member in iter_guild_members(guild):
             uid = str(member.id)
-            last = last_seen.get(uid)
-            if not last:
-                last_seen[uid] = now.isoformat()
+            if member.bot or uid in last_seen:
                 continue
-            try:
-                last_dt = datetime.datetime.fromisoformat(last)
-            except Exception:
-                last_dt = now
+            last_seen[uid] = now.isoformat()
+            state.mark_dirty("last_seen", uid)
+            inactivity_index.touch(member.id, ts)
 
-            if now - last_dt > threshold:
-                try:
-                    await member.kick(reason="Inactive for 30 days")
-                    await log_to(
-                        CONFIG["channels"]["mod_log"],
-                        f"🦵 Kicked {member} for 30 days of inactivity."
-                    )
-                except Exception:
-                    pass
 
-    save_json(LAST_SEEN_FILE, last_seen)
+async def inactivity_candidates(limit: Optional[int] = None, skip: Optional[Dict[int, float]] = None) -> List[tuple]:
+    """(member, last_seen_ts) for members past the inactivity threshold, oldest first.
+
+    Members whose entry in `skip` matches their current last-seen time are left out.
+    """
+    cutoff = time.time() - CONFIG["inactivity"]["threshold_days"] * 86400
+    candidates = []
+    for ts, uid in inactivity_index.expired(cutoff):
+        if skip is not None and skip.get(uid) == ts:
+            continue
+        members = []
+        for guild in bot.guilds:
+            member = await get_or_fetch_member(guild, uid)
+            if member is not None:
+                members.append(member)
+        if not members:
+            # Left every guild; they are re-indexed if they ever talk again.
+            inactivity_index.discard(uid)
+            continue
+        for member in members:
+            if is_inactivity_exempt(member):
+                inactivity_index.discard(uid)
+                continue
+            candidates.append((member, ts))
+        if limit is not None and len(candidates) >= limit:
+            break
+    return candidates[:limit] if limit is not None else candidates
+
+
+kick_bucket = TokenBucket(CONFIG["inactivity"]["kicks_per_second"], CONFIG["inactivity"]["kick_concurrency"])
+kick_semaphore = asyncio.Semaphore(CONFIG["inactivity"]["kick_concurrency"])
+
+
+async def kick_inactive(member: discord.Member, days: int):
+    async with kick_semaphore:
+        await kick_bucket.acquire()
+        try:
+            await member.kick(reason=f"Inactive for {days} days")
+        except (discord.Forbidden, discord.NotFound) as e:
+            # Cannot be kicked (role above ours) or already gone: stop retrying.
+            print(f"Error kicking {member} for inactivity: {e}")
+            inactivity_index.discard(member.id)
+            return
+        except Exception as e:
+            # Transient (5xx, rate limit, network): stay indexed for the next sweep.
+            print(f"Error kicking {member} for inactivity, will retry next sweep: {e}")
+            return
+        inactivity_index.discard(member.id)
+        await log_to(
+            CONFIG["channels"]["mod_log"],
+            f"🦵 Kicked {member} for {days} days of inactivity."
+        )
+
+
+@tasks.loop(minutes=CONFIG["inactivity"]["sweep_interval_minutes"])
+@instrumented("task_seconds", "inactivity_check")
+async def inactivity_check():
+    await bot.wait_until_ready()
+    settings = CONFIG["inactivity"]
+    days = settings["threshold_days"]
+
+    if inactivity_check.current_loop == 0:
+        # Count what was said while the bot was down before judging anyone.
+        try:
+            await history_backfill.run(bot.guilds, first_ready_at or discord.utils.utcnow(), apply_backfilled_activity)
+        except Exception as e:
+            print(f"History backfill failed, sweeping with live activity only: {e}")
+        await seed_unseen_members()
+
+    dry_run = settings["dry_run"]
+    candidates = await inactivity_candidates(
+        limit=settings["max_kicks_per_sweep"], skip=inactivity_reported if dry_run else None
+    )
+    if not candidates:
+        return
+
+    if dry_run:
+        for member, ts in candidates:
+            seen = datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).strftime("%Y-%m-%d")
+            await log_to(
+                CONFIG["channels"]["mod_log"],
+                f"🧪 (dry run) Would kick {member} — last seen {seen}."
+            )
+            # Report each candidate once per run of the bot, but keep them
+            # indexed so turning dry_run off kicks them on the next sweep.
+            inactivity_reported[member.id] = ts
+        return
+
+    await asyncio.gather(*(kick_inactive(member, days) for member, _ in candidates))
+
+@tasks.loop(seconds=30)
+@instrumented("task_seconds", "config_watcher")
+async def config_watcher():
+    try:
+        if reload_config():
+            print(f"Reloaded config from {CONFIG_FILE}.")
+    except Exception as e:
+        print(f"Error reloading {CONFIG_FILE}, keeping the current config: {e}")
+
+@tasks.loop(seconds=CONFIG["games"]["sweep_interval_seconds"])
+@instrumented("task_seconds", "game_session_sweeper")
+async def game_session_sweeper():
+    games.sweep()
+
+@tasks.loop(seconds=CONFIG["persistence"]["flush_interval_seconds"])
+@instrumented("task_seconds", "state_flush_loop")
+async def state_flush_loop():
+    await state.flush()
+    await history_backfill.flush()
+    await translator.cache.flush()
+
+@tasks.loop(hours=24)
+@instrumented("task_seconds", "state_backup")
+async def state_backup():
+    try:
+        written = await state.export_json()
+        print(f"Exported state backup to {BACKUP_DIR} ({written} bytes).")
+    except Exception as e:
+        print(f"Error exporting state backup: {e}")
+    try:
+        removed = await translator.cache.prune_disk()
+        print(f"Pruned {removed} translation cache rows.")
+    except Exception as e:
+        print(f"Error pruning translation cache: {e}")
 
 # ------------- SLASH COMMANDS -------------
 
@@ -656,15 +4560,44 @@ async def verify_cmd(interaction: discord.Interaction):
 # Gift codes
 
 async def apply_gift_code_to_all_players(code: str, guild: discord.Guild):
-    count = len(player_ids)
+    count = len(set(player_ids.values()))
+    if giftcode_redeemer.endpoint is None:
+        await log_to(
+            CONFIG["channels"]["giftcode_updates"],
+            f"🎁 Gift code `{code}` received for **{count}** registered player IDs."
+        )
+        await log_to(
+            CONFIG["channels"]["giftcode_log"],
+            f"Gift code `{code}` not redeemed: no redemption endpoint is configured (CONFIG['giftcodes']['endpoint_url'])."
+        )
+        return
+
     await log_to(
         CONFIG["channels"]["giftcode_updates"],
-        f"🎁 Gift code `{code}` received. (Stub) Would attempt to apply for **{count}** registered player IDs."
+        f"🎁 Gift code `{code}` received. Redeeming for **{count}** registered player IDs..."
     )
-    await log_to(
-        CONFIG["channels"]["giftcode_log"],
-        f"Gift code `{code}` processing stubbed. You need to implement real HTTP calls if possible."
+    result = await giftcode_redeemer.run(code, CONFIG["channels"]["giftcode_log"])
+    if result is None:
+        await log_to(CONFIG["channels"]["giftcode_log"], f"Gift code `{code}` is already being redeemed.")
+        return
+
+    counts = result["counts"]
+    summary = (
+        f"🎁 Gift code `{code}` done: **{counts['redeemed']}** redeemed, "
+        f"{counts['already_claimed']} already claimed, {counts['invalid_id']} invalid IDs, "
+        f"{counts['error']} errors ({result['processed']} IDs in {result['seconds']}s, {result['per_second']}/s)."
     )
+    if result["aborted"]:
+        summary += f" Stopped early: code is **{result['aborted'].replace('_', ' ')}**."
+    await log_to(CONFIG["channels"]["giftcode_updates"], summary)
+
+
+async def resume_gift_code_runs():
+    if giftcode_redeemer.endpoint is None:
+        return
+    for code in await state.store.run(state.store.giftcode_unfinished):
+        print(f"Resuming interrupted gift code run for {code}.")
+        await apply_gift_code_to_all_players(code, None)
 
 @bot.tree.command(name="addcode", description="Add a new Whiteout Survival gift code.")
 @app_commands.describe(code="The gift code text")
@@ -679,9 +4612,9 @@ async def addcode_cmd(interaction: discord.Interaction, code: str):
 @app_commands.describe(player_id="Your Whiteout Survival player ID")
 async def addplayerid_cmd(interaction: discord.Interaction, player_id: str):
     player_ids[str(interaction.user.id)] = player_id.strip()
-    save_json(PLAYER_IDS_FILE, player_ids)
+    state.mark_dirty("player_ids", str(interaction.user.id))
     await interaction.response.send_message(
-        f"Your player ID `{player_id}` has been saved for automatic gift code claiming (when implemented).",
+        f"Your player ID `{player_id}` has been saved for automatic gift code claiming.",
         ephemeral=True,
     )
 
@@ -689,9 +4622,10 @@ async def addplayerid_cmd(interaction: discord.Interaction, player_id: str):
 
 @bot.tree.command(name="guessnumber", description="Play a guess-the-number game (1-100).")
 async def guessnumber_cmd(interaction: discord.Interaction):
-    import random
-    secret = random.randint(1, 100)
-    guess_games[interaction.user.id] = secret
+    previous = games.find(interaction.user.id, GuessSession)
+    if previous is not None:
+        games.end(previous, finished=False)
+    games.add(GuessSession(interaction.user.id, random.randint(1, 100)))
     await interaction.response.send_message(
         "I've picked a number between 1 and 100. Use `/guess <number>` to try!",
         ephemeral=True,
@@ -700,66 +4634,128 @@ async def guessnumber_cmd(interaction: discord.Interaction):
 @bot.tree.command(name="guess", description="Guess the number for the current game.")
 @app_commands.describe(number="Your guess between 1 and 100")
 async def guess_cmd(interaction: discord.Interaction, number: int):
-    secret = guess_games.get(interaction.user.id)
-    if not secret:
+    session = games.find(interaction.user.id, GuessSession)
+    if session is None:
         await interaction.response.send_message("You don't have an active game. Use `/guessnumber` first.", ephemeral=True)
         return
-    if number < secret:
+    session.guesses += 1
+    if number == session.secret:
+        games.end(session)
+        await interaction.response.send_message(
+            f"🎉 Correct! You guessed the number in {session.guesses} tries!", ephemeral=True
+        )
+        return
+    games.touch(session)
+    if number < session.secret:
         await interaction.response.send_message("Too low! Try again.", ephemeral=True)
-    elif number > secret:
-        await interaction.response.send_message("Too high! Try again.", ephemeral=True)
     else:
-        await interaction.response.send_message("🎉 Correct! You guessed the number!", ephemeral=True)
-        del guess_games[interaction.user.id]
+        await interaction.response.send_message("Too high! Try again.", ephemeral=True)
 
-@bot.tree.command(name="blackjack", description="Play a simple Blackjack game vs the dealer.")
+@bot.tree.command(name="blackjack", description="Play Blackjack vs the dealer with Hit/Stand buttons.")
 async def blackjack_cmd(interaction: discord.Interaction):
-    import random
-
-    def draw_card():
-        ranks = ["A", "2", "3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K"]
-        return random.choice(ranks)
-
-    def hand_value(cards: List[str]) -> int:
-        total = 0
-        aces = 0
-        for c in cards:
-            if c in ["J", "Q", "K"]:
-                total += 10
-            elif c == "A":
-                total += 11
-                aces += 1
-            else:
-                total += int(c)
-        while total > 21 and aces > 0:
-            total -= 10
-            aces -= 1
-        return total
+    session = games.add(BlackjackSession(
+        interaction.user.id, [draw_card(), draw_card()], [draw_card(), draw_card()]
+    ))
+    if hand_value(session.player) == 21:
+        # natural blackjack: nothing to decide
+        result = finish_blackjack(session)
+        games.end(session)
+        await interaction.response.send_message(render_blackjack(session, result), ephemeral=True)
+        return
+    await interaction.response.send_message(render_blackjack(session), view=BlackjackView(), ephemeral=True)
 
-    player = [draw_card(), draw_card()]
-    dealer = [draw_card(), draw_card()]
+# Activity
 
-    p_val = hand_value(player)
-    d_val = hand_value(dealer)
+PERIOD_LABELS = {"day": "today", "week": "the last 7 days", "month": "the last 30 days", "all": "all time"}
+ALLIANCE_CHOICES = [app_commands.Choice(name=name, value=name) for name in CONFIG["alliance_channels"]]
 
-    lines = [
-        f"Your hand: {', '.join(player)} (total {p_val})",
-        f"Dealer hand: {', '.join(dealer)} (total {d_val})",
-    ]
 
-    if p_val > 21 and d_val > 21:
-        lines.append("Both busted. It's a draw.")
-    elif p_val > 21:
-        lines.append("You busted. Dealer wins.")
-    elif d_val > 21:
-        lines.append("Dealer busted. You win! 🎉")
-    elif p_val > d_val:
-        lines.append("You win! 🎉")
-    elif p_val < d_val:
-        lines.append("Dealer wins.")
+# guild id -> (fetched at, compiled config, {role id: {member ids}}), lean gateway mode only
+alliance_members_cache: Dict[int, tuple] = {}
+
+
+def alliance_role(guild: discord.Guild, alliance: str) -> Optional[discord.Role]:
+    rid = cfg.alliance_role_by_name.get(alliance.upper())
+    return guild.get_role(rid) if rid else None
+
+
+async def alliance_member_ids(guild: discord.Guild, alliance: str) -> Optional[set]:
+    role = alliance_role(guild, alliance)
+    if role is None:
+        return None
+    rid = role.id
+    if not LEAN_GATEWAY:
+        return {str(m.id) for m in role.members}
+    # No full member cache: one pass over the member list covers every alliance.
+    cached = alliance_members_cache.get(guild.id)
+    if cached is None or cached[1] is not cfg or time.monotonic() - cached[0] > CONFIG["gateway"]["alliance_cache_seconds"]:
+        alliance_roles = set(cfg.alliance_by_role)
+        by_role: Dict[int, set] = {r: set() for r in alliance_roles}
+        async for member in iter_guild_members(guild):
+            for member_role in member.roles:
+                if member_role.id in alliance_roles:
+                    by_role[member_role.id].add(str(member.id))
+        cached = alliance_members_cache[guild.id] = (time.monotonic(), cfg, by_role)
+    return cached[2].get(rid, set())
+
+
+@bot.tree.command(name="leaderboard", description="Show the most active members.")
+@app_commands.describe(period="Time window", alliance="Only count members of this alliance")
+@app_commands.choices(
+    period=[app_commands.Choice(name=label, value=key) for key, label in PERIOD_LABELS.items()],
+    alliance=ALLIANCE_CHOICES,
+)
+async def leaderboard_cmd(interaction: discord.Interaction, period: str = "week", alliance: Optional[str] = None):
+    async def send(content: str, ephemeral: bool = False, **kwargs):
+        if not interaction.response.is_done():
+            await interaction.response.send_message(content, ephemeral=ephemeral, **kwargs)
+            return
+        if ephemeral:
+            # The public "thinking" placeholder cannot turn ephemeral; replace it.
+            await interaction.delete_original_response()
+        await interaction.followup.send(content, ephemeral=ephemeral, **kwargs)
+
+    allowed = None
+    if alliance:
+        if alliance_role(interaction.guild, alliance) is None:
+            await send(f"No role is configured for alliance **{alliance}**.", ephemeral=True)
+            return
+        if LEAN_GATEWAY:
+            # Alliance membership may need a pass over the member list.
+            await interaction.response.defer(thinking=True)
+        allowed = await alliance_member_ids(interaction.guild, alliance) or set()
+
+    if period == "all":
+        pool = participation.items() if allowed is None else ((uid, participation.get(uid, 0)) for uid in allowed)
+        top = [(uid, n) for uid, n in heapq.nlargest(10, pool, key=lambda x: x[1]) if n]
     else:
-        lines.append("It's a tie.")
+        top = activity_stats.top(period, 10, allowed)
+
+    title = f"🏆 Most active {'in **' + alliance + '** ' if alliance else ''}for {PERIOD_LABELS[period]}"
+    if not top:
+        await send(f"{title}\nNo messages yet.", ephemeral=True)
+        return
+    lines = [title]
+    for i, (uid, n) in enumerate(top, start=1):
+        lines.append(f"**{i}.** <@{uid}> — {n} message{'s' if n != 1 else ''}")
+    await send("\n".join(lines), allowed_mentions=discord.AllowedMentions.none())
 
+
+@bot.tree.command(name="activity", description="Show message activity for you or another member.")
+@app_commands.describe(member="Member to look up (defaults to you)")
+async def activity_cmd(interaction: discord.Interaction, member: Optional[discord.Member] = None):
+    member = member or interaction.user
+    uid = str(member.id)
+    counts = activity_stats.summary(uid)
+    lines = [f"📊 Activity for {member.mention}"]
+    for window in ActivityStats.WINDOWS:
+        rank = activity_stats.rank(uid, window)
+        rank_text = f" (rank #{rank})" if rank else ""
+        lines.append(f"- {PERIOD_LABELS[window].capitalize()}: **{counts[window]}**{rank_text}")
+    lines.append(f"- All time: **{participation.get(uid, 0)}**")
+    alliance = get_alliance_name_from_roles(member)
+    if alliance:
+        lines.append(f"- Alliance: **{alliance}**")
     await interaction.response.send_message("\n".join(lines), ephemeral=True)
 
 # Translate + help
@@ -768,12 +4764,296 @@ async def blackjack_cmd(interaction: discord.Interaction):
 @app_commands.describe(text="The text you want translated")
 async def translate_cmd(interaction: discord.Interaction, text: str):
     lang_code = get_user_language_code(interaction.user)
+    # The backend may rate-limit or retry well past the 3s interaction deadline.
+    await interaction.response.defer(ephemeral=True, thinking=True)
     translated = await translator.translate(text, target_lang=lang_code)
-    await interaction.response.send_message(
+    await interaction.followup.send(
         f"🌐 Translation to your language ({lang_code}):\n{translated}",
         ephemeral=True,
     )
 
+@bot.tree.command(name="broadcast", description="(Admins) Post an announcement with translations into every server language.")
+@app_commands.describe(text="The announcement text", channel="Where to post it (defaults to server announcements)")
+async def broadcast_cmd(interaction: discord.Interaction, text: str, channel: Optional[discord.TextChannel] = None):
+    if not interaction.user.guild_permissions.manage_guild:
+        await interaction.response.send_message("You don't have permission to broadcast announcements.", ephemeral=True)
+        return
+    target = channel or bot.get_channel(CONFIG["channels"]["server_announcements"])
+    if target is None:
+        await interaction.response.send_message("The announcements channel is not configured.", ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    # The original goes out as the content of the first message, with the translations as its embeds.
+    header = text if len(text) <= 2000 else text[:1999] + "…"
+    try:
+        result = await broadcaster.broadcast(target, text, header)
+    except discord.HTTPException as e:
+        await interaction.followup.send(f"⚠ Could not post to {target.mention}: {e}", ephemeral=True)
+        return
+    await interaction.followup.send(
+        f"📢 Posted {result['languages']} translations to {target.mention} in "
+        f"{result['messages']} message(s) ({result['seconds']}s).",
+        ephemeral=True,
+    )
+
+def clip(text: str, limit: int = 150) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+@bot.tree.command(name="search", description="(Admins) Search recent chat and its English translations.")
+@app_commands.describe(
+    query='Words that must all appear; put "exact phrases" in quotes',
+    alliance="Only search this alliance's channels",
+    author="Only messages from this member",
+)
+@app_commands.choices(alliance=ALLIANCE_CHOICES)
+async def search_cmd(interaction: discord.Interaction, query: str, alliance: Optional[str] = None,
+                     author: Optional[discord.User] = None):
+    if not interaction.user.guild_permissions.manage_guild:
+        await interaction.response.send_message("You don't have permission to search chat history.", ephemeral=True)
+        return
+    if not search_index.enabled:
+        await interaction.response.send_message("Chat search is turned off in the config.", ephemeral=True)
+        return
+    channels = None
+    if alliance:
+        data = CONFIG["alliance_channels"].get(alliance, {})
+        channels = frozenset(c for c in (data.get("alliance_chat"), data.get("leader_chat")) if c)
+    results = search_index.search(
+        query, channels, author.id if author else None, limit=CONFIG["search"]["max_results"]
+    )
+    if not results:
+        await interaction.response.send_message(f"🔎 No recent messages match `{clip(query, 100)}`.", ephemeral=True)
+        return
+    lines = [f"🔎 Newest matches for `{clip(query, 100)}`:"]
+    for r in results:
+        created = int(discord.utils.snowflake_time(r["message_id"]).timestamp())
+        url = f"https://discord.com/channels/{interaction.guild_id}/{r['channel_id']}/{r['message_id']}"
+        line = f"- <t:{created}:R> <@{r['author_id']}> in <#{r['channel_id']}>: {clip(r['text'])} ([jump]({url}))"
+        if r["translation"]:
+            line += f"\n  → EN: {clip(r['translation'])}"
+        lines.append(line)
+    await interaction.response.send_message(
+        chunk_lines(lines)[0], ephemeral=True, allowed_mentions=discord.AllowedMentions.none()
+    )
+
+@bot.tree.command(name="reloadconfig", description="(Admins) Reload channel/role IDs from the config file.")
+async def reloadconfig_cmd(interaction: discord.Interaction):
+    if not interaction.user.guild_permissions.manage_guild:
+        await interaction.response.send_message("You don't have permission to reload the config.", ephemeral=True)
+        return
+    global config_mtime
+    config_mtime = None  # force a re-read even if the file looks unchanged
+    try:
+        reload_config()
+    except Exception as e:
+        await interaction.response.send_message(f"⚠ Could not reload `{CONFIG_FILE}`: {e}", ephemeral=True)
+        return
+    await interaction.response.send_message(
+        f"✅ Config reloaded. Translating in **{len(cfg.translated_channels)}** channels, "
+        f"**{len(cfg.language_by_role)}** language roles.",
+        ephemeral=True,
+    )
+
+@bot.tree.command(name="inactive", description="(Admins) Preview members the inactivity sweep would kick.")
+async def inactive_cmd(interaction: discord.Interaction):
+    if not interaction.user.guild_permissions.kick_members:
+        await interaction.response.send_message("You don't have permission to view inactivity candidates.", ephemeral=True)
+        return
+    # Resolving candidates may need member fetches in lean gateway mode.
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    candidates = await inactivity_candidates(limit=25)
+    days = CONFIG["inactivity"]["threshold_days"]
+    if not candidates:
+        await interaction.followup.send(f"Nobody has been inactive for more than {days} days. ✅", ephemeral=True)
+        return
+    indexed = len(inactivity_index.expired(time.time() - days * 86400))
+    lines = [f"🕰 Members inactive for more than {days} days (oldest first):"]
+    for member, ts in candidates:
+        seen = datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).strftime("%Y-%m-%d")
+        lines.append(f"- {member} — last seen {seen}")
+    if indexed > len(candidates):
+        lines.append(f"…and up to {indexed - len(candidates)} more.")
+    mode = "dry run (reporting only)" if CONFIG["inactivity"]["dry_run"] else "kicking"
+    lines.append(f"Sweep mode: **{mode}**, up to {CONFIG['inactivity']['max_kicks_per_sweep']} per run.")
+    bstats = history_backfill.stats()
+    if bstats["channels"]:
+        lines.append(
+            f"History backfill: {bstats['messages']} messages from {bstats['channels']} channels "
+            f"in {bstats['seconds']}s" + ("" if bstats["finished"] else " (still running)") + "."
+        )
+    await interaction.followup.send("\n".join(lines), ephemeral=True)
+
+@bot.tree.command(name="gatewaystats", description="(Admins) Show gateway event rates and memory use.")
+async def gatewaystats_cmd(interaction: discord.Interaction):
+    if not interaction.user.guild_permissions.manage_guild:
+        await interaction.response.send_message("You don't have permission to view gateway stats.", ephemeral=True)
+        return
+    gs = gateway_stats.stats()
+    rss = f"{gs['rss_bytes'] / (1024 * 1024):.1f} MiB" if gs["rss_bytes"] else "unknown"
+    cached_members = sum(len(g.members) for g in bot.guilds)
+    total_members = sum(g.member_count or 0 for g in bot.guilds)
+    lines = [
+        f"🛰 **Gateway** ({'lean' if LEAN_GATEWAY else 'full'} mode, intents value {bot.intents.value})",
+        f"- Memory (RSS): **{rss}**",
+        f"- Cached members: **{cached_members}** of {total_members} · Cached messages: **{len(bot.cached_messages)}**",
+        f"- Events: **{gs['events']}** in {gs['uptime_seconds']}s ({gs['events_per_minute']}/min)",
+    ]
+    for name, n, per_minute in gs["top"]:
+        lines.append(f"  - `{name}`: {n} ({per_minute}/min)")
+    await interaction.response.send_message("\n".join(lines), ephemeral=True)
+
+@bot.tree.command(name="pipelinestats", description="(Admins) Show per-stage timings for message handling and verification.")
+async def pipelinestats_cmd(interaction: discord.Interaction):
+    if not interaction.user.guild_permissions.manage_guild:
+        await interaction.response.send_message("You don't have permission to view pipeline stats.", ephemeral=True)
+        return
+    lines = ["⏱ **Message pipeline**"]
+    for st in message_pipeline.stats():
+        lines.append(
+            f"- `{st['stage']}`: **{st['calls']}** calls, avg **{st['avg_us']} µs**, "
+            f"max **{st['max_us']} µs**, errors **{st['errors']}**"
+        )
+    lines.append("🛂 **Verification steps**")
+    for name, st in verification_stats.stats().items():
+        lines.append(
+            f"- `{name}`: **{st['count']}** runs, avg **{st['avg_ms']} ms**, "
+            f"max **{st['max_ms']} ms**, failures **{st['failures']}**"
+        )
+    await interaction.response.send_message("\n".join(lines), ephemeral=True)
+
+@bot.tree.command(name="cachestats", description="(Admins) Show translation cache, queue and log queue statistics.")
+async def cachestats_cmd(interaction: discord.Interaction):
+    if not interaction.user.guild_permissions.manage_guild:
+        await interaction.response.send_message("You don't have permission to view cache stats.", ephemeral=True)
+        return
+    stats = translator.cache.stats()
+    lines = [
+        "📦 **Translation cache**",
+        f"- Entries: **{stats['entries']}** ({stats['memory_bytes'] / 1024:.0f} KiB of {stats['max_bytes'] / 1024:.0f} KiB)",
+        f"- Hits: **{stats['hits']}** memory, **{stats['disk_hits']}** disk · Misses: **{stats['misses']}**",
+        f"- Hit ratio: **{stats['hit_ratio']:.1%}**",
+        f"- Evictions: **{stats['evictions']}** · Expired: **{stats['expirations']}**",
+    ]
+    tstats = translator.stats()
+    lines += [
+        "🌐 **Translation API**",
+        f"- Requests: **{tstats['requests']}** · Coalesced: **{tstats['coalesced']}** · In flight: **{tstats['inflight']}**",
+        f"- Retried after every backend throttled: **{tstats['throttled']}** · Failures: **{tstats['failures']}**",
+        f"- Rate limiter waits: **{tstats['rate_limit_waits']}** · Hedged requests: **{tstats['hedges']}**",
+        f"- Batched requests: **{tstats['batched_requests']}** · Requests saved by batching: **{tstats['requests_saved']}**",
+    ]
+    for bs in translator.backends.stats():
+        lines.append(
+            f"  - `{bs['name']}` ({bs['state']}, tripped {bs['trips']}×): **{bs['successes']}**/{bs['requests']} ok, "
+            f"failed {bs['failures']}, throttled {bs['throttled']}, slow {bs['slow']}, skipped {bs['skipped']}, "
+            f"hedge wins {bs['hedge_wins']} · p50 {bs['p50_ms']} ms, p99 {bs['p99_ms']} ms"
+        )
+    if translation_workers.enabled:
+        wstats = translation_workers.stats()
+        rstats = await translation_workers.remote_stats()
+        lines += [
+            "🧵 **Translation workers**",
+            f"- Alive: **{wstats['alive']}** / {wstats['workers']} · Restarts: **{wstats['restarts']}**",
+            f"- IPC requests: **{wstats['requests']}** · Failed: **{wstats['failures']}** · "
+            f"Texts translated in-process instead: **{tstats['worker_fallbacks']}**",
+            f"- Worker upstream requests: **{rstats.get('requests', 0)}** · Failures: **{rstats.get('failures', 0)}**",
+            f"- Worker cache: **{rstats.get('entries', 0)}** entries, hit ratio **{rstats['hit_ratio']:.1%}**",
+        ]
+    pstats = translator.prefilter.stats()
+    lines += [
+        "🧹 **Pre-filter**",
+        f"- Upstream calls avoided: **{pstats['avoided']}** (no text: {pstats['no_text']}, "
+        f"trivial: {pstats['trivial']}, already in target language: {pstats['already_target']})",
+    ]
+    if translator.segmenter is not None:
+        sstats = translator.segmenter.stats()
+        lines += [
+            "✂️ **Segment cache**",
+            f"- Messages segmented: **{sstats['texts']}** into **{sstats['segments']}** sentences "
+            f"(avg {sstats['segments_per_text']})",
+        ]
+    bstats = translation_batcher.stats()
+    lines += [
+        "🧺 **Auto-translate batching**",
+        f"- Batches: **{bstats['batches']}** for **{bstats['items']}** messages · Pending: **{bstats['pending']}**",
+        f"- Log lines: **{bstats['log_lines']}**",
+    ]
+    brstats = broadcaster.stats()
+    if brstats["broadcasts"]:
+        lines += [
+            "📢 **Broadcasts**",
+            f"- Broadcasts: **{brstats['broadcasts']}** · Translations: **{brstats['translations']}** · "
+            f"Messages: **{brstats['messages_sent']}** · Avg **{brstats['avg_seconds']}s**",
+        ]
+    brqstats = broadcast_queue.stats()
+    if brqstats["submitted"]:
+        lines.append(
+            f"- Queue: **{brqstats['depth']}** / {brqstats['max_depth']} waiting · Dropped: **{brqstats['dropped']}** · "
+            f"Wait: avg **{brqstats['avg_wait_ms']} ms**, max **{brqstats['max_wait_ms']} ms**"
+        )
+    qstats = translation_queue.stats()
+    lines += [
+        "📥 **Translation queue**",
+        f"- Depth: **{qstats['depth']}** / {qstats['max_depth']} · Processed: **{qstats['processed']}** · Dropped: **{qstats['dropped']}**",
+        f"- Wait: avg **{qstats['avg_wait_ms']} ms**, max **{qstats['max_wait_ms']} ms**",
+    ]
+    lstats = outbound_log.stats()
+    lines += [
+        "📤 **Log queue**",
+        f"- Queued lines: **{lstats['depth']}** · Sent: **{lstats['sent_lines']}** lines in **{lstats['sent_messages']}** messages "
+        f"(**{lstats['sent_lines'] - lstats['sent_messages']}** posts saved)",
+        f"- Dropped: **{lstats['dropped']}** · Send errors: **{lstats['send_errors']}**",
+    ]
+    await interaction.response.send_message("\n".join(lines), ephemeral=True)
+
+def format_latency_rows(metric: str, limit: int = 10) -> List[str]:
+    return [
+        f"- `{label or metric}`: **{hist.count}** calls, p50 **{hist.quantile(0.5) * 1000:.1f} ms**, "
+        f"p99 **{hist.quantile(0.99) * 1000:.1f} ms**, max **{hist.max * 1000:.1f} ms**"
+        for label, hist in metrics.by_metric(metric)[:limit]
+    ]
+
+@bot.tree.command(name="botstats", description="(Admins) Show handler, command and task latencies, loop lag and REST usage.")
+async def botstats_cmd(interaction: discord.Interaction):
+    if not interaction.user.guild_permissions.manage_guild:
+        await interaction.response.send_message("You don't have permission to view bot stats.", ephemeral=True)
+        return
+    if not metrics.enabled:
+        await interaction.response.send_message("Metrics are disabled (`metrics.enabled` in the config).", ephemeral=True)
+        return
+    gauges = metrics_gauges()
+    lines = [f"📈 **Bot stats** (up {gauges['uptime_seconds']:.0f}s, p50/p99 are bucket upper bounds)"]
+    for title, metric in (
+        ("🧩 **Event handlers**", "handler_seconds"),
+        ("⌨️ **Commands**", "command_seconds"),
+        ("🔁 **Tasks**", "task_seconds"),
+    ):
+        rows = format_latency_rows(metric)
+        if rows:
+            lines += [title] + rows
+    errors = sorted(((label, n) for (m, label), n in metrics.counters.items() if m == "command_errors"),
+                    key=lambda item: item[1], reverse=True)
+    if errors:
+        lines.append("- Command errors: " + ", ".join(f"`{label}` {n}" for label, n in errors[:5]))
+    lines.append("⚙️ **Runtime**")
+    lines += format_latency_rows("event_loop_lag_seconds")
+    lines += format_latency_rows("translator_request_seconds")
+    lines.append(f"- Translation cache hit ratio: **{gauges['translation_cache_hit_ratio']:.1%}**")
+    gstats = games.stats()
+    lines.append(
+        f"- Game sessions: **{gstats['active']}** active for {gstats['users']} users · expired **{gstats['expired']}**, "
+        f"evicted **{gstats['evicted_user_cap'] + gstats['evicted_capacity']}** (per-user cap {gstats['evicted_user_cap']})"
+    )
+    lines += format_latency_rows("flush_seconds")
+    rest = metrics.by_metric("rest_request_seconds")
+    if rest:
+        lines.append(f"🌍 **REST calls** ({sum(hist.count for _, hist in rest)} total)")
+        lines += format_latency_rows("rest_request_seconds", limit=5)
+    text = "\n".join(lines)
+    await interaction.response.send_message(text[:2000], ephemeral=True)
+
 @bot.tree.command(name="help_papamike", description="Show help for PapaMike Translator bot.")
 async def help_cmd(interaction: discord.Interaction):
     desc = (
@@ -783,7 +5063,9 @@ async def help_cmd(interaction: discord.Interaction):
         "- Alliance, language and age roles are auto-assigned from your answers.\n\n"
         "🌐 **Translation**\n"
         "- Auto-logs translations of global and alliance chats into English for leaders.\n"
-        "- `/translate <text>` – translate any text into your language.\n\n"
+        "- `/translate <text>` – translate any text into your language.\n"
+        "- `/broadcast <text>` – (admins only) post an announcement with translations into every server language.\n"
+        "- `/search <query> [alliance] [author]` – (admins only) search recent chat and its English translations.\n\n"
         "🎁 **Gift Codes**\n"
         "- `/addplayerid <id>` – register your WOS player ID.\n"
         "- `/addcode <code>` – (admins only) register a new gift code.\n\n"
@@ -792,8 +5074,10 @@ async def help_cmd(interaction: discord.Interaction):
         "🎮 **Games**\n"
         "- `/guessnumber` – start a guess-the-number (1–100) game.\n"
         "- `/guess <number>` – make a guess.\n"
-        "- `/blackjack` – simple blackjack vs dealer.\n\n"
+        "- `/blackjack` – blackjack vs the dealer with Hit/Stand buttons.\n\n"
         "📊 **Participation & Activity**\n"
+        "- `/leaderboard [period] [alliance]` – most active members today, this week, this month or all time.\n"
+        "- `/activity [member]` – message counts and rank for you or another member.\n"
         "- Bot tracks participation milestones and kicks inactive users after 30 days."
     )
     await interaction.response.send_message(desc, ephemeral=True)
@@ -807,11 +5091,29 @@ async def main():
         return
     async with bot:
         await translator.start()
+        translation_workers.start()
+        translation_queue.start()
+        broadcast_queue.start()
         try:
             await bot.start(token)
         finally:
+            for task in background_tasks:
+                task.cancel()
+            await asyncio.gather(*background_tasks, return_exceptions=True)
+            await translation_queue.stop()
+            await broadcast_queue.stop()
+            await outbound_log.close()
+            await giftcode_redeemer.close()
+            await stop_metrics_server()
+            await translation_workers.close()
             await translator.close()
+            await history_backfill.flush()
+            await state.close()
+            print(f"Persistence stats: {state.stats()}")
 
 if __name__ == "__main__":
-    ensure_data_files()
-    asyncio.run(main())
+    if sys.argv[1:2] == ["--translation-worker"]:
+        asyncio.run(serve_translation_worker(sys.argv[2], int(sys.argv[3])))
+    else:
+        ensure_data_files()
+        asyncio.run(main())